@@ -74,12 +74,101 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'integrator.tasks.sync_products',
         'schedule': 600,
     },
+    'cleanup-sync-runs-daily': {
+        'task': 'integrator.tasks.cleanup_sync_runs',
+        'schedule': 24 * 60 * 60,
+    },
 }
 
 # E-shop API
 ESHOP_API_BASE_URL = env.str('ESHOP_API_BASE_URL', 'https://api.fake-eshop.cz/v1')
 ESHOP_API_KEY = env.str('ESHOP_API_KEY', 'symma-secret-token')
 ESHOP_API_RATE_LIMIT = env.int('ESHOP_API_RATE_LIMIT', 5)
+# Requests kept in flight at once; the token bucket still caps the total req/s
+ESHOP_API_CONCURRENCY = env.int('ESHOP_API_CONCURRENCY', 4)
+# AIMD: back off on 429 / rising latency, probe back up to the MAX ceiling
+ESHOP_API_ADAPTIVE_RATE_LIMIT = env.bool('ESHOP_API_ADAPTIVE_RATE_LIMIT', True)
+ESHOP_API_RATE_LIMIT_MIN = env.float('ESHOP_API_RATE_LIMIT_MIN', 0.5)
+ESHOP_API_RATE_LIMIT_MAX = env.float('ESHOP_API_RATE_LIMIT_MAX', ESHOP_API_RATE_LIMIT)
+# redis = one GCRA bucket shared by all workers (falls back to local if Redis is down);
+# local = per-process token bucket
+ESHOP_API_RATE_LIMIT_BACKEND = env.str('ESHOP_API_RATE_LIMIT_BACKEND', 'redis')
+ESHOP_API_RATE_LIMIT_REDIS_URL = env.str('ESHOP_API_RATE_LIMIT_REDIS_URL', CELERY_BROKER_URL)
+# Bulk upsert endpoint (POST /products/batch/); one request per batch
+ESHOP_API_BATCH_ENABLED = env.bool('ESHOP_API_BATCH_ENABLED', False)
+ESHOP_API_BATCH_SIZE = env.int('ESHOP_API_BATCH_SIZE', 100)
+ESHOP_API_BATCH_MAX_BYTES = env.int('ESHOP_API_BATCH_MAX_BYTES', 512 * 1024)
+# Keep-alive connections per worker process (default: the run's requests in flight);
+# sessions are reused across tasks, idle sockets get TCP keep-alive probes
+ESHOP_API_POOL_SIZE = env.int('ESHOP_API_POOL_SIZE', None)
+ESHOP_API_SESSION_REUSE = env.bool('ESHOP_API_SESSION_REUSE', True)
+ESHOP_API_KEEPALIVE_IDLE = env.int('ESHOP_API_KEEPALIVE_IDLE', 60)
+# gzip request bodies of at least N bytes (Content-Encoding: gzip); 0 = off
+ESHOP_API_GZIP_MIN_BYTES = env.int('ESHOP_API_GZIP_MIN_BYTES', 0)
+
+# Sync state is persisted every N successful sends (crash loses at most one chunk)
+SYNC_STATE_CHUNK_SIZE = env.int('SYNC_STATE_CHUNK_SIZE', 500)
+# auto = INSERT ... ON CONFLICT on PostgreSQL, bulk_create/bulk_update elsewhere
+SYNC_STATE_WRITER = env.str('SYNC_STATE_WRITER', 'auto')
+# Stored digests of the catalog's SKUs: in = IN lists of SYNC_STATE_LOOKUP_CHUNK_SIZE,
+# scan = stream the whole table once; auto scans when the SKUs are at least
+# SYNC_STATE_LOOKUP_SCAN_RATIO of the table's rows
+SYNC_STATE_LOOKUP = env.str('SYNC_STATE_LOOKUP', 'auto')
+SYNC_STATE_LOOKUP_CHUNK_SIZE = env.int('SYNC_STATE_LOOKUP_CHUNK_SIZE', 900)
+SYNC_STATE_LOOKUP_SCAN_RATIO = env.float('SYNC_STATE_LOOKUP_SCAN_RATIO', 0.25)
+
+# Skip validate/transform/hash for SKUs whose raw ERP record is byte-identical
+# to the one last synced (compared via a stored raw fingerprint)
+SYNC_SKIP_UNCHANGED_RAW = env.bool('SYNC_SKIP_UNCHANGED_RAW', False)
+
+# Processes for the validate/transform/hash stage (1 = in the task's own process)
+SYNC_PREPARE_WORKERS = env.int('SYNC_PREPARE_WORKERS', 1)
+# Validate/transform whole chunks with NumPy arrays (optional dependency, same results)
+SYNC_COLUMNAR_TRANSFORM = env.bool('SYNC_COLUMNAR_TRANSFORM', False)
+# Duplicate SKUs (last one wins): inline = while preparing, two-pass = SKU index
+# first and duplicates never prepared, spill = two-pass with the index in temp SQLite
+SYNC_DEDUP = env.str('SYNC_DEDUP', 'inline')
+
+# JSON backend for ERP parsing, payload digests and request bodies:
+# auto = orjson, then msgspec, then stdlib json (payload digests do not depend on it)
+SYNC_JSON_BACKEND = env.str('SYNC_JSON_BACKEND', 'auto')
+
+# Where JsonFileSource keeps <file>.sync-state (defaults to the export's directory)
+SYNC_SOURCE_STATE_DIR = env.str('SYNC_SOURCE_STATE_DIR', None)
+# Parse the export from a read-only mmap (records decoded from memoryviews, no text copies)
+SYNC_SOURCE_MMAP = env.bool('SYNC_SOURCE_MMAP', False)
+
+# Split one sync into N hash-partitioned shard tasks (chord); 1 = single task.
+# With the local rate limiter each shard gets 1/N of ESHOP_API_RATE_LIMIT.
+SYNC_SHARDS = env.int('SYNC_SHARDS', 1)
+
+# Single-flight lease for sync_products: expires unless the heartbeat renews it
+# (every TTL/3). A trigger hitting a running sync either asks it for one
+# follow-up run (coalesce) or just reports skipped_overlap (skip).
+SYNC_LEASE_TTL = env.int('SYNC_LEASE_TTL', 300)
+SYNC_OVERLAP = env.str('SYNC_OVERLAP', 'coalesce')
+
+# Every run returns stats['metrics'] (stage wall/CPU times, HTTP latency percentiles,
+# peak RSS); the exporter also ships them out: integrator.metrics.NullExporter,
+# .StatsdExporter or .PrometheusTextfileExporter (node_exporter textfile collector)
+SYNC_METRICS_EXPORTER = env.str('SYNC_METRICS_EXPORTER', 'integrator.metrics.NullExporter')
+SYNC_METRICS_STATSD_HOST = env.str('SYNC_METRICS_STATSD_HOST', 'localhost')
+SYNC_METRICS_STATSD_PORT = env.int('SYNC_METRICS_STATSD_PORT', 8125)
+SYNC_METRICS_STATSD_PREFIX = env.str('SYNC_METRICS_STATSD_PREFIX', 'integrator.sync')
+SYNC_METRICS_PROMETHEUS_FILE = env.str('SYNC_METRICS_PROMETHEUS_FILE', None)
+
+# SyncRun history (admin: Sync runs) older than this is deleted by the daily cleanup task
+SYNC_RUN_RETENTION_DAYS = env.int('SYNC_RUN_RETENTION_DAYS', 90)
+
+# Profile every sync run: '' = off, sample = stack sampling every SYNC_PROFILE_INTERVAL s
+# (cheap enough for a production run), cprofile = deterministic (slow). N > 0 adds a
+# tracemalloc top-N of allocation sites (opt-in: ~3x slower transform, more memory).
+# Artifacts go to SYNC_PROFILE_DIR (default: temp dir).
+# A single run can be profiled with sync_products.delay(profile='sample') instead.
+SYNC_PROFILE = env.str('SYNC_PROFILE', '')
+SYNC_PROFILE_DIR = env.str('SYNC_PROFILE_DIR', None)
+SYNC_PROFILE_INTERVAL = env.float('SYNC_PROFILE_INTERVAL', 0.01)
+SYNC_PROFILE_TRACEMALLOC_TOP = env.int('SYNC_PROFILE_TRACEMALLOC_TOP', 0)
 
 # Sync providers — swap via env or override in dev.py/prod.py
 SYNC_SOURCE_CLASS = env.str('SYNC_SOURCE_CLASS', 'integrator.sources.json_source.JsonFileSource')
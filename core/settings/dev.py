@@ -8,3 +8,6 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',  # noqa: F405
     }
 }
+
+# No Redis needed locally; docker-compose (prod settings) uses the shared limiter
+ESHOP_API_RATE_LIMIT_BACKEND = env.str('ESHOP_API_RATE_LIMIT_BACKEND', 'local')  # noqa: F405
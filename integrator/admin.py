@@ -0,0 +1,23 @@
+from django.contrib import admin
+
+from integrator.models import SyncRun
+
+
+@admin.register(SyncRun)
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'started_at', 'status', 'duration_seconds', 'synced', 'skipped_unchanged', 'skipped_invalid', 'errors',
+        'requests', 'throttled', 'requests_per_second', 'latency_p99_ms', 'rate_limit', 'force', 'shards',
+    )
+    list_filter = ('status', 'force', 'shards', 'started_at')
+    date_hierarchy = 'started_at'
+    search_fields = ('task_id', 'error_message')
+    ordering = ('-started_at',)
+    list_per_page = 100
+
+    def has_add_permission(self, request):
+        # Rows are written by sync_products only
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
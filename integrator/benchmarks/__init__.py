@@ -0,0 +1 @@
+"""Benchmark tooling: catalog generator, local fake e-shop and the sync benchmark run by ``manage.py bench_sync``."""
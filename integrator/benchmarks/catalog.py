@@ -0,0 +1,85 @@
+"""Seeded generator of ``erp_data.json``-shaped catalogs.
+
+The same arguments always give the same records, so two benchmark runs (or
+two commits) parse, validate and send exactly the same data. Records are
+generated and written one at a time; a 5M-row catalog never sits in memory.
+"""
+import random
+
+from integrator import serialization
+
+TITLE_WORDS = (
+    'Kávovar', 'Mlýnek', 'Hrnek', 'Tablety', 'Filtry', 'Konvice', 'Šálek', 'Odvápňovač',
+    'Espresso', 'Automatický', 'Ruční', 'Skleněný', 'Nerezový', 'Mini', 'Profi',
+)
+COLORS = ('černá', 'bílá', 'stříbrná', 'červená', 'modrá')
+WAREHOUSES = ('praha', 'brno', 'ostrava', 'externi')
+
+# The ways a record fails validate_product(), picked uniformly
+INVALID_KINDS = ('null_price', 'text_price', 'negative_price', 'no_stocks')
+
+
+def iter_catalog(size, seed=0, duplicate_rate=0.0, invalid_rate=0.0, change_rate=0.0, revision=0):
+    """Yield ``size`` raw ERP records.
+
+    ``duplicate_rate`` of the rows repeat an earlier SKU with different
+    values (so last-wins matters), ``invalid_rate`` of them are rejected by
+    validate_product(). ``revision`` N changes the price and stock of about
+    ``change_rate`` of the rows compared to revision 0; everything else is
+    identical between revisions.
+    """
+    rng = random.Random(seed)
+    changes = random.Random(f"{seed}:{revision}")
+    skus = 0
+    for _ in range(size):
+        if skus and rng.random() < duplicate_rate:
+            number = rng.randrange(skus)
+        else:
+            number = skus
+            skus += 1
+
+        words = rng.sample(TITLE_WORDS, 2)
+        price = round(rng.uniform(10, 20_000), 2)
+        stocks = {w: rng.randrange(100) for w in rng.sample(WAREHOUSES, rng.randint(1, 3))}
+        color = rng.choice(COLORS) if rng.random() < 0.7 else None
+        invalid = rng.choice(INVALID_KINDS) if rng.random() < invalid_rate else None
+
+        # Separate stream: a revision never shifts the base values above
+        if revision and changes.random() < change_rate:
+            price = round(price * (1 + 0.01 * revision), 2)
+            first = next(iter(stocks))
+            stocks[first] += revision
+
+        record = {
+            'id': f"SKU-{number:07d}",
+            'title': f"{words[0]} {words[1]} {number}",
+            'price_vat_excl': price,
+            'stocks': stocks,
+            'attributes': {'color': color} if color else {},
+        }
+        if invalid == 'null_price':
+            record['price_vat_excl'] = None
+        elif invalid == 'text_price':
+            record['price_vat_excl'] = str(price)
+        elif invalid == 'negative_price':
+            record['price_vat_excl'] = -price
+        elif invalid == 'no_stocks':
+            record['stocks'] = {}
+        yield record
+
+
+def write_catalog(path, size, ndjson=False, **options):
+    """Write iter_catalog(size, **options) to ``path``; returns the number of bytes written."""
+    dumps = serialization.dumps
+    written = 0
+    with open(path, 'wb') as f:
+        if not ndjson:
+            written += f.write(b'[\n')
+        for i, record in enumerate(iter_catalog(size, **options)):
+            if ndjson:
+                written += f.write(dumps(record) + b'\n')
+            else:
+                written += f.write((b',\n' if i else b'') + dumps(record))
+        if not ndjson:
+            written += f.write(b'\n]\n')
+    return written
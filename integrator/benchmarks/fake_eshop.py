@@ -0,0 +1,139 @@
+"""Local stand-in for the e-shop API, served from a background thread.
+
+Implements ``POST /products/``, ``PATCH /products/{sku}/`` and the bulk
+``POST /products/batch/`` endpoint with a configurable per-request latency.
+429 responses come either on every ``throttle_every``-th request or, with
+``max_rate``, whenever more than ``max_rate`` requests arrived within the
+last second (like a real per-client limit). gzip request bodies are
+accepted; ``connections`` counts accepted TCP connections. With
+``keep_products=False`` only the ``stored`` counter is kept, for catalogs
+too large to mirror in memory.
+"""
+import gzip
+import json
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeEshop:
+    def __init__(self, latency=0.0, throttle_every=0, retry_after='0', max_rate=None, keep_products=True):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.max_rate = max_rate
+        self.keep_products = keep_products
+        self.requests = 0
+        self.throttled = 0
+        self.connections = 0
+        self.stored = 0
+        self.products = {}
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _over_limit(self):
+        if self.throttle_every and self.requests % self.throttle_every == 0:
+            return True
+        if self.max_rate:
+            now = time.monotonic()
+            while self._recent and self._recent[0] <= now - 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_rate:
+                return True
+            self._recent.append(now)
+        return False
+
+    def _handler_class(self):
+        eshop = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with eshop._lock:
+                    eshop.connections += 1
+                # Headers and body go out in separate writes; avoid Nagle stalls
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                self._handle()
+
+            def do_PATCH(self):
+                self._handle()
+
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                with eshop._lock:
+                    eshop.requests += 1
+                    throttled = eshop._over_limit()
+                    if throttled:
+                        eshop.throttled += 1
+                if eshop.latency:
+                    time.sleep(eshop.latency)
+                if throttled:
+                    return self._reply(429, {'error': 'rate limited'}, {'Retry-After': eshop.retry_after})
+
+                data = json.loads(body)
+                path = self.path.removeprefix('/v1')
+                if self.command == 'POST' and path == '/products/batch/':
+                    results = [self._store(p) for p in data['products']]
+                    return self._reply(200, {'results': results})
+                if self.command == 'POST' and path == '/products/':
+                    result = self._store(data)
+                    return self._reply(result['status'], result)
+                if self.command == 'PATCH' and path == f"/products/{data['sku']}/":
+                    result = self._store(data)
+                    return self._reply(200, result)
+                return self._reply(404, {'error': 'not found'})
+
+            def _store(self, payload):
+                with eshop._lock:
+                    eshop.stored += 1
+                    if eshop.keep_products:
+                        created = payload['sku'] not in eshop.products
+                        eshop.products[payload['sku']] = payload
+                    else:
+                        created = self.command == 'POST'
+                return {'sku': payload['sku'], 'status': 201 if created else 200}
+
+            def _reply(self, status, data, headers=None):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,145 @@
+"""End-to-end sync benchmark: generated catalog -> SyncOrchestrator -> FakeEshop.
+
+Each size runs three scenarios against one rolled-back database transaction:
+
+- ``initial``: revision 0 of the catalog into an empty state table (all creates)
+- ``rerun``: the same file again with ``force=True`` (parse, hash, compare, send nothing)
+- ``delta``: revision 1, where ``change_rate`` of the products changed
+
+Every scenario reports wall time, products/s, the per-stage wall/CPU
+times and HTTP latency percentiles from the run's own metrics (see
+integrator.metrics), the requests the fake e-shop saw and the peak RSS.
+Each run's metrics reset the peak where the OS allows it (Linux), so it is
+the scenario's own; otherwise it covers the whole process so far, which
+``peak_rss_scope`` says.
+"""
+import os
+import platform
+import tempfile
+import time
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from integrator import serialization
+from integrator.benchmarks.catalog import write_catalog
+from integrator.benchmarks.fake_eshop import FakeEshop
+from integrator.clients.eshop_client import EshopClient
+from integrator.metrics import NullExporter
+from integrator.ratelimit import TokenBucket, build_limiter
+from integrator.sources.json_source import JsonFileSource
+from integrator.sync import SyncOrchestrator
+
+SCENARIOS = ('initial', 'rerun', 'delta')
+
+
+def run_benchmark(size, seed=0, duplicate_rate=0.01, invalid_rate=0.01, change_rate=0.05, ndjson=False,
+                  concurrency=4, rate=None, latency=0.0, max_rate=None, batch=False, scenarios=SCENARIOS,
+                  workdir=None):
+    """Benchmark one catalog size; returns a JSON-serializable dict."""
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        path = Path(tmp) / ('catalog.ndjson' if ndjson else 'catalog.json')
+        options = dict(seed=seed, duplicate_rate=duplicate_rate, invalid_rate=invalid_rate, change_rate=change_rate)
+
+        started = time.perf_counter()
+        file_bytes = write_catalog(path, size, ndjson=ndjson, **options)
+        generate_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in JsonFileSource(path=path).iter_products():
+            pass
+        parse_seconds = time.perf_counter() - started
+
+        results = []
+        with transaction.atomic(), FakeEshop(latency=latency, max_rate=max_rate, keep_products=False) as eshop:
+            for scenario in scenarios:
+                if scenario == 'delta':
+                    write_catalog(path, size, ndjson=ndjson, revision=1, **options)
+                results.append(_run_scenario(scenario, path, eshop, concurrency, rate, batch))
+            transaction.set_rollback(True)
+
+    return {
+        'products': size,
+        'file_bytes': file_bytes,
+        'generate_seconds': round(generate_seconds, 4),
+        'parse_seconds': round(parse_seconds, 4),
+        'parse_records_per_second': round(size / parse_seconds) if parse_seconds else None,
+        'scenarios': results,
+    }
+
+
+def _run_scenario(scenario, path, eshop, concurrency, rate, batch):
+    limiter = build_limiter(rate=rate, backend='local') if rate else TokenBucket(rate=1e9, capacity=1e9)
+    orchestrator = SyncOrchestrator(
+        source=JsonFileSource(path=path), client=EshopClient(base_url=eshop.base_url, batch=batch),
+        limiter=limiter, concurrency=concurrency, exporter=NullExporter(),
+    )
+    requests_before, throttled_before = eshop.requests, eshop.throttled
+
+    started = time.perf_counter()
+    stats = orchestrator.run(force=scenario == 'rerun')
+    total = time.perf_counter() - started
+
+    metrics = stats.pop('metrics')
+    stages = {name: stage['wall_seconds'] for name, stage in metrics['stages'].items()}
+    stages['other'] = round(max(0.0, total - sum(stages.values())), 4)
+    processed = stats['synced'] + stats['skipped_unchanged'] + stats['skipped_invalid'] + stats['errors']
+    return {
+        'scenario': scenario,
+        'seconds': round(total, 4),
+        'cpu_seconds': metrics['cpu_seconds'],
+        'products_per_second': round(processed / total) if total else None,
+        'stages': stages,
+        'stage_metrics': metrics['stages'],
+        'http': metrics['http'],
+        'stats': stats,
+        'requests': eshop.requests - requests_before,
+        'throttled': eshop.throttled - throttled_before,
+        'peak_rss_bytes': metrics['peak_rss_bytes'],
+        'peak_rss_scope': 'scenario' if metrics['peak_rss_scope'] == 'run' else 'process',
+    }
+
+
+def environment():
+    """Machine and configuration the numbers were measured with."""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': connection.vendor,
+        'json_backend': serialization.NAME,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of ``results`` against a previous report, as readable strings.
+
+    Throughput may drop and peak memory may grow by at most ``tolerance``
+    (0.2 = 20 %) per size and scenario. Peaks are only compared when both
+    reports measured them over the same scope.
+    """
+    previous = {
+        (entry['products'], scenario['scenario']): scenario
+        for entry in baseline.get('results', [])
+        for scenario in entry['scenarios']
+    }
+    regressions = []
+    for entry in results:
+        for scenario in entry['scenarios']:
+            old = previous.get((entry['products'], scenario['scenario']))
+            if old is None:
+                continue
+            label = f"{entry['products']} products, {scenario['scenario']}"
+            if old['products_per_second'] and scenario['products_per_second'] is not None \
+                    and scenario['products_per_second'] < old['products_per_second'] * (1 - tolerance):
+                regressions.append(
+                    f"{label}: {scenario['products_per_second']} products/s "
+                    f"(baseline {old['products_per_second']})"
+                )
+            same_scope = old.get('peak_rss_scope', 'process') == scenario.get('peak_rss_scope', 'process')
+            if same_scope and scenario['peak_rss_bytes'] > old['peak_rss_bytes'] * (1 + tolerance):
+                regressions.append(
+                    f"{label}: peak RSS {scenario['peak_rss_bytes'] / 2**20:.1f} MiB "
+                    f"(baseline {old['peak_rss_bytes'] / 2**20:.1f} MiB)"
+                )
+    return regressions
@@ -4,6 +4,24 @@ import requests
 
 
 class BaseClient(ABC):
+    # Shared rate limiter (see integrator.ratelimit); clients report 429s and
+    # response latencies to it so every in-flight request adapts together.
+    # The dispatcher takes the token for the first attempt; a client that
+    # retries must acquire() one before every further attempt.
+    limiter = None
+
+    # integrator.metrics.SyncMetrics of the current run; every HTTP attempt
+    # and retry is reported to it when set
+    metrics = None
+
+    # Requests the orchestrator keeps in flight at once; a client may size its
+    # connection pool to it in make_session()
+    pool_size = None
+
+    # Clients with a bulk endpoint set this and implement send_batch(); the
+    # orchestrator then groups changed payloads automatically.
+    supports_batch = False
+
     @abstractmethod
     def make_session(self) -> requests.Session:
         """Create and configure an HTTP session with auth headers."""
@@ -11,3 +29,11 @@ class BaseClient(ABC):
     @abstractmethod
     def send(self, session, payload, is_update=False):
         """Send a single product payload to the target API."""
+
+    def send_batch(self, session, payloads):
+        """Upsert several payloads in one request.
+
+        Returns ``[(payload, error)]`` in input order, ``error`` being ``None``
+        for items the API accepted.
+        """
+        raise NotImplementedError(f"{type(self).__name__} has no batch endpoint")
@@ -4,6 +4,9 @@ import time
 import requests
 from django.conf import settings
 
+from integrator.serialization import loads, payload_bytes
+
+from . import transport
 from .base import BaseClient
 
 logger = logging.getLogger(__name__)
@@ -14,41 +17,104 @@ ESHOP_API_KEY = getattr(settings, 'ESHOP_API_KEY', 'symma-secret-token')
 MAX_RETRIES = 5
 RETRY_BASE_DELAY = 1.0
 
+BATCH_ENABLED = getattr(settings, 'ESHOP_API_BATCH_ENABLED', False)
+CONCURRENCY = getattr(settings, 'ESHOP_API_CONCURRENCY', 4)
+POOL_SIZE = getattr(settings, 'ESHOP_API_POOL_SIZE', None)
+
 
 class EshopClient(BaseClient):
+    def __init__(self, base_url=None, batch=None):
+        """``base_url`` and ``batch`` default to ESHOP_API_BASE_URL and ESHOP_API_BATCH_ENABLED."""
+        self.base_url = base_url or ESHOP_BASE_URL
+        self.batch = BATCH_ENABLED if batch is None else batch
+
     def make_session(self) -> requests.Session:
-        session = requests.Session()
-        session.headers.update({
+        """Session for this worker process, reused across sync runs.
+
+        The pool holds ESHOP_API_POOL_SIZE keep-alive connections, by default
+        one per request in flight (``pool_size`` set by the orchestrator).
+        """
+        pool_size = POOL_SIZE or self.pool_size or CONCURRENCY
+        headers = {
             'X-Api-Key': ESHOP_API_KEY,
             'Content-Type': 'application/json',
-        })
-        return session
+        }
+        return transport.cached_session(
+            ('eshop', self.base_url, ESHOP_API_KEY, pool_size),
+            lambda: transport.build_session(headers, pool_size),
+        )
+
+    @property
+    def supports_batch(self):
+        return self.batch
 
     def send(self, session, payload, is_update=False):
         sku = payload['sku']
         if is_update:
-            url = f"{ESHOP_BASE_URL}/products/{sku}/"
+            url = f"{self.base_url}/products/{sku}/"
             method = session.patch
         else:
-            url = f"{ESHOP_BASE_URL}/products/"
+            url = f"{self.base_url}/products/"
             method = session.post
 
+        return self._request(method, url, sku, data=payload_bytes(payload))
+
+    def send_batch(self, session, payloads):
+        """Upsert payloads via ``POST /products/batch/``.
+
+        The endpoint answers ``{"results": [{"sku": ..., "status": ..., "error": ...}]}``
+        with one entry per product.
+        """
+        label = f"batch of {len(payloads)}"
+        body = b'{"products":[' + b','.join(payload_bytes(p) for p in payloads) + b']}'
+        response = self._request(session.post, f"{self.base_url}/products/batch/", label, data=body)
+
+        results = {item.get('sku'): item for item in loads(response.content).get('results', [])}
+        outcome = []
+        for payload in payloads:
+            item = results.get(payload['sku'])
+            if item is None:
+                error = requests.exceptions.HTTPError(f"{payload['sku']} missing from batch response")
+            elif item.get('status', 200) >= 400:
+                error = requests.exceptions.HTTPError(
+                    f"{payload['sku']}: {item.get('status')} {item.get('error', '')}".strip()
+                )
+            else:
+                error = None
+            outcome.append((payload, error))
+        return outcome
+
+    def _request(self, method, url, label, data):
+        data, headers = transport.encode_body(data)
         for attempt in range(MAX_RETRIES):
-            response = method(url, json=payload)
+            if attempt and self.limiter is not None:
+                # A retry is a request too; throttled threads must not resend in a burst
+                self.limiter.acquire()
+            started = time.monotonic()
+            response = method(url, data=data, headers=headers)
+            latency = time.monotonic() - started
+            if self.metrics is not None:
+                self.metrics.observe_request(latency, response.status_code)
 
             if response.status_code == 429:
                 retry_after = float(response.headers.get('Retry-After', RETRY_BASE_DELAY))
                 delay = max(retry_after, RETRY_BASE_DELAY * (2 ** attempt))
+                if self.limiter is not None:
+                    self.limiter.on_throttle(retry_after)
                 logger.warning(
                     "Rate limited (429) for %s, attempt %d/%d, waiting %.1fs",
-                    sku, attempt + 1, MAX_RETRIES, delay,
+                    label, attempt + 1, MAX_RETRIES, delay,
                 )
+                if self.metrics is not None:
+                    self.metrics.observe_retry()
                 time.sleep(delay)
                 continue
 
             response.raise_for_status()
+            if self.limiter is not None:
+                self.limiter.on_success(latency)
             return response
 
         raise requests.exceptions.HTTPError(
-            f"Rate limit exceeded after {MAX_RETRIES} retries for {sku}"
+            f"Rate limit exceeded after {MAX_RETRIES} retries for {label}"
         )
@@ -0,0 +1,110 @@
+"""HTTP transport shared by the API clients.
+
+Sessions get a connection pool sized to the request concurrency, TCP
+keep-alive on pooled sockets and a safe retry for connections that died
+while idle. They are cached per worker process, so consecutive Celery tasks
+reuse warm connections instead of repeating TCP and TLS setup.
+"""
+import gzip
+import logging
+import os
+import socket
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_IDLE = getattr(settings, 'ESHOP_API_KEEPALIVE_IDLE', 60)
+SESSION_REUSE = getattr(settings, 'ESHOP_API_SESSION_REUSE', True)
+GZIP_MIN_BYTES = getattr(settings, 'ESHOP_API_GZIP_MIN_BYTES', 0)
+GZIP_LEVEL = 5
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def keepalive_socket_options(idle=KEEPALIVE_IDLE):
+    """urllib3 socket options enabling TCP keep-alive probes after ``idle`` seconds."""
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # Linux names; other platforms keep their system defaults
+    for name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', max(1, idle // 4)), ('TCP_KEEPCNT', 4)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with a fixed-size, blocking pool and keep-alive sockets.
+
+    With ``pool_block`` a thread that finds every connection busy waits for
+    one instead of opening a throwaway connection that is discarded (and its
+    handshake wasted) once the pool is full again.
+    """
+
+    def __init__(self, pool_size, keepalive_idle=KEEPALIVE_IDLE):
+        self.socket_options = keepalive_socket_options(keepalive_idle)
+        # Only failures before the request was sent are retried, so a POST
+        # is never sent twice; this covers sockets the server closed while idle
+        retries = Retry(total=2, connect=2, read=0, status=0, redirect=0, other=0)
+        super().__init__(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retries)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+    def __setstate__(self, state):
+        self.socket_options = keepalive_socket_options()
+        super().__setstate__(state)
+
+
+def build_session(headers, pool_size):
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = PooledAdapter(max(1, int(pool_size)))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def cached_session(key, factory):
+    """Return this process's session for ``key``, creating it with ``factory()``.
+
+    Entries inherited across fork() are dropped (never closed: the sockets
+    belong to the parent) and rebuilt in the child.
+    """
+    if not SESSION_REUSE:
+        return factory()
+    pid = os.getpid()
+    with _sessions_lock:
+        entry = _sessions.get(key)
+        if entry is None or entry[0] != pid:
+            entry = _sessions[key] = (pid, factory())
+            logger.debug("Opened HTTP session %s", key[0])
+        return entry[1]
+
+
+def close_sessions():
+    """Close every cached session owned by this process (e.g. on worker shutdown)."""
+    pid = os.getpid()
+    with _sessions_lock:
+        for owner, session in _sessions.values():
+            if owner == pid:
+                session.close()
+        _sessions.clear()
+
+
+def encode_body(body, min_bytes=None):
+    """Return ``(data, headers)``, gzip-compressing bodies of at least ``min_bytes``.
+
+    ``min_bytes`` defaults to ESHOP_API_GZIP_MIN_BYTES; 0 disables compression.
+    """
+    if min_bytes is None:
+        min_bytes = GZIP_MIN_BYTES
+    if not min_bytes or len(body) < min_bytes:
+        return body, {}
+    return gzip.compress(body, compresslevel=GZIP_LEVEL), {'Content-Encoding': 'gzip'}
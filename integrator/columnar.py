@@ -0,0 +1,214 @@
+"""Columnar (NumPy) variant of the validate/transform stage.
+
+prepare_columns() returns exactly what transforms.prepare_products() returns,
+but validates and transforms a whole chunk with a handful of array
+operations. Building the columns from the parsed dicts is still one Python
+pass; everything after it (VAT, rounding, stock totals, color defaults,
+validation) is vectorized.
+
+NumPy is optional: ``AVAILABLE`` is False without it and callers stay on
+prepare_products().
+"""
+import math
+
+from integrator.transforms import MAX_PRICE, Payload, compute_digests, prepare_products
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+AVAILABLE = np is not None
+
+VAT_RATE = 1.21
+
+# Beyond this, float64 no longer holds every integer and the sums/rounding
+# below stop being exact; such rows take the per-record path
+_EXACT_LIMIT = 2 ** 53
+
+# price_kind values
+_NUMERIC, _NULL, _NON_NUMERIC = 0, 1, 2
+
+# Reason codes in validate_product()'s order of checks
+_OK, _MISSING_SKU, _NULL_PRICE, _NON_NUMERIC_PRICE, _NEGATIVE_PRICE, _PRICE_OUT_OF_RANGE, _BAD_STOCKS = range(7)
+
+_MISSING = object()
+
+
+class ProductColumns:
+    """A chunk of raw ERP records split into per-field columns.
+
+    ``qty``/``qty_row`` hold every numeric stock quantity flattened, with the
+    row it belongs to. ``scalar`` marks rows the vectorized path cannot
+    reproduce exactly; they are prepared record by record instead.
+    """
+
+    def __init__(self, raws):
+        n = len(raws)
+        self.size = n
+        # Filled as plain lists (numpy item assignment is slow) and converted once
+        self.ids = ids = [None] * n
+        self.titles = titles = [None] * n
+        self.prices = prices = [None] * n
+        self.colors = colors = [None] * n
+        price = [0.0] * n
+        price_kind = [_NUMERIC] * n
+        stocks_ok = [False] * n
+        has_color = [False] * n
+        scalar = [False] * n
+        qty = []
+        qty_row = []
+        isfinite = math.isfinite
+        limit = _EXACT_LIMIT
+
+        for i, raw in enumerate(raws):
+            if not isinstance(raw, dict):
+                scalar[i] = True
+                continue
+            ids[i] = raw.get('id', _MISSING)
+            titles[i] = raw.get('title', _MISSING)
+            if ids[i] is _MISSING or titles[i] is _MISSING:
+                scalar[i] = True
+
+            p = prices[i] = raw.get('price_vat_excl')
+            if p is None:
+                price_kind[i] = _NULL
+            elif not isinstance(p, (int, float)):
+                price_kind[i] = _NON_NUMERIC
+            elif abs(p) >= limit or not isfinite(p):
+                scalar[i] = True
+            else:
+                price[i] = p
+
+            stocks = raw.get('stocks')
+            if stocks and isinstance(stocks, dict):
+                stocks_ok[i] = True
+                for q in stocks.values():
+                    if isinstance(q, (int, float)):
+                        if abs(q) >= limit or not isfinite(q):
+                            scalar[i] = True
+                        else:
+                            qty.append(q)
+                            qty_row.append(i)
+
+            attributes = raw.get('attributes')
+            if isinstance(attributes, dict) and 'color' in attributes:
+                has_color[i] = True
+                colors[i] = attributes['color']
+
+        self.price = np.array(price, dtype=np.float64)
+        self.price_kind = np.array(price_kind, dtype=np.int8)
+        self.stocks_ok = np.array(stocks_ok, dtype=bool)
+        self.has_color = np.array(has_color, dtype=bool)
+        self.scalar = np.array(scalar, dtype=bool)
+        self.qty = np.array(qty, dtype=np.float64)
+        self.qty_row = np.array(qty_row, dtype=np.intp)
+
+
+def validate_columns(cols):
+    """Vectorized validate_product(): returns ``(valid_mask, reasons)``.
+
+    ``reasons[i]`` is None for valid rows and validate_product()'s message
+    otherwise.
+    """
+    sku_ok = _objects(cols.ids, cols.size).astype(bool)
+    code = np.select(
+        [
+            ~sku_ok,
+            cols.price_kind == _NULL,
+            cols.price_kind == _NON_NUMERIC,
+            cols.price < 0,
+            cols.price >= MAX_PRICE,
+            ~cols.stocks_ok,
+        ],
+        [_MISSING_SKU, _NULL_PRICE, _NON_NUMERIC_PRICE, _NEGATIVE_PRICE, _PRICE_OUT_OF_RANGE, _BAD_STOCKS],
+        default=_OK,
+    )
+    valid = code == _OK
+
+    reasons = [None] * cols.size
+    for i in np.flatnonzero(~valid).tolist():
+        reasons[i] = _reason(code[i], cols.ids[i], cols.prices[i])
+    return valid, reasons
+
+
+def _objects(values, size):
+    # np.array() would try to broadcast nested lists into extra dimensions
+    return np.fromiter(values, dtype=object, count=size)
+
+
+def _reason(code, sku, price):
+    if code == _MISSING_SKU:
+        return "missing SKU"
+    if code == _NULL_PRICE:
+        return f"{sku}: null price"
+    if code == _NON_NUMERIC_PRICE:
+        return f"{sku}: non-numeric price"
+    if code == _NEGATIVE_PRICE:
+        return f"{sku}: negative price ({price})"
+    if code == _PRICE_OUT_OF_RANGE:
+        return f"{sku}: price out of range ({price})"
+    return f"{sku}: missing or invalid stocks"
+
+
+def round_half_even_cents(values):
+    """``[round(v, 2) for v in values]``, bit for bit, as an array.
+
+    Away from a half cent, ``rint(v * 100) / 100`` lands on the same double
+    as Python's correctly rounded round(). Values whose scaled form sits
+    within float error of .5 (and values too large for exact cents) are
+    re-rounded with round() itself.
+    """
+    scaled = values * 100
+    result = np.rint(scaled) / 100
+    magnitude = np.abs(scaled)
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) <= np.maximum(1e-9, magnitude * 1e-12)
+    for i in np.flatnonzero(near_half | (magnitude >= _EXACT_LIMIT)).tolist():
+        result[i] = round(float(values[i]), 2)
+    return result
+
+
+def transform_columns(cols, valid):
+    """Vectorized transform_product() for the rows in ``valid``; returns payload dicts."""
+    prices = round_half_even_cents(cols.price * VAT_RATE)
+
+    whole = np.trunc(cols.qty)
+    stock = np.bincount(cols.qty_row, weights=whole, minlength=cols.size)
+    # Exact as long as every partial sum stays an exact float64 integer
+    overflow = np.bincount(cols.qty_row, weights=np.abs(whole), minlength=cols.size) >= _EXACT_LIMIT
+    stock = stock.astype(np.int64)
+
+    colors = np.where(cols.has_color, _objects(cols.colors, cols.size), 'N/A')
+
+    rows = np.flatnonzero(valid & ~overflow)
+    prices = prices[rows].tolist()
+    stock = stock[rows].tolist()
+    colors = colors[rows].tolist()
+    payloads = {
+        i: Payload(sku=cols.ids[i], title=cols.titles[i], price=price, stock=total, color=color)
+        for i, price, total, color in zip(rows.tolist(), prices, stock, colors)
+    }
+    return payloads, np.flatnonzero(valid & overflow).tolist()
+
+
+def prepare_columns(raws):
+    """Drop-in replacement for prepare_products() using the columnar engine."""
+    raws = list(raws)
+    cols = ProductColumns(raws)
+    valid, reasons = validate_columns(cols)
+    payloads, overflow = transform_columns(cols, valid & ~cols.scalar)
+
+    # Rows the array path cannot reproduce exactly go through the scalar code
+    fallback = np.flatnonzero(cols.scalar).tolist() + overflow
+    scalar_results = dict(zip(fallback, prepare_products([raws[i] for i in fallback])))
+
+    digests = iter(compute_digests(payloads.values()))
+    results = []
+    for i in range(cols.size):
+        if i in scalar_results:
+            results.append(scalar_results[i])
+        elif i in payloads:
+            results.append((cols.ids[i], payloads[i], next(digests)))
+        else:
+            results.append((cols.ids[i], None, reasons[i]))
+    return results
@@ -0,0 +1,89 @@
+"""Two-pass "last occurrence wins" deduplication with bounded memory.
+
+The first pass reads only the SKUs and remembers the position of each SKU's
+last occurrence; the second pass re-reads the records and emits the ones at
+a winning position. Nothing but ``sku -> position`` is kept, and with
+``spill=True`` even that lives in a temporary SQLite file, so the catalog
+size is bounded by disk instead of RAM.
+
+Both passes must see the records in the same order (e.g. two reads of an
+unchanged file).
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+from array import array
+from contextlib import closing
+from itertools import islice
+
+from integrator import serialization
+
+logger = logging.getLogger(__name__)
+
+SPILL_BATCH_SIZE = 10_000
+
+
+def iter_last_wins(keys, records, spill=False):
+    """Yield the records of ``records`` that are the last occurrence of their key.
+
+    ``keys`` yields the key of every record, in the same order as
+    ``records``; it is consumed completely before ``records`` is read.
+    Winners come out in file order of their last occurrence.
+    """
+    with closing(winning_positions(keys, spill=spill)) as positions:
+        next_win = next(positions, None)
+        for position, record in enumerate(records):
+            if position == next_win:
+                yield record
+                next_win = next(positions, None)
+
+
+def winning_positions(keys, spill=False):
+    """Yield, in ascending order, the position of the last occurrence of every key."""
+    if spill:
+        return _spilled_positions(keys)
+    return _memory_positions(keys)
+
+
+def _memory_positions(keys):
+    last = {}
+    for position, key in enumerate(keys):
+        last[key] = position
+    # A flat array of ints instead of the dict for the whole second pass
+    positions = array('q', sorted(last.values()))
+    del last
+    yield from positions
+
+
+def _spilled_positions(keys):
+    fd, path = tempfile.mkstemp(prefix='sync-dedup-', suffix='.sqlite3')
+    os.close(fd)
+    db = sqlite3.connect(path)
+    try:
+        db.execute('PRAGMA journal_mode = OFF')
+        db.execute('PRAGMA synchronous = OFF')
+        # No declared type: keys keep their storage class, so 1 and '1' stay distinct
+        db.execute('CREATE TABLE last_seen (sku PRIMARY KEY, position INTEGER NOT NULL) WITHOUT ROWID')
+        rows = ((_spill_key(key), position) for position, key in enumerate(keys))
+        count = 0
+        while batch := list(islice(rows, SPILL_BATCH_SIZE)):
+            db.executemany(
+                'INSERT INTO last_seen VALUES (?, ?) '
+                'ON CONFLICT (sku) DO UPDATE SET position = excluded.position',
+                batch,
+            )
+            count += len(batch)
+        db.commit()
+        logger.debug("Spilled %d dedup keys to %s", count, path)
+        for (position,) in db.execute('SELECT position FROM last_seen ORDER BY position'):
+            yield position
+    finally:
+        db.close()
+        os.unlink(path)
+
+
+def _spill_key(key):
+    # SQLite has no NULL primary keys and no structured values; non-string
+    # keys are stored as their JSON encoding (a BLOB, never equal to TEXT)
+    return key if isinstance(key, str) else serialization.dumps(key)
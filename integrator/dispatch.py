@@ -0,0 +1,92 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from integrator.serialization import payload_bytes
+from integrator.transforms import for_client
+
+logger = logging.getLogger(__name__)
+
+
+def iter_batches(items, max_items, max_bytes, size_of):
+    """Group items into lists of at most ``max_items`` and ~``max_bytes``.
+
+    An item larger than ``max_bytes`` on its own still goes out, alone.
+    """
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        size = size_of(item)
+        if batch and (len(batch) >= max_items or batch_bytes + size > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(item)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def _payload_size(item):
+    return len(payload_bytes(item[0])) + 1
+
+
+class Dispatcher:
+    """Sends payloads through a client with up to ``concurrency`` requests in flight.
+
+    Every request first takes a token from the shared ``limiter`` so the
+    configured req/s holds across all workers. Network latency overlaps with
+    the pacing instead of adding to it. When the client has a bulk endpoint,
+    payloads are grouped and each batch costs a single token.
+    """
+
+    def __init__(self, client, limiter, concurrency=1, batch_size=100, batch_max_bytes=512 * 1024):
+        self.client = client
+        self.limiter = limiter
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = batch_size
+        self.batch_max_bytes = batch_max_bytes
+
+    def dispatch(self, session, items):
+        """Send ``(payload, is_update, context)`` items.
+
+        Yields ``(payload, is_update, context, error)`` in completion order;
+        ``error`` is ``None`` on success. Only a bounded window of requests is
+        submitted ahead of completion, so ``items`` may be a lazy iterable.
+        """
+        if getattr(self.client, 'supports_batch', False):
+            jobs = iter_batches(items, self.batch_size, self.batch_max_bytes, _payload_size)
+            send = self._send_batch
+        else:
+            jobs = ([item] for item in items)
+            send = self._send
+
+        window = self.concurrency * 2
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='eshop-dispatch') as pool:
+            pending = {}
+            for job in jobs:
+                pending[pool.submit(send, session, job)] = job
+                if len(pending) >= window:
+                    yield from self._drain(pending)
+            while pending:
+                yield from self._drain(pending)
+
+    def _send(self, session, job):
+        payload, is_update, _ = job[0]
+        self.limiter.acquire()
+        self.client.send(session, for_client(payload), is_update=is_update)
+        return [None]
+
+    def _send_batch(self, session, job):
+        self.limiter.acquire()
+        results = self.client.send_batch(session, [for_client(payload) for payload, _, _ in job])
+        return [error for _, error in results]
+
+    @staticmethod
+    def _drain(pending):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            job = pending.pop(future)
+            failure = future.exception()
+            errors = [failure] * len(job) if failure is not None else future.result()
+            for (payload, is_update, context), error in zip(job, errors):
+                yield payload, is_update, context, error
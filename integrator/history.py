@@ -0,0 +1,133 @@
+"""SyncRun bookkeeping: one row per ``sync_products`` invocation.
+
+Recording is best effort: a failed history write is logged and never
+changes the outcome of the sync itself.
+"""
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from integrator.metrics import merge_summaries
+from integrator.models import SyncRun
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = getattr(settings, 'SYNC_RUN_RETENTION_DAYS', 90)
+# A run still "running" after this long lost its worker (or its chord callback)
+ABANDONED_AFTER = timedelta(hours=24)
+
+COUNTERS = ('synced', 'skipped_unchanged', 'skipped_invalid', 'errors')
+
+
+def start_run(force=False, shards=1, task_id=None):
+    """Create the ``running`` row; returns its id, or None if it could not be written."""
+    try:
+        return SyncRun.objects.create(
+            started_at=timezone.now(), force=force, shards=shards, task_id=task_id or '',
+        ).pk
+    except DatabaseError:
+        logger.exception("Could not record sync run start")
+        return None
+
+
+def finish_run(run_id, stats):
+    """Store the stats of a completed (or skipped) run."""
+    if run_id is None:
+        return
+    try:
+        run = SyncRun.objects.get(pk=run_id)
+        _apply_stats(run, stats)
+        _close(run, _status(stats))
+    except (DatabaseError, SyncRun.DoesNotExist):
+        logger.exception("Could not record sync run %s", run_id)
+
+
+def fail_run(run_id, exc):
+    if run_id is None:
+        return
+    try:
+        run = SyncRun.objects.get(pk=run_id)
+        run.error_message = f"{type(exc).__name__}: {exc}"
+        _close(run, SyncRun.Status.FAILED)
+    except (DatabaseError, SyncRun.DoesNotExist):
+        logger.exception("Could not record failure of sync run %s", run_id)
+
+
+def cleanup_runs(retention_days=None):
+    """Delete runs (and their profile artifacts) older than the retention period and close abandoned ones.
+
+    Returns ``(deleted, abandoned)``.
+    """
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    now = timezone.now()
+    expired = SyncRun.objects.filter(started_at__lt=now - timedelta(days=retention_days))
+    for artifacts in expired.exclude(profile_artifacts=[]).values_list('profile_artifacts', flat=True):
+        for path in artifacts:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning("Could not remove profile artifact %s", path, exc_info=True)
+    deleted, _ = expired.delete()
+    abandoned = SyncRun.objects.filter(
+        status=SyncRun.Status.RUNNING, started_at__lt=now - ABANDONED_AFTER,
+    ).update(status=SyncRun.Status.ABANDONED)
+    return deleted, abandoned
+
+
+def _close(run, status):
+    run.status = status
+    run.finished_at = timezone.now()
+    run.duration_seconds = round((run.finished_at - run.started_at).total_seconds(), 3)
+    run.save()
+
+
+def _status(stats):
+    if stats.get('skipped_overlap'):
+        return SyncRun.Status.SKIPPED
+    if stats.get('source_unchanged'):
+        return SyncRun.Status.UNCHANGED
+    if stats.get('errors'):
+        return SyncRun.Status.ERRORS
+    return SyncRun.Status.OK
+
+
+def _apply_stats(run, stats):
+    for key in COUNTERS:
+        setattr(run, key, stats.get(key, 0))
+    run.rate_limit = stats.get('rate_limit')
+    run.error_types = stats.get('error_types', {})
+    run.invalid_reasons = stats.get('invalid_reasons', {})
+    run.profile_artifacts = stats.get('profile_artifacts', [])
+
+    # A sharded run carries one summary per shard
+    summaries = stats.get('shard_metrics') or ([stats['metrics']] if 'metrics' in stats else [])
+    if not summaries:
+        return
+    merged = merge_summaries(summaries)
+    run.stages = {
+        name: {key: stage[key] for key in ('wall_seconds', 'cpu_seconds', 'items')}
+        for name, stage in merged['stages'].items()
+    }
+    run.requests = merged['http']['requests']
+    run.throttled = merged['http']['throttled']
+    run.latency_p50_ms = merged['http']['latency_p50_ms']
+    run.latency_p99_ms = merged['http']['latency_p99_ms']
+    # A process-lifetime peak says nothing about this run
+    run.peak_rss_bytes = merged['peak_rss_bytes'] if merged.get('peak_rss_scope') == 'run' else None
+
+    # Shards send side by side, so their rates add up
+    rates = [_send_rate(summary) for summary in summaries]
+    rates = [rate for rate in rates if rate is not None]
+    run.requests_per_second = round(sum(rates), 2) if rates else None
+
+
+def _send_rate(summary):
+    sending = sum(summary['stages'].get(name, {}).get('wall_seconds', 0.0) for name in ('send', 'persist'))
+    requests = summary['http']['requests']
+    return requests / sending if requests and sending else None
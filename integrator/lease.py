@@ -0,0 +1,107 @@
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from integrator.models import SyncLease
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL = getattr(settings, 'SYNC_LEASE_TTL', 300)
+
+
+class Lease:
+    """Single-flight lease on a named job, shared through the database.
+
+    Only one owner holds the lease at a time. The holder keeps it alive with
+    heartbeat(); if the process dies, the lease simply expires after ``ttl``
+    seconds and the next trigger takes over. Triggers that find the lease
+    taken can ask the holder for one follow-up run via request_rerun().
+    """
+
+    def __init__(self, name='sync_products', owner=None, ttl=LEASE_TTL):
+        self.name = name
+        self.owner = owner or uuid.uuid4().hex
+        self.ttl = ttl
+
+    def _expiry(self):
+        return timezone.now() + timedelta(seconds=self.ttl)
+
+    def acquire(self):
+        """Take the lease if it is free, expired or already ours.
+
+        A follow-up run requested from a holder that died is carried over to
+        the new holder, which runs it on release.
+        """
+        now = timezone.now()
+        taken = SyncLease.objects.filter(name=self.name).filter(
+            Q(expires_at__lte=now) | Q(owner=self.owner),
+        ).update(owner=self.owner, expires_at=self._expiry())
+        if taken:
+            return True
+        try:
+            with transaction.atomic():
+                SyncLease.objects.create(name=self.name, owner=self.owner, expires_at=self._expiry())
+        except IntegrityError:
+            return False
+        return True
+
+    def renew(self):
+        """Extend the lease; ``False`` if another owner has taken it over."""
+        return bool(
+            SyncLease.objects.filter(name=self.name, owner=self.owner).update(expires_at=self._expiry())
+        )
+
+    def request_rerun(self, force=False):
+        """Ask the current holder for a follow-up run; ``False`` if nobody holds the lease."""
+        fields = {'rerun': True, 'rerun_force': True} if force else {'rerun': True}
+        return bool(
+            SyncLease.objects.filter(name=self.name, expires_at__gt=timezone.now()).update(**fields)
+        )
+
+    def release(self):
+        """Give the lease up; returns ``(rerun, rerun_force)`` requested meanwhile."""
+        with transaction.atomic():
+            row = (
+                SyncLease.objects.select_for_update()
+                .filter(name=self.name, owner=self.owner)
+                .values_list('rerun', 'rerun_force')
+                .first()
+            )
+            SyncLease.objects.filter(name=self.name, owner=self.owner).delete()
+        return row or (False, False)
+
+    @contextmanager
+    def heartbeat(self, interval=None):
+        """Renew the lease from a background thread while the block runs."""
+        interval = interval or self.ttl / 3
+        stop = threading.Event()
+
+        def beat():
+            try:
+                while not stop.wait(interval):
+                    try:
+                        renewed = self.renew()
+                    except DatabaseError as exc:
+                        # Transient; the lease stays valid until it expires
+                        logger.warning("Could not renew lease %s: %s", self.name, exc)
+                        continue
+                    if not renewed:
+                        logger.warning("Lease %s lost, another run may overlap", self.name)
+                        return
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=beat, name=f"lease-{self.name}", daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
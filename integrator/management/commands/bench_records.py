@@ -0,0 +1,107 @@
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from integrator.serialization import dumps
+from integrator.transforms import Payload, compute_digests, transform_product
+
+KINDS = ('dict', 'slotted')
+ACCESS_SAMPLE = 1000
+ACCESS_ROUNDS = 1000
+
+
+class _DictPayload(dict):
+    """The previous representation: a dict carrying its encoded body."""
+
+    __slots__ = ('body',)
+
+
+def _raw(i):
+    return {
+        "id": f"SKU-{i:07d}", "title": f"Produkt {i}", "price_vat_excl": i % 10_000 + 0.5,
+        "stocks": {"praha": i % 7, "brno": 3}, "attributes": {"color": "černá"},
+    }
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # No procfs: fall back to the peak RSS (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _measure(kind, size, queue):
+    """Build ``size`` prepared products the way SyncOrchestrator keeps them."""
+    before = _rss_bytes()
+    products = {}
+    for i in range(size):
+        payload = transform_product(_raw(i))
+        if kind == 'slotted':
+            payload = Payload(**payload)
+        else:
+            payload = _DictPayload(payload)
+            payload.body = dumps(payload)
+        products[payload['sku']] = (payload, compute_digests((payload,))[0], None)
+    rss = _rss_bytes() - before
+
+    # Cache-hot loop: the cost of the lookups, not of memory latency
+    sample = [entry[0] for entry in list(products.values())[:ACCESS_SAMPLE]]
+    started = time.perf_counter()
+    for _ in range(ACCESS_ROUNDS):
+        if kind == 'slotted':
+            for p in sample:
+                p.sku, p.price, p.stock
+        else:
+            for p in sample:
+                p['sku'], p['price'], p['stock']
+    access = (time.perf_counter() - started) / (len(sample) * ACCESS_ROUNDS * 3)
+
+    queue.put({
+        'kind': kind,
+        'products': size,
+        'rss_bytes': rss,
+        'bytes_per_product': round(rss / size),
+        'field_access_ns': round(access * 1e9, 1),
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare memory per prepared product and field access cost of plain dict payloads "
+        "vs. slotted Payload records. Each variant runs in a fresh process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        results = [self._run(kind, options['products']) for kind in options['kinds']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({'results': results}, indent=2))
+            return
+
+        self.stdout.write(f"{'kind':<8} {'products':>9} {'RSS MiB':>9} {'B/product':>10} {'access ns':>10}")
+        for r in results:
+            self.stdout.write(
+                f"{r['kind']:<8} {r['products']:>9} {r['rss_bytes'] / 2**20:>9.1f} "
+                f"{r['bytes_per_product']:>10} {r['field_access_ns']:>10}"
+            )
+
+    @staticmethod
+    def _run(kind, size):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_measure, args=(kind, size, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        return result
@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from integrator.models import ProductSyncState
+from integrator.persistence import STATE_WRITERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the sync-state writers (bulk_create/bulk_update split vs. native upsert) "
+        "on the configured database. Everything runs inside a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--writers', nargs='+', choices=sorted(STATE_WRITERS), default=sorted(STATE_WRITERS))
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        results = []
+        for size in options['sizes']:
+            for kind in options['writers']:
+                results.append(self._measure(kind, size, options['chunk_size']))
+
+        if options['json']:
+            self.stdout.write(json.dumps({'vendor': connection.vendor, 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f"Database: {connection.vendor}")
+        self.stdout.write(f"{'writer':<8} {'skus':>9} {'insert s':>10} {'update s':>10} {'rows/s (upd)':>13}")
+        for r in results:
+            self.stdout.write(
+                f"{r['writer']:<8} {r['skus']:>9} {r['insert_seconds']:>10.3f} "
+                f"{r['update_seconds']:>10.3f} {r['update_rows_per_second']:>13.0f}"
+            )
+
+    def _measure(self, kind, size, chunk_size):
+        writer_class = STATE_WRITERS[kind]
+        skus = [f"BENCH-{i:08d}" for i in range(size)]
+
+        with transaction.atomic():
+            ProductSyncState.objects.filter(sku__startswith='BENCH-').delete()
+
+            insert_seconds = self._write(writer_class, chunk_size, skus, bytes(16), is_update=False)
+            update_seconds = self._write(writer_class, chunk_size, skus, b'\xff' * 16, is_update=True)
+            written = ProductSyncState.objects.filter(sku__startswith='BENCH-', data_hash=b'\xff' * 16).count()
+            if written != size:
+                raise CommandError(f"{kind} wrote {written} of {size} rows")
+
+            transaction.set_rollback(True)
+
+        return {
+            'writer': kind,
+            'skus': size,
+            'chunk_size': chunk_size,
+            'insert_seconds': round(insert_seconds, 4),
+            'update_seconds': round(update_seconds, 4),
+            'update_rows_per_second': round(size / update_seconds) if update_seconds else None,
+        }
+
+    @staticmethod
+    def _write(writer_class, chunk_size, skus, data_hash, is_update):
+        started = time.perf_counter()
+        with writer_class(chunk_size=chunk_size) as writer:
+            for sku in skus:
+                writer.add(sku, data_hash, is_update=is_update)
+        return time.perf_counter() - started
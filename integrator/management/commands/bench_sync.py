@@ -0,0 +1,92 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from integrator.benchmarks.runner import SCENARIOS, compare, environment, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end sync benchmark on generated catalogs against a local fake e-shop. "
+        "Database writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, nargs='+', default=[10_000])
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--duplicate-rate', type=float, default=0.01)
+        parser.add_argument('--invalid-rate', type=float, default=0.01)
+        parser.add_argument('--change-rate', type=float, default=0.05)
+        parser.add_argument('--ndjson', action='store_true', help="Generate NDJSON instead of a JSON array")
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--rate', type=float, help="Client rate limit in req/s (default: unlimited)")
+        parser.add_argument('--batch', action='store_true', help="Use the bulk endpoint")
+        parser.add_argument('--latency', type=float, default=0.0, help="Fake e-shop latency per request (s)")
+        parser.add_argument('--max-rate', type=float, help="Fake e-shop answers 429 above this many req/s")
+        parser.add_argument('--workdir', help="Directory for the generated catalogs (default: system temp)")
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+        parser.add_argument('--output', help="Also write the JSON report to this file")
+        parser.add_argument('--baseline', help="Fail if worse than this earlier JSON report")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed throughput drop / memory growth vs. the baseline")
+
+    def handle(self, *args, **options):
+        if options['verbosity'] < 2:
+            # Per-product warnings for the generated invalid rows would swamp the report
+            logging.getLogger('integrator').setLevel(logging.ERROR)
+        results = []
+        for size in options['products']:
+            results.append(run_benchmark(
+                size,
+                seed=options['seed'],
+                duplicate_rate=options['duplicate_rate'],
+                invalid_rate=options['invalid_rate'],
+                change_rate=options['change_rate'],
+                ndjson=options['ndjson'],
+                concurrency=options['concurrency'],
+                rate=options['rate'],
+                latency=options['latency'],
+                max_rate=options['max_rate'],
+                batch=options['batch'],
+                scenarios=options['scenarios'],
+                workdir=options['workdir'],
+            ))
+        report = {'environment': environment(), 'options': _report_options(options), 'results': results}
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_table(results)
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                regressions = compare(results, json.load(f), options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against baseline:\n" + "\n".join(regressions))
+
+    def _print_table(self, results):
+        self.stdout.write(
+            f"{'products':>9} {'scenario':<8} {'seconds':>8} {'prod/s':>9} {'requests':>9} "
+            f"{'peak MiB':>9}  stages"
+        )
+        for entry in results:
+            for r in entry['scenarios']:
+                stages = ' '.join(f"{stage}={seconds:.2f}" for stage, seconds in r['stages'].items())
+                self.stdout.write(
+                    f"{entry['products']:>9} {r['scenario']:<8} {r['seconds']:>8.2f} "
+                    f"{r['products_per_second'] or 0:>9} {r['requests']:>9} "
+                    f"{r['peak_rss_bytes'] / 2**20:>9.1f}  {stages}"
+                )
+
+
+def _report_options(options):
+    keys = (
+        'seed', 'duplicate_rate', 'invalid_rate', 'change_rate', 'ndjson', 'concurrency',
+        'rate', 'batch', 'latency', 'max_rate',
+    )
+    return {key: options[key] for key in keys}
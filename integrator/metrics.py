@@ -0,0 +1,327 @@
+"""Instrumentation of a sync run: stage timings, HTTP latencies, peak memory.
+
+SyncMetrics is always on; it only takes timestamps at stage boundaries and
+once per HTTP request, so it costs nothing measurable. Its summary() ends up
+in the stats under ``metrics``. Exporters get the summary after each run
+(after the whole chord for a sharded one); the default NullExporter drops it.
+"""
+import logging
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+EXPORTER = getattr(settings, 'SYNC_METRICS_EXPORTER', 'integrator.metrics.NullExporter')
+STATSD_HOST = getattr(settings, 'SYNC_METRICS_STATSD_HOST', 'localhost')
+STATSD_PORT = getattr(settings, 'SYNC_METRICS_STATSD_PORT', 8125)
+STATSD_PREFIX = getattr(settings, 'SYNC_METRICS_STATSD_PREFIX', 'integrator.sync')
+PROMETHEUS_FILE = getattr(settings, 'SYNC_METRICS_PROMETHEUS_FILE', None)
+
+PERCENTILES = (50, 90, 99)
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    """Restart peak_rss_bytes() from the current RSS; ``False`` where the OS cannot.
+
+    Linux resets the high-water mark through /proc/self/clear_refs; elsewhere
+    the peak stays the process-lifetime one.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+class _Stage:
+    __slots__ = ('wall', 'cpu', 'items', 'calls')
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.items = 0
+        self.calls = 0
+
+
+class SyncMetrics:
+    """Collects the numbers of one sync run.
+
+    Stages are exclusive: while a nested stage runs (e.g. ``persist`` inside
+    ``send``) the outer one is paused, so stage times add up to the run.
+    CPU time is the whole process's, including pool threads. Stages are
+    opened from the orchestrator's thread only; HTTP observations may come
+    from any thread.
+
+    The process's peak RSS is reset on creation, so in a long-lived worker
+    ``peak_rss_bytes`` is this run's peak (``peak_rss_scope`` ``run``). Where
+    the OS cannot reset it, it is the process-lifetime peak (``process``).
+    """
+
+    def __init__(self):
+        self.peak_rss_scope = 'run' if reset_peak_rss() else 'process'
+        self.stages = {}
+        self._stack = []
+        self._lock = threading.Lock()
+        self._latencies = array('d')
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failed = 0
+        self._started = time.perf_counter()
+        self._started_cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name, items=0):
+        self._switch(name)
+        self.add_items(name, items)
+        try:
+            yield
+        finally:
+            self._switch(None)
+
+    def _switch(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self._stack:
+            # Charge the time since the last switch to the innermost stage
+            current, since_wall, since_cpu = self._stack[-1]
+            stage = self._get(current)
+            stage.wall += wall - since_wall
+            stage.cpu += cpu - since_cpu
+        if name is None:
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1] = (self._stack[-1][0], wall, cpu)
+        else:
+            if self._stack:
+                self._stack[-1] = (self._stack[-1][0], wall, cpu)
+            self._stack.append((name, wall, cpu))
+            self._get(name).calls += 1
+
+    def _get(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = _Stage()
+        return stage
+
+    def add_items(self, name, count):
+        if count:
+            self._get(name).items += count
+
+    def observe_request(self, latency, status=None):
+        """Record one HTTP attempt; 429s count as throttled and 5xx/4xx as failed."""
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(latency)
+            if status == 429:
+                self.throttled += 1
+            elif status is not None and status >= 400:
+                self.failed += 1
+
+    def observe_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def summary(self):
+        wall = time.perf_counter() - self._started
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = {
+                'wall_seconds': round(stage.wall, 4),
+                'cpu_seconds': round(stage.cpu, 4),
+                'items': stage.items,
+                'items_per_second': round(stage.items / stage.wall) if stage.items and stage.wall else None,
+            }
+        return {
+            'wall_seconds': round(wall, 4),
+            'cpu_seconds': round(time.process_time() - self._started_cpu, 4),
+            'stages': stages,
+            'http': self._http_summary(),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'peak_rss_scope': self.peak_rss_scope,
+        }
+
+    def _http_summary(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            summary = {
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'failed': self.failed,
+            }
+        for p in PERCENTILES:
+            summary[f'latency_p{p}_ms'] = round(_percentile(latencies, p) * 1000, 2) if latencies else None
+        summary['latency_max_ms'] = round(latencies[-1] * 1000, 2) if latencies else None
+        return summary
+
+
+def merge_summaries(summaries):
+    """Combine the summary() of shards that ran side by side into one.
+
+    Counts, items and stage times add up (stage times become worker time),
+    ``wall_seconds`` is the longest shard's and peak RSS the largest.
+    Percentiles cannot be combined exactly; the slowest shard's value is an
+    upper bound.
+    """
+    if len(summaries) == 1:
+        return summaries[0]
+    stages = {}
+    for summary in summaries:
+        for name, stage in summary['stages'].items():
+            total = stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'items': 0})
+            total['wall_seconds'] = round(total['wall_seconds'] + stage['wall_seconds'], 4)
+            total['cpu_seconds'] = round(total['cpu_seconds'] + stage['cpu_seconds'], 4)
+            total['items'] += stage['items']
+    for stage in stages.values():
+        stage['items_per_second'] = (
+            round(stage['items'] / stage['wall_seconds']) if stage['items'] and stage['wall_seconds'] else None
+        )
+    http = {}
+    for key in summaries[0]['http']:
+        values = [summary['http'][key] for summary in summaries if summary['http'].get(key) is not None]
+        if key.endswith('_ms'):
+            http[key] = max(values, default=None)
+        else:
+            http[key] = sum(values)
+    return {
+        'wall_seconds': max(summary['wall_seconds'] for summary in summaries),
+        'cpu_seconds': round(sum(summary['cpu_seconds'] for summary in summaries), 4),
+        'stages': stages,
+        'http': http,
+        'peak_rss_bytes': max(summary['peak_rss_bytes'] for summary in summaries),
+        'peak_rss_scope': 'run' if all(s.get('peak_rss_scope') == 'run' for s in summaries) else 'process',
+    }
+
+
+def _percentile(ordered, p):
+    # Nearest rank
+    index = max(0, -(-len(ordered) * p // 100) - 1)
+    return ordered[index]
+
+
+class NullExporter:
+    """Default exporter: the metrics stay in the returned stats only."""
+
+    def export(self, summary, stats):
+        pass
+
+
+class StatsdExporter:
+    """Sends the summary to StatsD over UDP: stage times as timers, the rest as gauges and counters."""
+
+    def __init__(self, host=None, port=None, prefix=None):
+        self.address = (host or STATSD_HOST, int(port or STATSD_PORT))
+        self.prefix = prefix or STATSD_PREFIX
+
+    def export(self, summary, stats):
+        lines = [f"{self.prefix}.wall:{summary['wall_seconds'] * 1000:.1f}|ms"]
+        for name, stage in summary['stages'].items():
+            lines.append(f"{self.prefix}.stage.{name}.wall:{stage['wall_seconds'] * 1000:.1f}|ms")
+            lines.append(f"{self.prefix}.stage.{name}.cpu:{stage['cpu_seconds'] * 1000:.1f}|ms")
+            lines.append(f"{self.prefix}.stage.{name}.items:{stage['items']}|c")
+        for key, value in summary['http'].items():
+            if value is not None:
+                # Percentiles are already aggregated; a timer would aggregate them again
+                kind = 'g' if key.endswith('_ms') else 'c'
+                lines.append(f"{self.prefix}.http.{key}:{value}|{kind}")
+        lines.append(f"{self.prefix}.peak_rss_bytes:{summary['peak_rss_bytes']}|g")
+        for key in ('synced', 'skipped_unchanged', 'skipped_invalid', 'errors'):
+            lines.append(f"{self.prefix}.{key}:{stats.get(key, 0)}|c")
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            # Several metrics per datagram, kept under a typical MTU
+            packet = []
+            for line in lines:
+                if packet and sum(len(p) + 1 for p in packet) + len(line) > 1400:
+                    sock.sendto('\n'.join(packet).encode(), self.address)
+                    packet = []
+                packet.append(line)
+            if packet:
+                sock.sendto('\n'.join(packet).encode(), self.address)
+
+
+class PrometheusTextfileExporter:
+    """Writes the last run in Prometheus text format for node_exporter's textfile collector.
+
+    A sync is a short batch job, so there is no endpoint to scrape; the file
+    is replaced atomically after every run. A sharded run is exported once,
+    with the merged numbers, by the chord callback.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or PROMETHEUS_FILE
+        if not self.path:
+            raise ValueError("PrometheusTextfileExporter needs SYNC_METRICS_PROMETHEUS_FILE")
+
+    def export(self, summary, stats):
+        lines = [
+            '# TYPE integrator_sync_wall_seconds gauge',
+            f"integrator_sync_wall_seconds {summary['wall_seconds']}",
+            '# TYPE integrator_sync_cpu_seconds gauge',
+            f"integrator_sync_cpu_seconds {summary['cpu_seconds']}",
+            '# TYPE integrator_sync_stage_wall_seconds gauge',
+        ]
+        stages = summary['stages']
+        lines += [f'integrator_sync_stage_wall_seconds{{stage="{n}"}} {s["wall_seconds"]}' for n, s in stages.items()]
+        lines.append('# TYPE integrator_sync_stage_cpu_seconds gauge')
+        lines += [f'integrator_sync_stage_cpu_seconds{{stage="{n}"}} {s["cpu_seconds"]}' for n, s in stages.items()]
+        lines.append('# TYPE integrator_sync_stage_items gauge')
+        lines += [f'integrator_sync_stage_items{{stage="{n}"}} {s["items"]}' for n, s in stages.items()]
+        lines.append('# TYPE integrator_sync_http gauge')
+        lines += [
+            f'integrator_sync_http{{metric="{key}"}} {value}'
+            for key, value in summary['http'].items() if value is not None
+        ]
+        lines.append('# TYPE integrator_sync_products gauge')
+        lines += [
+            f'integrator_sync_products{{result="{key}"}} {stats.get(key, 0)}'
+            for key in ('synced', 'skipped_unchanged', 'skipped_invalid', 'errors')
+        ]
+        lines += [
+            '# TYPE integrator_sync_peak_rss_bytes gauge',
+            f"integrator_sync_peak_rss_bytes {summary['peak_rss_bytes']}",
+            '# TYPE integrator_sync_last_run_timestamp_seconds gauge',
+            f"integrator_sync_last_run_timestamp_seconds {time.time():.0f}",
+        ]
+
+        # A unique temporary name: concurrent writers never share a half-written file
+        directory, name = os.path.split(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, prefix=f".{name}.",
+                                         delete=False) as f:
+            f.write('\n'.join(lines) + '\n')
+        try:
+            os.chmod(f.name, 0o644)
+            os.replace(f.name, self.path)
+        except OSError:
+            os.unlink(f.name)
+            raise
+
+
+def get_exporter(path=None):
+    return import_string(path or EXPORTER)()
+
+
+def export(exporter, summary, stats):
+    """Hand the run to ``exporter``; a broken exporter never fails the sync."""
+    try:
+        exporter.export(summary, stats)
+    except Exception:
+        logger.exception("Exporting sync metrics with %s failed", type(exporter).__name__)
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+DIGEST_SIZE = 16
+BATCH_SIZE = 2000
+
+
+def hex_to_digest(apps, schema_editor):
+    """Keep the first 16 bytes of the stored SHA-256, which is exactly what
+    compute_digest() produces, so existing products are not re-sent."""
+    ProductSyncState = apps.get_model('integrator', 'ProductSyncState')
+    batch = []
+    for sku, data_hash in ProductSyncState.objects.values_list('sku', 'data_hash').iterator(chunk_size=BATCH_SIZE):
+        try:
+            digest = bytes.fromhex(data_hash)[:DIGEST_SIZE]
+        except ValueError:
+            digest = b''  # unreadable hash: the product is simply re-sent once
+        batch.append(ProductSyncState(sku=sku, digest=digest))
+        if len(batch) >= BATCH_SIZE:
+            ProductSyncState.objects.bulk_update(batch, ['digest'])
+            batch = []
+    if batch:
+        ProductSyncState.objects.bulk_update(batch, ['digest'])
+
+
+def digest_to_hex(apps, schema_editor):
+    ProductSyncState = apps.get_model('integrator', 'ProductSyncState')
+    batch = []
+    for sku, digest in ProductSyncState.objects.values_list('sku', 'digest').iterator(chunk_size=BATCH_SIZE):
+        batch.append(ProductSyncState(sku=sku, data_hash=bytes(digest or b'').hex()))
+        if len(batch) >= BATCH_SIZE:
+            ProductSyncState.objects.bulk_update(batch, ['data_hash'])
+            batch = []
+    if batch:
+        ProductSyncState.objects.bulk_update(batch, ['data_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsyncstate',
+            name='digest',
+            field=models.BinaryField(max_length=16, null=True),
+        ),
+        migrations.RunPython(hex_to_digest, digest_to_hex),
+        migrations.RemoveField(
+            model_name='productsyncstate',
+            name='data_hash',
+        ),
+        migrations.RenameField(
+            model_name='productsyncstate',
+            old_name='digest',
+            new_name='data_hash',
+        ),
+        migrations.AlterField(
+            model_name='productsyncstate',
+            name='data_hash',
+            field=models.BinaryField(help_text='Binární otisk transformovaných dat (16 B)', max_length=16),
+        ),
+    ]
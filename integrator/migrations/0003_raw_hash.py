@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrator', '0002_binary_data_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsyncstate',
+            name='raw_hash',
+            field=models.BinaryField(help_text='Otisk surového ERP záznamu (16 B) pro přeskočení transformace', max_length=16, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrator', '0003_raw_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncLease',
+            fields=[
+                ('name', models.CharField(help_text='Název chráněné úlohy', max_length=100, primary_key=True, serialize=False)),
+                ('owner', models.CharField(help_text='Token běhu, který lease drží', max_length=64)),
+                ('expires_at', models.DateTimeField(help_text='Lease vyprší, pokud ho heartbeat do té doby neprodlouží')),
+                ('rerun', models.BooleanField(default=False, help_text='Během běhu přišel další požadavek na sync')),
+                ('rerun_force', models.BooleanField(default=False, help_text='Navazující běh má být vynucený (force)')),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrator', '0004_sync_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(db_index=True, help_text='Začátek běhu')),
+                ('finished_at', models.DateTimeField(blank=True, help_text='Konec běhu', null=True)),
+                ('duration_seconds', models.FloatField(blank=True, help_text='Délka běhu (s)', null=True)),
+                ('status', models.CharField(choices=[('running', 'Běží'), ('ok', 'OK'), ('errors', 'S chybami'), ('failed', 'Selhal'), ('unchanged', 'Export beze změny'), ('skipped', 'Přeskočen (běží jiný sync)'), ('abandoned', 'Nedokončen')], db_index=True, default='running', help_text='Výsledek běhu', max_length=16)),
+                ('task_id', models.CharField(blank=True, help_text='ID Celery tasku', max_length=64)),
+                ('force', models.BooleanField(default=False, help_text='Vynucený běh (force)')),
+                ('shards', models.PositiveSmallIntegerField(default=1, help_text='Počet shardů')),
+                ('synced', models.PositiveIntegerField(default=0, help_text='Odeslané produkty')),
+                ('skipped_unchanged', models.PositiveIntegerField(default=0, help_text='Produkty beze změny')),
+                ('skipped_invalid', models.PositiveIntegerField(default=0, help_text='Nevalidní produkty')),
+                ('errors', models.PositiveIntegerField(default=0, help_text='Produkty, které se nepodařilo odeslat')),
+                ('requests', models.PositiveIntegerField(default=0, help_text='HTTP požadavky včetně opakování')),
+                ('throttled', models.PositiveIntegerField(default=0, help_text='Odpovědi 429')),
+                ('requests_per_second', models.FloatField(blank=True, help_text='Efektivní req/s během odesílání (fáze send + persist)', null=True)),
+                ('rate_limit', models.FloatField(blank=True, help_text='Rate limit na konci běhu (req/s)', null=True)),
+                ('latency_p50_ms', models.FloatField(blank=True, help_text='Medián latence API (ms)', null=True)),
+                ('latency_p99_ms', models.FloatField(blank=True, help_text='99. percentil latence API (ms)', null=True)),
+                ('peak_rss_bytes', models.BigIntegerField(blank=True, help_text='Peak RSS procesu (B)', null=True)),
+                ('stages', models.JSONField(blank=True, default=dict, help_text='Wall/CPU čas a položky po fázích')),
+                ('error_types', models.JSONField(blank=True, default=dict, help_text='Chyby odeslání podle typu')),
+                ('invalid_reasons', models.JSONField(blank=True, default=dict, help_text='Nevalidní produkty podle důvodu')),
+                ('error_message', models.TextField(blank=True, help_text='Výjimka, pokud běh selhal')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrator', '0005_sync_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncrun',
+            name='profile_artifacts',
+            field=models.JSONField(blank=True, default=list, help_text='Soubory profilu běhu (SYNC_PROFILE / profile=...)'),
+        ),
+    ]
@@ -2,9 +2,75 @@ from django.db import models
 
 
 class ProductSyncState(models.Model):
-    sku = models.CharField(max_length=100, primary_key=True)
-    data_hash = models.CharField(max_length=64)
-    last_synced_at = models.DateTimeField(auto_now=True)
+    sku = models.CharField(max_length=100, primary_key=True, help_text='ID produktu (SKU)')
+    data_hash = models.BinaryField(
+        max_length=16, help_text='Binární otisk transformovaných dat (16 B)',
+    )
+    raw_hash = models.BinaryField(
+        max_length=16, null=True, help_text='Otisk surového ERP záznamu (16 B) pro přeskočení transformace',
+    )
+    last_synced_at = models.DateTimeField(auto_now=True, help_text='Čas poslední úspěšné synchronizace')
 
     def __str__(self):
         return f"{self.sku} ({self.last_synced_at})"
+
+
+class SyncLease(models.Model):
+    name = models.CharField(max_length=100, primary_key=True, help_text='Název chráněné úlohy')
+    owner = models.CharField(max_length=64, help_text='Token běhu, který lease drží')
+    expires_at = models.DateTimeField(help_text='Lease vyprší, pokud ho heartbeat do té doby neprodlouží')
+    rerun = models.BooleanField(default=False, help_text='Během běhu přišel další požadavek na sync')
+    rerun_force = models.BooleanField(default=False, help_text='Navazující běh má být vynucený (force)')
+
+    def __str__(self):
+        return f"{self.name} ({self.owner}, do {self.expires_at})"
+
+
+class SyncRun(models.Model):
+    class Status(models.TextChoices):
+        RUNNING = 'running', 'Běží'
+        OK = 'ok', 'OK'
+        ERRORS = 'errors', 'S chybami'
+        FAILED = 'failed', 'Selhal'
+        UNCHANGED = 'unchanged', 'Export beze změny'
+        SKIPPED = 'skipped', 'Přeskočen (běží jiný sync)'
+        ABANDONED = 'abandoned', 'Nedokončen'
+
+    started_at = models.DateTimeField(db_index=True, help_text='Začátek běhu')
+    finished_at = models.DateTimeField(null=True, blank=True, help_text='Konec běhu')
+    duration_seconds = models.FloatField(null=True, blank=True, help_text='Délka běhu (s)')
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.RUNNING, db_index=True, help_text='Výsledek běhu',
+    )
+    task_id = models.CharField(max_length=64, blank=True, help_text='ID Celery tasku')
+    force = models.BooleanField(default=False, help_text='Vynucený běh (force)')
+    shards = models.PositiveSmallIntegerField(default=1, help_text='Počet shardů')
+
+    synced = models.PositiveIntegerField(default=0, help_text='Odeslané produkty')
+    skipped_unchanged = models.PositiveIntegerField(default=0, help_text='Produkty beze změny')
+    skipped_invalid = models.PositiveIntegerField(default=0, help_text='Nevalidní produkty')
+    errors = models.PositiveIntegerField(default=0, help_text='Produkty, které se nepodařilo odeslat')
+
+    requests = models.PositiveIntegerField(default=0, help_text='HTTP požadavky včetně opakování')
+    throttled = models.PositiveIntegerField(default=0, help_text='Odpovědi 429')
+    requests_per_second = models.FloatField(
+        null=True, blank=True, help_text='Efektivní req/s během odesílání (fáze send + persist)',
+    )
+    rate_limit = models.FloatField(null=True, blank=True, help_text='Rate limit na konci běhu (req/s)')
+    latency_p50_ms = models.FloatField(null=True, blank=True, help_text='Medián latence API (ms)')
+    latency_p99_ms = models.FloatField(null=True, blank=True, help_text='99. percentil latence API (ms)')
+    peak_rss_bytes = models.BigIntegerField(null=True, blank=True, help_text='Peak RSS procesu (B)')
+
+    stages = models.JSONField(default=dict, blank=True, help_text='Wall/CPU čas a položky po fázích')
+    error_types = models.JSONField(default=dict, blank=True, help_text='Chyby odeslání podle typu')
+    invalid_reasons = models.JSONField(default=dict, blank=True, help_text='Nevalidní produkty podle důvodu')
+    error_message = models.TextField(blank=True, help_text='Výjimka, pokud běh selhal')
+    profile_artifacts = models.JSONField(
+        default=list, blank=True, help_text='Soubory profilu běhu (SYNC_PROFILE / profile=...)',
+    )
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.started_at:%Y-%m-%d %H:%M:%S} {self.status}"
@@ -0,0 +1,220 @@
+import logging
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from integrator.models import ProductSyncState
+from integrator.transforms import shard_of
+
+logger = logging.getLogger(__name__)
+
+STATE_WRITER = getattr(settings, 'SYNC_STATE_WRITER', 'auto')
+STATE_FIELDS = ['data_hash', 'raw_hash', 'last_synced_at']
+STATE_READ_CHUNK_SIZE = 5000
+STATE_LOOKUP = getattr(settings, 'SYNC_STATE_LOOKUP', 'auto')
+# Under SQLite's historical limit of 999 variables per statement
+STATE_LOOKUP_CHUNK_SIZE = getattr(settings, 'SYNC_STATE_LOOKUP_CHUNK_SIZE', 900)
+STATE_LOOKUP_SCAN_RATIO = getattr(settings, 'SYNC_STATE_LOOKUP_SCAN_RATIO', 0.25)
+LOOKUP_STRATEGIES = ('auto', 'in', 'scan')
+
+
+class SyncStateWriter:
+    """Persists ProductSyncState for successful sends in bounded chunks.
+
+    Rows are flushed every ``chunk_size`` successful sends instead of once at
+    the end of the run, so a crash loses at most one chunk of progress (those
+    products are re-sent by the next run) and no single INSERT or
+    ``CASE WHEN`` UPDATE grows with the catalog.
+    """
+
+    def __init__(self, chunk_size=500, metrics=None):
+        self.chunk_size = max(1, int(chunk_size))
+        self.metrics = metrics
+        self._to_create = []
+        self._to_update = []
+        self._to_touch = []
+        self.flushes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Keep whatever was sent even if the run is aborting
+        if exc_info[0] is None:
+            self.flush()
+            return
+        try:
+            self.flush()
+        except Exception:
+            # E.g. the DatabaseError the block is exiting with; that one propagates
+            logger.exception("Could not persist %d sync states while aborting", self.pending)
+
+    @property
+    def pending(self):
+        return len(self._to_create) + len(self._to_update) + len(self._to_touch)
+
+    def add(self, sku, data_hash, is_update, raw_hash=None):
+        target = self._to_update if is_update else self._to_create
+        target.append((sku, data_hash, raw_hash))
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    def touch_raw(self, sku, raw_hash):
+        """Record a new raw fingerprint for a product whose payload did not change."""
+        self._to_touch.append((sku, raw_hash))
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        stage = self.metrics.stage('persist', items=self.pending) if self.metrics else nullcontext()
+        with stage, transaction.atomic():
+            self._write(timezone.now())
+            if self._to_touch:
+                ProductSyncState.objects.bulk_update(
+                    [ProductSyncState(sku=sku, raw_hash=raw_hash) for sku, raw_hash in self._to_touch],
+                    ['raw_hash'],
+                    batch_size=self.chunk_size,
+                )
+        logger.debug("Persisted %d sync states", self.pending)
+        self._to_create.clear()
+        self._to_update.clear()
+        self._to_touch.clear()
+        self.flushes += 1
+
+    def _write(self, now):
+        if self._to_create:
+            ProductSyncState.objects.bulk_create(
+                _rows(self._to_create, now), batch_size=self.chunk_size,
+            )
+        if self._to_update:
+            ProductSyncState.objects.bulk_update(
+                _rows(self._to_update, now), STATE_FIELDS, batch_size=self.chunk_size,
+            )
+
+
+class UpsertSyncStateWriter(SyncStateWriter):
+    """Writes each chunk as one ``INSERT ... ON CONFLICT (sku) DO UPDATE``.
+
+    Creates and updates go through the same statement, avoiding the
+    ``CASE WHEN sku = ...`` UPDATE that ``bulk_update`` compiles to.
+    """
+
+    def _write(self, now):
+        ProductSyncState.objects.bulk_create(
+            _rows(self._to_create + self._to_update, now),
+            batch_size=self.chunk_size,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=STATE_FIELDS,
+        )
+
+
+def load_state_hashes(skus=None, with_raw=False, shard=None, strategy=None):
+    """Return ``{sku: digest}`` for already-synced SKUs.
+
+    Reads plain tuples via ``values_list`` instead of model instances, which
+    keeps the per-run SELECT and the resulting dict small. ``skus=None`` reads
+    the whole table (optionally only the ``(index, count)`` shard);
+    ``with_raw`` makes the values ``(digest, raw_digest)``. How a list of
+    ``skus`` is looked up is decided by choose_lookup().
+    """
+    fields = ('sku', 'data_hash', 'raw_hash') if with_raw else ('sku', 'data_hash')
+    if skus is None:
+        rows = _scan(fields)
+    elif not skus:
+        return {}
+    elif choose_lookup(len(skus), strategy) == 'scan':
+        wanted = set(skus)
+        rows = (row for row in _scan(fields) if row[0] in wanted)
+    else:
+        rows = _lookup_in(skus, fields)
+    if shard is not None:
+        rows = (row for row in rows if shard_of(row[0], shard[1]) == shard[0])
+
+    # PostgreSQL hands bytea back as memoryview
+    if with_raw:
+        return {
+            sku: (bytes(data_hash), bytes(raw_hash) if raw_hash is not None else None)
+            for sku, data_hash, raw_hash in rows
+        }
+    return {sku: bytes(data_hash) for sku, data_hash in rows}
+
+
+def choose_lookup(count, strategy=None):
+    """Pick how ``count`` SKUs are looked up: ``in`` or ``scan``.
+
+    ``in`` queries the SKUs in IN lists of STATE_LOOKUP_CHUNK_SIZE, which
+    stays under SQLite's variable limit and keeps each PostgreSQL query
+    cheap to plan. ``scan`` streams the whole table once and keeps the
+    wanted rows, which beats thousands of index probes when the catalog
+    covers a large part of the table. ``auto`` scans from
+    STATE_LOOKUP_SCAN_RATIO of the table's rows on.
+    """
+    strategy = strategy or STATE_LOOKUP
+    if strategy not in LOOKUP_STRATEGIES:
+        raise ValueError(f"Unknown state lookup {strategy!r}, expected one of {LOOKUP_STRATEGIES}")
+    if strategy != 'auto':
+        return strategy
+    if count <= STATE_LOOKUP_CHUNK_SIZE:
+        # One query either way
+        return 'in'
+    rows = estimate_state_rows()
+    chosen = 'scan' if count >= rows * STATE_LOOKUP_SCAN_RATIO else 'in'
+    logger.debug("State lookup for %d SKUs in ~%d rows: %s", count, rows, chosen)
+    return chosen
+
+
+def estimate_state_rows():
+    """Rows in the state table; on PostgreSQL the planner's estimate instead of a COUNT(*)."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                [ProductSyncState._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 until the table was first vacuumed or analyzed
+        if row is not None and row[0] >= 0:
+            return int(row[0])
+    return ProductSyncState.objects.count()
+
+
+def _scan(fields):
+    # A server-side cursor on PostgreSQL: the table is never held as a whole
+    rows = ProductSyncState.objects.values_list(*fields)
+    return rows.iterator(chunk_size=STATE_READ_CHUNK_SIZE)
+
+
+def _lookup_in(skus, fields):
+    queryset = ProductSyncState.objects.values_list(*fields)
+    for start in range(0, len(skus), STATE_LOOKUP_CHUNK_SIZE):
+        yield from queryset.filter(sku__in=skus[start:start + STATE_LOOKUP_CHUNK_SIZE])
+
+
+def _rows(items, now):
+    return [
+        ProductSyncState(sku=sku, data_hash=data_hash, raw_hash=raw_hash, last_synced_at=now)
+        for sku, data_hash, raw_hash in items
+    ]
+
+
+STATE_WRITERS = {
+    'split': SyncStateWriter,
+    'upsert': UpsertSyncStateWriter,
+}
+
+
+def get_state_writer(chunk_size=500, kind=None, metrics=None):
+    """Pick the writer for the current database.
+
+    ``auto`` uses the native upsert on PostgreSQL and keeps the
+    bulk_create/bulk_update split everywhere else (SQLite in dev).
+    """
+    kind = kind or STATE_WRITER
+    if kind == 'auto':
+        kind = 'upsert' if connection.vendor == 'postgresql' else 'split'
+    return STATE_WRITERS[kind](chunk_size=chunk_size, metrics=metrics)
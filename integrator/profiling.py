@@ -0,0 +1,203 @@
+"""Opt-in profiling of a single sync run.
+
+``cprofile`` traces every Python call of the orchestrator's thread: exact
+call counts, but the run gets noticeably slower. ``sample`` instead reads
+the stacks of all threads every SYNC_PROFILE_INTERVAL seconds from a
+background thread, which costs little enough to leave on for one
+production run. Either mode can add a tracemalloc snapshot of the biggest
+allocation sites (SYNC_PROFILE_TRACEMALLOC_TOP > 0). That is a separate
+opt-in: tracemalloc hooks every allocation, which made the transform stage
+about 3x slower and costs memory for every live block.
+
+Artifacts are named after the run (``sync-run-<id>``) and their paths end up
+in ``stats['profile_artifacts']`` and on the SyncRun row.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE = getattr(settings, 'SYNC_PROFILE', '')
+PROFILE_DIR = getattr(settings, 'SYNC_PROFILE_DIR', None)
+INTERVAL = getattr(settings, 'SYNC_PROFILE_INTERVAL', 0.01)
+TRACEMALLOC_TOP = getattr(settings, 'SYNC_PROFILE_TRACEMALLOC_TOP', 0)
+# Frames kept per allocation; each one costs memory for every live block
+TRACEMALLOC_FRAMES = 1
+REPORT_LINES = 40
+
+MODES = ('cprofile', 'sample')
+
+
+def default_directory():
+    return Path(PROFILE_DIR) if PROFILE_DIR else Path(tempfile.gettempdir()) / 'integrator-profiles'
+
+
+class SamplingProfiler:
+    """Counts the folded stacks of all other threads, sampled every ``interval`` seconds.
+
+    A stack is folded into ``thread;outer;...;inner`` (the format flamegraph.pl
+    and speedscope read). Threads waiting on a lock or socket are sampled too,
+    so the profile shows where the run spends wall time, not just CPU.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or INTERVAL
+        self.stacks = Counter()
+        self.ticks = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sync-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[_fold(names.get(ident, str(ident)), frame)] += 1
+            self.ticks += 1
+
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def write_report(self, path, limit=REPORT_LINES):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            # A recursive function counts once per sample
+            for frame in set(frames):
+                total[frame] += count
+        samples = sum(self.stacks.values()) or 1
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"{self.ticks} ticks every {self.interval * 1000:g} ms, {samples} thread samples\n")
+            for title, counts in (('Own samples', own), ('Inclusive samples', total)):
+                f.write(f"\n{title}:\n")
+                for frame, count in counts.most_common(limit):
+                    f.write(f"{count / samples:7.1%} {count:8d}  {frame}\n")
+
+
+def _fold(thread_name, frame):
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name.replace(';', ','))
+    return ';'.join(reversed(frames))
+
+
+class RunProfile:
+    """Context manager profiling the enclosed block and writing its artifacts on exit.
+
+    Call snapshot() where the run holds the most memory; without it the
+    tracemalloc snapshot is taken on exit. A failure to write the artifacts
+    is logged and never fails the sync.
+    """
+
+    def __init__(self, mode, name, directory=None, interval=None, tracemalloc_top=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+        self.name = name
+        self.directory = Path(directory) if directory else default_directory()
+        self.interval = interval
+        self.tracemalloc_top = TRACEMALLOC_TOP if tracemalloc_top is None else tracemalloc_top
+        self.artifacts = []
+        self._profiler = None
+        self._snapshot = None
+        self._traced_peak = None
+        self._owns_tracemalloc = False
+
+    def __enter__(self):
+        if self.tracemalloc_top and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._owns_tracemalloc = True
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = SamplingProfiler(self.interval)
+            self._profiler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.mode == 'cprofile':
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+        if self.tracemalloc_top and tracemalloc.is_tracing():
+            if self._snapshot is None:
+                self.snapshot()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+        try:
+            self._write()
+        except OSError:
+            logger.exception("Could not write profile %s", self.name)
+        else:
+            logger.info("Sync profile written: %s", ', '.join(self.artifacts))
+        return False
+
+    def snapshot(self):
+        """Take the tracemalloc snapshot now (the latest call wins)."""
+        if self.tracemalloc_top and tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot()
+            self._traced_peak = tracemalloc.get_traced_memory()[1]
+
+    def _write(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        base = self.directory / self.name
+        if self.mode == 'cprofile':
+            self._add(f'{base}.pstats', self._profiler.dump_stats)
+            self._add(f'{base}.txt', self._write_pstats_report)
+        else:
+            self._add(f'{base}.folded', self._profiler.write_folded)
+            self._add(f'{base}.txt', self._profiler.write_report)
+        if self._snapshot is not None:
+            self._add(f'{base}.tracemalloc.txt', self._write_tracemalloc_report)
+
+    def _add(self, path, writer):
+        writer(path)
+        self.artifacts.append(path)
+
+    def _write_pstats_report(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            stats = pstats.Stats(self._profiler, stream=f)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_LINES)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(REPORT_LINES)
+
+    def _write_tracemalloc_report(self, path):
+        snapshot = self._snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            # The sampler's own bookkeeping
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ))
+        top = snapshot.statistics('lineno')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"Traced peak {self._traced_peak / 2**20:.1f} MiB, "
+                    f"live at snapshot {sum(s.size for s in top) / 2**20:.1f} MiB\n\n")
+            for stat in top[:self.tracemalloc_top]:
+                f.write(f"{stat.size / 1024:10.1f} KiB {stat.count:9d} blocks  {stat.traceback}\n")
@@ -0,0 +1,321 @@
+import logging
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BACKEND = getattr(settings, 'ESHOP_API_RATE_LIMIT_BACKEND', 'redis')
+REDIS_URL = getattr(settings, 'ESHOP_API_RATE_LIMIT_REDIS_URL', None)
+REDIS_KEY = 'integrator:eshop-rate-limit'
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every in-flight request.
+
+    ``acquire()`` reserves a token and sleeps until it becomes available. The
+    balance may go negative, which queues callers behind each other without
+    busy-waiting, so the aggregate rate never exceeds ``rate`` per second no
+    matter how many threads call in.
+    """
+
+    def __init__(self, rate, capacity=1.0, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._rate = float(rate)
+        self.capacity = float(capacity)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, value):
+        with self._lock:
+            self._refill()
+            self._rate = float(value)
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self._rate)
+
+    def reserve(self):
+        """Take one token and return how long the caller must wait for it."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for at least ``seconds`` (e.g. Retry-After)."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self._rate)
+
+    def on_success(self, latency):
+        pass
+
+    def on_throttle(self, retry_after=None):
+        if retry_after:
+            self.pause(retry_after)
+
+
+# GCRA on Redis' own clock. ARGV: op, default rate, op argument, capacity, ttl,
+# new rate ('' = keep the stored one). Returns {wait, rate} as strings (Lua
+# numbers would be truncated to integers).
+_GCRA_SCRIPT = """
+local key = KEYS[1]
+local op = ARGV[1]
+local capacity = tonumber(ARGV[4])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rate = tonumber(redis.call('HGET', key, 'rate')) or tonumber(ARGV[2])
+if ARGV[6] ~= '' then
+    rate = tonumber(ARGV[6])
+end
+local interval = 1 / rate
+local tat = math.max(tonumber(redis.call('HGET', key, 'tat')) or now, now)
+local wait = 0
+if op == 'reserve' then
+    tat = tat + interval
+    wait = math.max(0, tat - now - capacity * interval)
+elseif op == 'pause' then
+    tat = math.max(tat, now + tonumber(ARGV[3]) + capacity * interval)
+end
+redis.call('HSET', key, 'tat', tostring(tat), 'rate', tostring(rate))
+redis.call('EXPIRE', key, math.ceil(tat - now) + tonumber(ARGV[5]))
+return {tostring(wait), tostring(rate)}
+"""
+
+
+class RedisBucket:
+    """Cluster-wide limiter: GCRA state kept in one Redis key.
+
+    Every reservation runs as a single Lua script against the shared
+    theoretical arrival time, so all workers, shards and overlapping runs
+    together stay at ``rate`` per second. The script uses Redis' clock, so
+    clock skew between nodes does not matter. The rate is stored in the same
+    key, which makes an adaptive decrease on one worker slow down all of them.
+
+    Reservations behave like TokenBucket.reserve(). If Redis is unreachable,
+    the bucket logs a warning and continues on the process-local ``fallback``
+    with ``1/share`` of the rate, as the local backend would, and tries Redis
+    again after a backoff of RETRY_MIN doubling up to RETRY_MAX seconds.
+
+    A rate decrease is written at once; an increase only rides along with
+    the next reservation, so a growing rate costs no extra round trips.
+    """
+
+    RETRY_MIN = 1.0
+    RETRY_MAX = 30.0
+
+    def __init__(self, client, rate, key=REDIS_KEY, capacity=1.0, fallback=None, ttl=60, share=1,
+                 clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.key = key
+        self.capacity = float(capacity)
+        self.ttl = ttl
+        self.share = share
+        self.fallback = fallback or TokenBucket(rate=rate / share, capacity=capacity)
+        self._rate = float(rate)
+        self._pending_rate = None
+        self._script = client.register_script(_GCRA_SCRIPT)
+        self._clock = clock
+        self._retry_at = None
+        self._backoff = 0.0
+
+    @property
+    def rate(self):
+        """The cluster-wide rate (the fallback runs at ``rate / share``)."""
+        return self._rate
+
+    @rate.setter
+    def rate(self, value):
+        value = float(value)
+        if value == self._rate:
+            return
+        increase = value > self._rate
+        self._rate = value
+        self.fallback.rate = value / self.share
+        if increase:
+            self._pending_rate = value
+        else:
+            self._pending_rate = None
+            self._call('rate')
+
+    def _call(self, op, arg=0):
+        """Run the script; ``None`` while Redis is unavailable."""
+        if self._retry_at is not None and self._clock() < self._retry_at:
+            return None
+        pending = self._pending_rate
+        new_rate = pending if pending is not None else (self._rate if op == 'rate' else '')
+        try:
+            wait, rate = self._script(
+                keys=[self.key], args=[op, self._rate, arg, self.capacity, self.ttl, new_rate],
+            )
+        except redis.RedisError as exc:
+            if self._retry_at is None:
+                logger.warning("Redis rate limiter unavailable, using a local bucket: %s", exc)
+            self._backoff = min(self.RETRY_MAX, self._backoff * 2) if self._backoff else self.RETRY_MIN
+            self._retry_at = self._clock() + self._backoff
+            return None
+        if self._retry_at is not None:
+            logger.info("Redis rate limiter available again")
+            self._retry_at = None
+            self._backoff = 0.0
+        if self._pending_rate == pending:
+            self._pending_rate = None
+        rate = float(rate)
+        if rate != self._rate:
+            # Another worker changed the shared rate
+            self._rate = rate
+            self.fallback.rate = rate / self.share
+        return float(wait)
+
+    def reserve(self):
+        wait = self._call('reserve')
+        return self.fallback.reserve() if wait is None else wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        if self._call('pause', seconds) is None:
+            self.fallback.pause(seconds)
+
+    def on_success(self, latency):
+        pass
+
+    def on_throttle(self, retry_after=None):
+        if retry_after:
+            self.pause(retry_after)
+
+
+_redis_clients = {}
+
+
+def _redis_client(url):
+    # One connection pool per process and URL
+    if url not in _redis_clients:
+        _redis_clients[url] = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=1)
+    return _redis_clients[url]
+
+
+class AdaptiveRateLimiter:
+    """AIMD controller on top of a shared bucket.
+
+    Healthy responses raise the rate by roughly ``increase`` req/s for every
+    second of traffic (additive increase). A 429, or smoothed latency climbing
+    above ``latency_factor`` times the best latency seen, multiplies the rate by
+    ``decrease`` (multiplicative decrease). Decreases are spaced at least
+    ``cooldown`` seconds apart so a burst of 429s from requests that were
+    already in flight counts as one congestion signal, not several.
+    """
+
+    def __init__(self, bucket, min_rate, max_rate, increase=1.0, decrease=0.5,
+                 latency_factor=2.0, cooldown=1.0, clock=time.monotonic):
+        self.bucket = bucket
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latency = None
+        self._best_latency = None
+        self._last_decrease = None
+        self.throttled = 0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        self.bucket.acquire()
+
+    def on_success(self, latency):
+        with self._lock:
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency = 0.8 * self._latency + 0.2 * latency
+            if self._best_latency is None or self._latency < self._best_latency:
+                self._best_latency = self._latency
+
+            if self._latency > self.latency_factor * self._best_latency:
+                rate = self._decreased()
+                if rate is not None:
+                    # Re-baseline so only a further rise counts as a new signal
+                    self._best_latency = self._latency / self.latency_factor
+            else:
+                rate = self.bucket.rate
+                rate = min(self.max_rate, rate + self.increase / rate)
+        self._apply(rate)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.throttled += 1
+            rate = self._decreased()
+        self._apply(rate)
+        if retry_after:
+            self.bucket.pause(retry_after)
+
+    def _decreased(self):
+        """The rate after a decrease, or None within the cooldown."""
+        now = self._clock()
+        if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+            return None
+        self._last_decrease = now
+        return max(self.min_rate, self.bucket.rate * self.decrease)
+
+    def _apply(self, rate):
+        # Outside the lock: a shared bucket may need a network round trip
+        if rate is not None and rate != self.bucket.rate:
+            self.bucket.rate = rate
+
+
+def build_limiter(rate=None, share=1, backend=None):
+    """Limiter for one sync.
+
+    The ``redis`` backend shares a single budget across the whole cluster
+    (its local fallback gets ``1/share`` of it). With the ``local`` one,
+    ``share`` splits the configured budget (and its adaptive bounds) between
+    that many concurrently running shards.
+    """
+    rate = rate or getattr(settings, 'ESHOP_API_RATE_LIMIT', 5)
+    max_rate = max(rate, getattr(settings, 'ESHOP_API_RATE_LIMIT_MAX', rate))
+    if (backend or BACKEND) == 'redis':
+        url = REDIS_URL or settings.CELERY_BROKER_URL
+        bucket = RedisBucket(_redis_client(url), rate=rate, share=share)
+        # The bounds apply to the cluster-wide rate
+        bounds_share = 1
+    else:
+        bucket = TokenBucket(rate=rate / share)
+        bounds_share = share
+    if not getattr(settings, 'ESHOP_API_ADAPTIVE_RATE_LIMIT', True):
+        return bucket
+    return AdaptiveRateLimiter(
+        bucket,
+        min_rate=getattr(settings, 'ESHOP_API_RATE_LIMIT_MIN', 0.5) / bounds_share,
+        max_rate=max_rate / bounds_share,
+    )
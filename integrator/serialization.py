@@ -0,0 +1,104 @@
+"""JSON encoding/decoding with a pluggable backend.
+
+``auto`` picks orjson, then msgspec, then the stdlib ``json`` module. All
+backends produce the same compact UTF-8 output (``{"a":1,"b":"č"}``) for
+strings, integers, booleans, null and floats written in plain decimal
+notation (finite, 1e-4 <= abs(x) < 1e16). They differ elsewhere: stdlib
+writes ``1e+16``, ``1e-07`` and ``NaN``, orjson ``1e+16``, ``1e-7`` and
+``null``, msgspec ``1e16``. compute_digests() therefore only lets a fast
+backend encode payloads within that set and uses ``reference_dumps`` (the
+stdlib) for the rest. Values a fast backend cannot encode (e.g. integers
+beyond 64 bits) are encoded by the stdlib as well.
+
+``loads`` accepts str, bytes or a memoryview (zero-copy for orjson and
+msgspec). Decoding errors are always ValueError subclasses. Every backend
+accepts the same documents: input a fast backend rejects (``NaN``,
+``Infinity``, ``1e400``) or may widen to a float (integers beyond 64 bits)
+is decoded by the stdlib instead.
+"""
+import json
+import re
+
+from django.conf import settings
+
+BACKEND = getattr(settings, 'SYNC_JSON_BACKEND', 'auto')
+
+BACKENDS = ('orjson', 'msgspec', 'json')
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _stdlib_loads(data):
+    # json.loads() takes str/bytes only; mmap-backed sources pass memoryviews
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+# A 64-bit integer has at most 19 digits; longer runs go to the stdlib
+_LONG_DIGITS = re.compile(rb'[0-9]{20}')
+_LONG_DIGITS_STR = re.compile(r'[0-9]{20}')
+
+
+def _loads_with_fallback(fast_loads):
+    def loads(data):
+        try:
+            obj = fast_loads(data)
+        except ValueError:
+            return _stdlib_loads(data)
+        long_digits = _LONG_DIGITS_STR if isinstance(data, str) else _LONG_DIGITS
+        if long_digits.search(data):
+            return _stdlib_loads(data)
+        return obj
+    return loads
+
+
+def _with_fallback(fast_dumps):
+    def dumps(obj):
+        try:
+            return fast_dumps(obj)
+        except (TypeError, OverflowError, ValueError):
+            return _stdlib_dumps(obj)
+    return dumps
+
+
+def load_backend(name='auto'):
+    """Return ``(name, dumps, loads)`` for a backend; ``auto`` takes the fastest installed."""
+    if name not in ('auto',) + BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name!r}")
+    candidates = BACKENDS if name == 'auto' else (name,)
+    for candidate in candidates:
+        if candidate == 'orjson':
+            try:
+                import orjson
+            except ImportError:
+                continue
+
+            def orjson_dumps(obj):
+                # orjson's bytes keep their ~4 KiB write buffer allocated; copy
+                # to a tight object since payload bodies live for the whole run
+                return memoryview(orjson.dumps(obj)).tobytes()
+
+            return 'orjson', _with_fallback(orjson_dumps), _loads_with_fallback(orjson.loads)
+        if candidate == 'msgspec':
+            try:
+                import msgspec
+            except ImportError:
+                continue
+            return 'msgspec', _with_fallback(msgspec.json.encode), _loads_with_fallback(msgspec.json.decode)
+    if name not in ('auto', 'json'):
+        raise ImportError(f"JSON backend {name!r} is not installed")
+    return 'json', _stdlib_dumps, _stdlib_loads
+
+
+NAME, dumps, loads = load_backend(BACKEND)
+# Backend-independent encoding for values outside the common subset
+reference_dumps = _stdlib_dumps
+
+
+def payload_bytes(payload):
+    """Request body for a payload, reusing the bytes encoded during hashing."""
+    body = getattr(payload, 'body', None)
+    return body if body is not None else dumps(payload)
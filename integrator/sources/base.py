@@ -1,7 +1,41 @@
 from abc import ABC, abstractmethod
+from typing import Iterator
+
+from integrator.transforms import fingerprint_raw
 
 
 class BaseSource(ABC):
     @abstractmethod
     def load(self) -> list[dict]:
         """Load raw product data from the ERP source."""
+
+    def iter_products(self) -> Iterator[dict]:
+        """Yield raw products one at a time.
+
+        Sources that can parse incrementally should override this so the
+        whole catalog never has to be held in memory at once.
+        """
+        yield from self.load()
+
+    def iter_fingerprinted(self) -> Iterator[tuple[dict, bytes]]:
+        """Yield ``(raw, digest)`` pairs, digest being fingerprint_raw() of the record.
+
+        The default re-serializes each dict; sources that see the record's
+        original text should fingerprint that instead.
+        """
+        for raw in self.iter_products():
+            yield raw, fingerprint_raw(raw)
+
+    def fingerprint(self) -> str | None:
+        """Identity of the current source contents; ``None`` if unknown.
+
+        When it equals last_processed(), the whole sync can be skipped.
+        """
+        return None
+
+    def last_processed(self) -> str | None:
+        """Fingerprint stored by the last mark_processed() call."""
+        return None
+
+    def mark_processed(self, fingerprint):
+        """Remember ``fingerprint`` as fully synced."""
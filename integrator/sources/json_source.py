@@ -1,15 +1,384 @@
+import hashlib
 import json
+import logging
+import mmap
+import os
+import re
 from pathlib import Path
+from typing import Iterator
 
 from django.conf import settings
 
+from integrator import serialization
+from integrator.transforms import fingerprint_raw
+
 from .base import BaseSource
 
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+STATE_DIR = getattr(settings, 'SYNC_SOURCE_STATE_DIR', None)
+USE_MMAP = getattr(settings, 'SYNC_SOURCE_MMAP', False)
+
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+_WHITESPACE = ' \t\n\r'
+
 
 class JsonFileSource(BaseSource):
-    def __init__(self, path=None):
+    """ERP export stored either as a top-level JSON array or as NDJSON."""
+
+    def __init__(self, path=None, chunk_size=CHUNK_SIZE, state_dir=None, use_mmap=None):
         self.path = Path(path) if path else settings.BASE_DIR / 'erp_data.json'
+        self.chunk_size = chunk_size
+        self.use_mmap = USE_MMAP if use_mmap is None else use_mmap
+        state_dir = state_dir or STATE_DIR
+        self.state_path = (Path(state_dir) if state_dir else self.path.parent) / f"{self.path.name}.sync-state"
 
     def load(self) -> list[dict]:
+        if self.is_ndjson():
+            return list(self.iter_products())
+        with open(self.path, 'rb') as f:
+            return serialization.loads(f.read())
+
+    def iter_products(self) -> Iterator[dict]:
+        for raw, _ in self._iter_records():
+            yield raw
+
+    def iter_fingerprinted(self) -> Iterator[tuple[dict, bytes]]:
+        # Hash the record's text as it appears in the file; no re-serialization
+        for raw, text in self._iter_records():
+            yield raw, fingerprint_raw(text)
+
+    def _iter_records(self):
+        if self.use_mmap:
+            yield from self._iter_mapped()
+            return
+        if self.is_ndjson():
+            # Binary lines go straight to the JSON backend and the fingerprint
+            with open(self.path, 'rb') as f:
+                yield from _iter_ndjson(f)
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            yield from _iter_json_array(f, self.chunk_size)
+
+    def byte_ranges(self, parts):
+        """Split the file into up to ``parts`` ``(start, end)`` byte ranges.
+
+        Every range starts and ends on a record boundary, so iter_range()
+        calls (e.g. in separate processes) together yield each record once.
+        NDJSON is cut at the newline after each target offset; a JSON array
+        needs one light scan for element boundaries, without decoding them.
+        """
+        size = os.path.getsize(self.path)
+        if not size:
+            return []
+        targets = [size * i // parts for i in range(1, parts)]
+        ndjson = self.is_ndjson()
+        with _mapped(self.path) as mm:
+            if ndjson:
+                cuts = [0]
+                for target in targets:
+                    newline = mm.find(b'\n', max(target, cuts[-1]))
+                    cuts.append(size if newline == -1 else newline + 1)
+                cuts.append(size)
+                return [(start, end) for start, end in zip(cuts, cuts[1:]) if start < end]
+
+            ranges = []
+            first = last = None
+            for start, end in _array_spans(mm, _array_start(mm), size, top_level=True):
+                if first is None:
+                    first = start
+                last = end
+                if targets and end >= targets[0]:
+                    ranges.append((first, last))
+                    first = None
+                    while targets and end >= targets[0]:
+                        targets.pop(0)
+            if first is not None:
+                ranges.append((first, last))
+            return ranges
+
+    def iter_range(self, start, end):
+        """Yield the raw products inside a range returned by byte_ranges()."""
+        for raw, _ in self._iter_mapped(start, end):
+            yield raw
+
+    def _iter_mapped(self, start=0, end=None):
+        """Yield ``(record, text)`` parsed straight from a memory map.
+
+        ``text`` is a memoryview into the map (no copy), valid only until the
+        next record is requested.
+        """
+        if not os.path.getsize(self.path):
+            if not self.is_ndjson():
+                raise ValueError("Expected a top-level JSON array")
+            return
+        ndjson = self.is_ndjson()
+        loads = serialization.loads
+        with _mapped(self.path) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            end = len(mm) if end is None else end
+            if ndjson:
+                spans = _ndjson_spans(mm, start, end)
+            elif start == 0:
+                spans = _array_spans(mm, _array_start(mm), end, top_level=True)
+            else:
+                spans = _array_spans(mm, start, end, top_level=False)
+
+            view = memoryview(mm)
+            text = None
+            try:
+                for span_start, span_end in spans:
+                    text = view[span_start:span_end]
+                    try:
+                        item = loads(text)
+                    except ValueError as exc:
+                        raise ValueError(f"Invalid JSON record at byte {span_start}: {exc}") from exc
+                    yield item, text
+                    text.release()
+            finally:
+                # The map cannot be closed while views into it exist
+                if text is not None:
+                    text.release()
+                view.release()
+
+    def fingerprint(self) -> str:
+        """BLAKE2b digest of the file contents.
+
+        The digest is cached in the state file together with the size and
+        mtime it was computed for, so an untouched file is recognized from a
+        single ``stat()`` without reading it. The cache is best-effort: if the
+        state file cannot be written, the digest is still returned.
+        """
+        stat = os.stat(self.path)
+        state = self._read_state()
+        if state.get('size') == stat.st_size and state.get('mtime_ns') == stat.st_mtime_ns:
+            return state['digest']
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(self.path, 'rb') as f:
+            while block := f.read(DIGEST_CHUNK_SIZE):
+                digest.update(block)
+        state.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, digest=digest.hexdigest())
+        try:
+            self._write_state(state)
+        except OSError as exc:
+            logger.warning("Could not cache the export digest in %s: %s", self.state_path, exc)
+        return state['digest']
+
+    def last_processed(self) -> str | None:
+        return self._read_state().get('processed')
+
+    def mark_processed(self, fingerprint):
+        state = self._read_state()
+        state['processed'] = fingerprint
+        self._write_state(state)
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Missing or unreadable: nothing cached, nothing processed
+            return {}
+
+    def _write_state(self, state):
+        tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def is_ndjson(self) -> bool:
+        if self.path.suffix.lower() in NDJSON_SUFFIXES:
+            return True
         with open(self.path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            while True:
+                char = f.read(1)
+                if not char:
+                    return False
+                if char not in _WHITESPACE:
+                    return char != '['
+
+
+def _iter_ndjson(f):
+    loads = serialization.loads
+    for line_no, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = loads(line)
+        except ValueError as exc:
+            raise ValueError(f"Invalid NDJSON on line {line_no}: {exc}") from exc
+        yield item, line
+
+
+def _iter_json_array(f, chunk_size):
+    """Decode the elements of a top-level JSON array one by one.
+
+    Yields ``(element, source_text)``. Only one chunk plus the element being
+    decoded is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    def close():
+        # Only whitespace may follow the array, as for json.load()
+        nonlocal pos
+        pos += 1
+        skip_whitespace()
+        if pos < len(buf):
+            raise ValueError(f"Extra data after the JSON array: {buf[pos:pos + 20]!r}")
+
+    fill()
+    skip_whitespace()
+    if pos >= len(buf) or buf[pos] != '[':
+        raise ValueError("Expected a top-level JSON array")
+    pos += 1
+
+    skip_whitespace()
+    if pos < len(buf) and buf[pos] == ']':
+        close()
+        return
+
+    while True:
+        skip_whitespace()
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if end == len(buf) and not eof:
+            # A scalar cut at the chunk boundary decodes "successfully"; re-read it whole.
+            fill()
+            continue
+        text = buf[pos:end]
+        pos = end
+        yield item, text
+
+        skip_whitespace()
+        if pos >= len(buf):
+            raise ValueError("Unterminated JSON array")
+        if buf[pos] == ']':
+            close()
+            return
+        if buf[pos] != ',':
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {buf[pos]!r}")
+        pos += 1
+
+
+def _mapped(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+_WHITESPACE_BYTES = frozenset(b' \t\n\r')
+_SKIP_WHITESPACE = re.compile(rb'[ \t\n\r]*+')
+# Everything up to the next structural byte, stepping over whole strings
+_SKIP_VALUE = re.compile(rb'(?:[^"\[\]{},]++|"[^"\\]*+(?:\\.[^"\\]*+)*+")*+')
+
+
+def _ndjson_spans(mm, pos, end):
+    while pos < end:
+        newline = mm.find(b'\n', pos, end)
+        line_end = end if newline == -1 else newline
+        start, stop = pos, line_end
+        while start < stop and mm[start] in _WHITESPACE_BYTES:
+            start += 1
+        while stop > start and mm[stop - 1] in _WHITESPACE_BYTES:
+            stop -= 1
+        if start < stop:
+            yield start, stop
+        pos = line_end + 1
+
+
+def _array_start(mm):
+    pos = _SKIP_WHITESPACE.match(mm).end()
+    if pos >= len(mm) or mm[pos] != ord('['):
+        raise ValueError("Expected a top-level JSON array")
+    return pos + 1
+
+
+def _array_spans(mm, pos, end, top_level):
+    """Yield ``(start, end)`` of the comma-separated values from ``pos``.
+
+    Only structural bytes outside strings are inspected; the values are
+    not decoded. With ``top_level`` the scan stops at the closing ``]`` of
+    the array, otherwise at ``end``.
+    """
+    depth = 0
+    pos = _SKIP_WHITESPACE.match(mm, pos, end).end()
+    start = pos
+    expect_value = False
+    while True:
+        pos = _SKIP_VALUE.match(mm, pos, end).end()
+        if pos >= end:
+            if top_level:
+                raise ValueError("Unterminated JSON array")
+            if depth:
+                raise ValueError(f"Range ends inside a JSON value (byte {end})")
+            stop = _rstrip(mm, start, pos)
+            if start < stop:
+                yield start, stop
+            elif expect_value:
+                raise ValueError(f"Expected a value at byte {start}")
+            return
+
+        char = mm[pos]
+        if char in b'[{':
+            depth += 1
+        elif char in b']}':
+            if depth:
+                depth -= 1
+            elif char == ord(']') and top_level:
+                trailing = _SKIP_WHITESPACE.match(mm, pos + 1, end).end()
+                if trailing < end:
+                    raise ValueError(f"Extra data after the JSON array at byte {trailing}")
+                stop = _rstrip(mm, start, pos)
+                if start < stop:
+                    yield start, stop
+                elif expect_value:
+                    raise ValueError(f"Expected a value at byte {start}")
+                return
+            else:
+                raise ValueError(f"Unexpected {chr(char)!r} at byte {pos}")
+        elif not depth:
+            stop = _rstrip(mm, start, pos)
+            if start == stop:
+                raise ValueError(f"Expected a value at byte {start}")
+            yield start, stop
+            pos = _SKIP_WHITESPACE.match(mm, pos + 1, end).end()
+            start = pos
+            expect_value = True
+            continue
+        pos += 1
+
+
+def _rstrip(mm, start, stop):
+    while stop > start and mm[stop - 1] in _WHITESPACE_BYTES:
+        stop -= 1
+    return stop
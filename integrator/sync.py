@@ -1,90 +1,372 @@
 import logging
 import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from itertools import islice
 
+import billiard
 from django.conf import settings
-from django.utils import timezone
 
-from integrator.models import ProductSyncState
-from integrator.transforms import validate_product, transform_product, deduplicate, compute_hash
+from integrator import columnar as columnar_engine
+from integrator.dedup import iter_last_wins
+from integrator.dispatch import Dispatcher
+from integrator.metrics import SyncMetrics, export, get_exporter, merge_summaries
+from integrator.persistence import get_state_writer, load_state_hashes
+from integrator.profiling import MODES as PROFILE_MODES, PROFILE, RunProfile
+from integrator.ratelimit import build_limiter
+from integrator.transforms import HASH_VERSION, prepare_products, shard_of
 
 logger = logging.getLogger(__name__)
 
 RATE_LIMIT = getattr(settings, 'ESHOP_API_RATE_LIMIT', 5)
+CONCURRENCY = getattr(settings, 'ESHOP_API_CONCURRENCY', 4)
+BATCH_SIZE = getattr(settings, 'ESHOP_API_BATCH_SIZE', 100)
+BATCH_MAX_BYTES = getattr(settings, 'ESHOP_API_BATCH_MAX_BYTES', 512 * 1024)
+STATE_CHUNK_SIZE = getattr(settings, 'SYNC_STATE_CHUNK_SIZE', 500)
+PREPARE_CHUNK_SIZE = 1000
+SKIP_UNCHANGED_RAW = getattr(settings, 'SYNC_SKIP_UNCHANGED_RAW', False)
+PREPARE_WORKERS = getattr(settings, 'SYNC_PREPARE_WORKERS', 1)
+COLUMNAR_TRANSFORM = getattr(settings, 'SYNC_COLUMNAR_TRANSFORM', False)
+DEDUP = getattr(settings, 'SYNC_DEDUP', 'inline')
+DEDUP_MODES = ('inline', 'two-pass', 'spill')
+
+# Marks a SKU whose raw ERP record is byte-identical to the last synced one
+UNCHANGED = object()
 
 
 class SyncOrchestrator:
-    def __init__(self, source, client):
+    def __init__(self, source, client, limiter=None, concurrency=None, skip_unchanged_raw=None, shard=None,
+                 prepare_workers=None, dedup=None, exporter=None, profile=None, profile_name=None):
         self.source = source
         self.client = client
+        self.skip_unchanged_raw = SKIP_UNCHANGED_RAW if skip_unchanged_raw is None else skip_unchanged_raw
+        self.prepare_workers = prepare_workers or PREPARE_WORKERS
+        self.prepare_chunk = _prepare_function(COLUMNAR_TRANSFORM)
+        self.dedup = dedup or DEDUP
+        if self.dedup not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode {self.dedup!r}, expected one of {DEDUP_MODES}")
+        # (index, count): only SKUs with shard_of(sku, count) == index are synced
+        self.shard = shard
+        self.exporter = exporter or get_exporter()
+        self.metrics = None
+        # '' = off, 'cprofile' or 'sample' (see integrator.profiling)
+        self.profile = PROFILE if profile is None else profile
+        if self.profile and self.profile not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {self.profile!r}, expected one of {PROFILE_MODES}")
+        self.profile_name = profile_name
+        self._profile = None
+        # Shards run side by side; a local limiter gives each an equal slice
+        # of the global limit, the Redis one is shared by all of them
+        self.limiter = limiter or build_limiter(rate=RATE_LIMIT, share=shard[1] if shard else 1)
+        # Client and dispatcher share one limiter, so a 429 seen by any
+        # request slows down all of them
+        self.client.limiter = self.limiter
+        self.dispatcher = Dispatcher(
+            client, self.limiter,
+            concurrency=concurrency or CONCURRENCY,
+            batch_size=BATCH_SIZE,
+            batch_max_bytes=BATCH_MAX_BYTES,
+        )
+        # A hint for clients that size their connection pool
+        self.client.pool_size = self.dispatcher.concurrency
+
+    def run(self, force=False):
+        if not self.profile:
+            return self._run(force)
+        name = self.profile_name or f"sync-{time.strftime('%Y%m%d-%H%M%S')}"
+        if self.shard is not None and not self.profile_name:
+            name += f"-shard-{self.shard[0]}"
+        with RunProfile(self.profile, name) as profile:
+            self._profile = profile
+            try:
+                stats = self._run(force)
+            finally:
+                self._profile = None
+        stats['profile_artifacts'] = profile.artifacts
+        return stats
 
-    def run(self):
+    def _run(self, force):
         logger.info("Starting product sync")
 
-        raw_data = self.source.load()
-        raw_data = deduplicate(raw_data)
+        stats = {'synced': 0, 'skipped_unchanged': 0, 'skipped_invalid': 0, 'errors': 0, 'source_unchanged': False}
+        # Fresh per run; the client reports every HTTP attempt to it
+        metrics = self.metrics = SyncMetrics()
+        self.client.metrics = metrics
 
-        session = self.client.make_session()
+        # Whole-export short-circuit: no parsing, no DB query. Shards leave
+        # this to the task that fanned them out.
+        with metrics.stage('fingerprint'):
+            fingerprint = processed_marker(self.source.fingerprint()) if self.shard is None else None
+            unchanged = not force and fingerprint is not None and fingerprint == self.source.last_processed()
+        if unchanged:
+            logger.info("Source unchanged since last sync, skipping")
+            stats['source_unchanged'] = True
+            return self._finish(stats)
 
-        stats = {'synced': 0, 'skipped_unchanged': 0, 'skipped_invalid': 0, 'errors': 0}
-        interval = 1.0 / RATE_LIMIT
+        if self.skip_unchanged_raw:
+            # Raw fingerprints are compared while streaming, so the stored
+            # state has to be loaded before the source is read
+            with metrics.stage('lookup'):
+                states = load_state_hashes(with_raw=True, shard=self.shard)
+                metrics.add_items('lookup', len(states))
+            products = self._prepare(self._records(self.source.iter_fingerprinted()), states)
+        else:
+            states = None
+            products = self._prepare(self._records((raw, None) for raw in self.source.iter_products()))
 
+        session = self.client.make_session()
+
+        # Breakdowns of skipped_invalid and errors, e.g. {'null price': 3}, {'HTTP 500': 1}
+        invalid_reasons = Counter()
+        error_types = Counter()
         valid_products = []
-        for raw in raw_data:
-            is_valid, reason = validate_product(raw)
-            if not is_valid:
-                logger.warning("Skipping invalid product: %s", reason)
-                stats['skipped_invalid'] += 1
-                continue
-            payload = transform_product(raw)
-            data_hash = compute_hash(payload)
-            valid_products.append((payload, data_hash))
-
-        # Bulk fetch existing sync states (1 query instead of N)
-        all_skus = [p['sku'] for p, _ in valid_products]
-        existing_states = {
-            state.sku: state
-            for state in ProductSyncState.objects.filter(sku__in=all_skus)
-        }
-
-        to_create = []
-        to_update = []
-        now = timezone.now()
-
-        for payload, data_hash in valid_products:
-            sku = payload['sku']
-            existing = existing_states.get(sku)
-
-            if existing and existing.data_hash == data_hash:
-                logger.debug("Product %s unchanged, skipping", sku)
+        for prepared in products.values():
+            if prepared is UNCHANGED:
                 stats['skipped_unchanged'] += 1
                 continue
+            if isinstance(prepared, str):
+                logger.warning("Skipping invalid product: %s", prepared)
+                stats['skipped_invalid'] += 1
+                invalid_reasons[_reason_kind(prepared)] += 1
+                continue
+            valid_products.append(prepared)
+        del products
+        if self._profile is not None:
+            # Everything prepared is alive here: the run's memory high point
+            self._profile.snapshot()
 
-            is_update = existing is not None
+        if states is None:
+            # Bulk fetch existing digests: chunked IN lists or one table scan
+            with metrics.stage('lookup', items=len(valid_products)):
+                states = load_state_hashes([p.sku for p, _, _ in valid_products])
 
-            try:
-                time.sleep(interval)
-                self.client.send(session, payload, is_update=is_update)
-
-                if is_update:
-                    existing.data_hash = data_hash
-                    existing.last_synced_at = now
-                    to_update.append(existing)
-                else:
-                    to_create.append(
-                        ProductSyncState(sku=sku, data_hash=data_hash, last_synced_at=now)
-                    )
+        # Sync state is checkpointed every STATE_CHUNK_SIZE successful sends
+        with get_state_writer(chunk_size=STATE_CHUNK_SIZE, metrics=metrics) as writer, metrics.stage('send'):
+
+            def changed_products():
+                for payload, data_hash, raw_hash in valid_products:
+                    sku = payload.sku
+                    existing = states.get(sku)
+                    stored_raw = None
+                    if isinstance(existing, tuple):
+                        existing, stored_raw = existing
+                    if existing == data_hash:
+                        logger.debug("Product %s unchanged, skipping", sku)
+                        stats['skipped_unchanged'] += 1
+                        if raw_hash is not None and raw_hash != stored_raw:
+                            # Raw record changed in a way the payload ignores;
+                            # remember it so the next run can skip it early
+                            writer.touch_raw(sku, raw_hash)
+                        continue
+                    yield payload, existing is not None, (data_hash, raw_hash)
+
+            results = self.dispatcher.dispatch(session, changed_products())
+            for payload, is_update, (data_hash, raw_hash), error in results:
+                sku = payload.sku
+                if error is not None:
+                    logger.error("Failed to sync %s: %s", sku, error)
+                    stats['errors'] += 1
+                    error_types[_error_kind(error)] += 1
+                    continue
 
+                writer.add(sku, data_hash, is_update, raw_hash=raw_hash)
                 stats['synced'] += 1
                 logger.info("Synced %s (%s)", sku, "updated" if is_update else "created")
-            except Exception as exc:
-                logger.error("Failed to sync %s: %s", sku, exc)
-                stats['errors'] += 1
+            metrics.add_items('send', stats['synced'] + stats['errors'])
 
-        # Bulk DB writes (2 queries instead of N)
-        if to_create:
-            ProductSyncState.objects.bulk_create(to_create)
-        if to_update:
-            ProductSyncState.objects.bulk_update(to_update, ['data_hash', 'last_synced_at'])
+        # Failed products must be retried next time, so only a clean run counts
+        if fingerprint is not None and stats['errors'] == 0:
+            self.source.mark_processed(fingerprint)
 
+        stats['rate_limit'] = round(self.limiter.rate, 2)
+        stats['invalid_reasons'] = dict(invalid_reasons)
+        stats['error_types'] = dict(error_types)
         logger.info("Sync complete: %s", stats)
+        return self._finish(stats)
+
+    def _finish(self, stats):
+        stats['metrics'] = self.metrics.summary()
+        # A shard's numbers are exported merged with the others' (see export_merged)
+        if self.shard is None:
+            export(self.exporter, stats['metrics'], stats)
         return stats
+
+    def _records(self, records):
+        """Apply the two-pass dedup modes to the ``(raw, raw_digest)`` stream.
+
+        ``inline`` leaves deduplication to _prepare(). ``two-pass`` first
+        reads only the SKUs to find each one's last occurrence, so duplicates
+        are never validated, transformed or hashed; ``spill`` keeps that
+        ``sku -> position`` index in a temporary SQLite file instead of RAM.
+
+        The positions only fit the records if both passes read the same data,
+        so a source whose fingerprint changed meanwhile aborts the run.
+        """
+        if self.dedup == 'inline':
+            return records
+        keys = (raw.get('id') for raw in self.source.iter_products())
+        before = self.source.fingerprint()
+        return self._check_unchanged(iter_last_wins(keys, records, spill=self.dedup == 'spill'), before)
+
+    def _check_unchanged(self, records, before):
+        yield from records
+        if before is not None and self.source.fingerprint() != before:
+            raise ValueError("Source changed between the two dedup passes, aborting the sync")
+
+    def _prepare(self, records, states=None):
+        """Validate, transform and hash ``(raw, raw_digest)`` records as they stream in.
+
+        Records are processed in chunks of PREPARE_CHUNK_SIZE so hashing runs
+        in batched mode; with ``prepare_workers`` > 1 the chunks go to a
+        process pool. When ``states`` carries stored raw fingerprints, a
+        record whose raw digest matches is marked UNCHANGED without being
+        validated, transformed or hashed at all.
+
+        Deduplication happens on the fly: a later record with the same SKU
+        replaces the earlier result (last occurrence wins), so only the compact
+        ``(payload, digest, raw_digest)`` tuple, the rejection reason or the
+        UNCHANGED marker is kept per SKU, never the raw ERP record. Pooled
+        chunks are applied in submission order, so the same rule holds.
+        """
+        products = {}
+        metrics = self.metrics or SyncMetrics()
+        records = iter(records)
+        if self.shard is not None:
+            index, count = self.shard
+            records = ((raw, digest) for raw, digest in records if shard_of(raw.get('id'), count) == index)
+
+        with self._prepare_pool() as pool:
+            # Bounded read-ahead: enough chunks to keep every worker busy
+            pending = deque()
+            while True:
+                # Pulling a chunk parses it (and, in the two-pass modes, runs the SKU pass first)
+                with metrics.stage('load'):
+                    chunk = list(islice(records, PREPARE_CHUNK_SIZE))
+                    metrics.add_items('load', len(chunk))
+                if not chunk:
+                    break
+                # (sku, None) marks an UNCHANGED record, (None, raw_digest) one to prepare
+                order = []
+                fresh = []
+                for raw, raw_digest in chunk:
+                    if states is not None:
+                        state = states.get(raw['id'])
+                        if state is not None and state[1] == raw_digest:
+                            order.append((raw['id'], None))
+                            continue
+                    order.append((None, raw_digest))
+                    fresh.append(raw)
+                del chunk
+
+                if pool is None:
+                    with metrics.stage('transform', items=len(fresh)):
+                        prepared = self.prepare_chunk(fresh) if fresh else ()
+                    with metrics.stage('dedup', items=len(order)):
+                        _apply_prepared(products, order, prepared)
+                    continue
+                result = pool.apply_async(self.prepare_chunk, (fresh,)) if fresh else None
+                pending.append((order, len(fresh), result))
+                if len(pending) >= 2 * self.prepare_workers:
+                    self._apply_result(products, metrics, *pending.popleft())
+
+            while pending:
+                self._apply_result(products, metrics, *pending.popleft())
+        return products
+
+    @staticmethod
+    def _apply_result(products, metrics, order, count, result):
+        # With a pool, the transform stage is the time spent waiting for workers
+        with metrics.stage('transform', items=count):
+            prepared = result.get() if result else ()
+        with metrics.stage('dedup', items=len(order)):
+            _apply_prepared(products, order, prepared)
+
+    @contextmanager
+    def _prepare_pool(self):
+        # billiard (Celery's fork of multiprocessing) may start workers from a
+        # daemonic prefork child, where multiprocessing refuses to
+        if self.prepare_workers <= 1:
+            yield None
+            return
+        pool = billiard.Pool(processes=self.prepare_workers)
+        try:
+            yield pool
+        finally:
+            # Every result has been collected (or the run failed); nothing to wait for
+            pool.terminate()
+            pool.join()
+
+
+def _prepare_function(columnar):
+    if not columnar:
+        return prepare_products
+    if not columnar_engine.AVAILABLE:
+        logger.warning("SYNC_COLUMNAR_TRANSFORM needs numpy, using the per-record transform")
+        return prepare_products
+    return columnar_engine.prepare_columns
+
+
+def _apply_prepared(products, order, prepared):
+    prepared = iter(prepared)
+    for sku, raw_digest in order:
+        if sku is not None:
+            products[sku] = UNCHANGED
+            continue
+        sku, payload, digest = next(prepared)
+        products[sku] = (payload, digest, raw_digest) if payload is not None else digest
+
+
+def _reason_kind(reason):
+    # "SKU-1: negative price (-150.0)" -> "negative price"
+    return reason.split(': ', 1)[-1].split(' (', 1)[0]
+
+
+def _error_kind(error):
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return f"HTTP {response.status_code}"
+    return type(error).__name__
+
+
+def processed_marker(fingerprint):
+    """What mark_processed() stores for an export: its fingerprint plus HASH_VERSION.
+
+    A HASH_VERSION bump (i.e. a transform change) no longer matches the
+    marker, so an unchanged export is synced once more, like the per-product
+    digests promise.
+    """
+    return None if fingerprint is None else f"{fingerprint}:v{HASH_VERSION}"
+
+
+def export_merged(stats, exporter=None):
+    """Export the merge_stats() of a sharded run as one run."""
+    summaries = stats.get('shard_metrics')
+    if summaries:
+        export(exporter or get_exporter(), merge_summaries(summaries), stats)
+
+
+def merge_stats(results):
+    """Combine the stats of shard runs into one dict.
+
+    Counters (also inside breakdown dicts) and the per-shard rates add up; flags
+    are true if any shard set them and lists are concatenated. Percentiles do not add up, so each shard's
+    metrics are kept under ``shard_metrics``.
+    """
+    merged = {}
+    for stats in results:
+        for key, value in stats.items():
+            if key == 'metrics':
+                merged.setdefault('shard_metrics', []).append(value)
+            elif isinstance(value, bool):
+                merged[key] = merged.get(key, False) or value
+            elif isinstance(value, (int, float)):
+                merged[key] = merged.get(key, 0) + value
+            elif isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            elif isinstance(value, dict):
+                counts = merged.setdefault(key, {})
+                for name, count in value.items():
+                    counts[name] = counts.get(name, 0) + count
+    if 'rate_limit' in merged:
+        merged['rate_limit'] = round(merged['rate_limit'], 2)
+    return merged
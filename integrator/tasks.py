@@ -1,8 +1,14 @@
-from celery import shared_task
+import logging
+
+from celery import chord, shared_task
+from celery.signals import worker_process_shutdown
 from django.conf import settings
 from django.utils.module_loading import import_string
 
-from integrator.sync import SyncOrchestrator
+from integrator import history
+from integrator.clients.transport import close_sessions
+from integrator.lease import Lease
+from integrator.sync import SyncOrchestrator, export_merged, merge_stats, processed_marker
 
 # Re-exports for backward compatibility
 from integrator.transforms import validate_product, transform_product, deduplicate, compute_hash  # noqa: F401
@@ -13,6 +19,8 @@ from integrator.clients.eshop_client import (  # noqa: F401
     RETRY_BASE_DELAY,
 )
 
+logger = logging.getLogger(__name__)
+
 
 def _get_source(**kwargs):
     cls = import_string(settings.SYNC_SOURCE_CLASS)
@@ -32,10 +40,163 @@ def send_to_eshop(session, payload, is_update=False):
     return _get_client().send(session, payload, is_update=is_update)
 
 
+@worker_process_shutdown.connect
+def _close_http_sessions(**kwargs):
+    # Pooled keep-alive connections live as long as the worker process
+    close_sessions()
+
+
+SHARDS = getattr(settings, 'SYNC_SHARDS', 1)
+# What a trigger does while another sync holds the lease: coalesce | skip
+OVERLAP = getattr(settings, 'SYNC_OVERLAP', 'coalesce')
+
+
+def _idle_stats(**flags):
+    stats = {'synced': 0, 'skipped_unchanged': 0, 'skipped_invalid': 0, 'errors': 0, 'source_unchanged': False}
+    stats.update(flags)
+    return stats
+
+
+def _claim(lease, force):
+    """Acquire the lease or hand the trigger over to the running sync.
+
+    Returns ``None`` when the lease was acquired, otherwise the stats the
+    overlapping trigger reports.
+    """
+    if lease.acquire():
+        return None
+    if OVERLAP == 'coalesce':
+        if lease.request_rerun(force=force):
+            logger.info("Sync already running, follow-up run requested")
+            return _idle_stats(skipped_overlap=True, coalesced=True)
+        # The other run finished in the meantime
+        if lease.acquire():
+            return None
+    logger.info("Sync already running, skipping")
+    return _idle_stats(skipped_overlap=True, coalesced=False)
+
+
+def _release(lease):
+    rerun, rerun_force = lease.release()
+    if rerun:
+        logger.info("Starting follow-up sync requested during the run")
+        sync_products.apply_async(kwargs={'force': rerun_force})
+
+
+def _profile_name(run, shard=None):
+    # Artifacts are named after the SyncRun they belong to
+    if run is None:
+        return None
+    return f"sync-run-{run}" if shard is None else f"sync-run-{run}-shard-{shard}"
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def sync_products(self, force=False, shards=None, profile=None):
+    """Sync the ERP export to the e-shop.
+
+    ``profile`` ('cprofile' or 'sample') profiles this one run, overriding
+    SYNC_PROFILE; the artifacts are listed on its SyncRun.
+    """
+    shards = shards or SHARDS
+    run = history.start_run(force=force, shards=shards, task_id=self.request.id)
+    lease = Lease()
+    overlap = _claim(lease, force)
+    if overlap is not None:
+        history.finish_run(run, overlap)
+        return overlap
+
+    if shards <= 1:
+        try:
+            with lease.heartbeat():
+                orchestrator = SyncOrchestrator(
+                    source=_get_source(),
+                    client=_get_client(),
+                    profile=profile,
+                    profile_name=_profile_name(run),
+                )
+                stats = orchestrator.run(force=force)
+        except Exception as exc:
+            history.fail_run(run, exc)
+            raise
+        finally:
+            _release(lease)
+        history.finish_run(run, stats)
+        return stats
+
+    # Fan out: the unchanged-export check runs once here, each shard task
+    # syncs its own hash partition and merge_shard_stats combines the results.
+    # The lease is handed to the chord: shards renew it when they start and
+    # keep it alive, the callback releases it and a failed shard releases it
+    # through sync_shards_failed (or it expires if the chord dies).
+    try:
+        source = _get_source()
+        fingerprint = processed_marker(source.fingerprint())
+        if not force and fingerprint is not None and fingerprint == source.last_processed():
+            _release(lease)
+            stats = _idle_stats(source_unchanged=True)
+            history.finish_run(run, stats)
+            return stats
+
+        workflow = chord(
+            (
+                sync_product_shard.s(index, shards, lease=lease.owner, profile=profile, run=run)
+                for index in range(shards)
+            ),
+            merge_shard_stats.s(fingerprint=fingerprint, lease=lease.owner, run=run).on_error(
+                sync_shards_failed.s(lease=lease.owner, run=run),
+            ),
+        )
+    except Exception as exc:
+        _release(lease)
+        history.fail_run(run, exc)
+        raise
+    return self.replace(workflow)
+
+
 @shared_task(max_retries=3, default_retry_delay=60)
-def sync_products():
+def sync_product_shard(index, count, lease=None, profile=None, run=None):
     orchestrator = SyncOrchestrator(
         source=_get_source(),
         client=_get_client(),
+        shard=(index, count),
+        profile=profile,
+        profile_name=_profile_name(run, index),
     )
-    return orchestrator.run()
+    if lease is None:
+        return orchestrator.run()
+    lease = Lease(owner=lease)
+    # The shard may have waited in the queue; past the TTL another sync may own the lease
+    if not lease.renew():
+        raise RuntimeError(f"Sync lease expired before shard {index} started")
+    with lease.heartbeat():
+        return orchestrator.run()
+
+
+@shared_task
+def merge_shard_stats(results, fingerprint=None, lease=None, run=None):
+    stats = merge_stats(results)
+    # Same rule as a single-task run: only a clean sync marks the export done
+    if fingerprint is not None and stats['errors'] == 0:
+        _get_source().mark_processed(fingerprint)
+    if lease is not None:
+        _release(Lease(owner=lease))
+    export_merged(stats)
+    history.finish_run(run, stats)
+    return stats
+
+
+@shared_task
+def sync_shards_failed(request, exc, traceback, lease=None, run=None):
+    """Chord error callback: a shard failed, so merge_shard_stats never runs."""
+    logger.error("Sharded sync failed: %s", exc)
+    if lease is not None:
+        _release(Lease(owner=lease))
+    history.fail_run(run, exc)
+
+
+@shared_task
+def cleanup_sync_runs():
+    """Apply the SyncRun retention policy (SYNC_RUN_RETENTION_DAYS)."""
+    deleted, abandoned = history.cleanup_runs()
+    logger.info("Sync run cleanup: %d deleted, %d marked abandoned", deleted, abandoned)
+    return {'deleted': deleted, 'abandoned': abandoned}
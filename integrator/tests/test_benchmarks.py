@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from integrator.benchmarks.catalog import iter_catalog, write_catalog
+from integrator.benchmarks.runner import compare, run_benchmark
+from integrator.metrics import peak_rss_bytes, reset_peak_rss
+from integrator.models import ProductSyncState
+from integrator.sources.json_source import JsonFileSource
+from integrator.transforms import validate_product
+
+
+class TestCatalog(TestCase):
+    def test_same_seed_same_catalog(self):
+        self.assertEqual(list(iter_catalog(200, seed=3)), list(iter_catalog(200, seed=3)))
+        self.assertNotEqual(list(iter_catalog(200, seed=3)), list(iter_catalog(200, seed=4)))
+
+    def test_rates(self):
+        records = list(iter_catalog(5000, duplicate_rate=0.1, invalid_rate=0.05))
+        skus = {r['id'] for r in records}
+        invalid = sum(not validate_product(r)[0] for r in records)
+        self.assertAlmostEqual(1 - len(skus) / len(records), 0.1, delta=0.02)
+        self.assertAlmostEqual(invalid / len(records), 0.05, delta=0.015)
+
+    def test_revision_changes_only_change_rate(self):
+        base = list(iter_catalog(5000, change_rate=0.2))
+        revised = list(iter_catalog(5000, change_rate=0.2, revision=1))
+        changed = [a for a, b in zip(base, revised) if a != b]
+        self.assertAlmostEqual(len(changed) / len(base), 0.2, delta=0.03)
+        self.assertEqual([r['id'] for r in base], [r['id'] for r in revised])
+        self.assertEqual(base, list(iter_catalog(5000, change_rate=0.2, revision=0)))
+
+    def test_written_file_parses_back(self):
+        for ndjson in (False, True):
+            with self.subTest(ndjson=ndjson), tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'catalog.ndjson' if ndjson else 'catalog.json')
+                size = write_catalog(path, 300, ndjson=ndjson, seed=1)
+                self.assertEqual(size, os.path.getsize(path))
+                self.assertEqual(list(JsonFileSource(path=path).iter_products()), list(iter_catalog(300, seed=1)))
+
+
+class TestSyncBenchmark(TestCase):
+    def test_scenarios(self):
+        result = run_benchmark(400, change_rate=0.1, batch=True)
+        initial, rerun, delta = result['scenarios']
+
+        self.assertEqual(initial['stats']['errors'], 0)
+        self.assertGreater(initial['stats']['synced'], 350)
+        self.assertEqual(rerun['stats']['synced'], 0)
+        self.assertEqual(rerun['requests'], 0)
+        self.assertGreater(delta['stats']['synced'], 0)
+        self.assertLess(delta['stats']['synced'], initial['stats']['synced'] / 2)
+        self.assertLessEqual(
+            {'fingerprint', 'load', 'transform', 'lookup', 'send', 'persist', 'other'}, set(initial['stages']),
+        )
+        self.assertEqual(initial['http']['requests'], initial['requests'])
+        # Benchmark writes are rolled back
+        self.assertFalse(ProductSyncState.objects.exists())
+
+    def test_peak_rss_per_scenario(self):
+        if not reset_peak_rss():
+            self.skipTest("The peak RSS cannot be reset on this platform")
+        ballast = b'x' * (256 * 2**20)
+        earlier_peak = peak_rss_bytes()
+        del ballast
+
+        initial, = run_benchmark(100, scenarios=('initial',))['scenarios']
+        self.assertEqual(initial['peak_rss_scope'], 'scenario')
+        # The ballast freed before the benchmark does not count
+        self.assertLess(initial['peak_rss_bytes'], earlier_peak - 128 * 2**20)
+
+    def test_compare_flags_regressions(self):
+        def report(rate, rss, scope='scenario'):
+            return {'results': [{'products': 10, 'scenarios': [
+                {'scenario': 'initial', 'products_per_second': rate, 'peak_rss_bytes': rss, 'peak_rss_scope': scope},
+            ]}]}
+
+        self.assertEqual(compare(report(90, 100)['results'], report(100, 100), 0.2), [])
+        self.assertEqual(len(compare(report(70, 130)['results'], report(100, 100), 0.2)), 2)
+        # A process-lifetime peak is not compared with a per-scenario one
+        self.assertEqual(compare(report(100, 130)['results'], report(100, 100, 'process'), 0.2), [])
+
+    def test_command_json_output(self):
+        out = StringIO()
+        call_command('bench_sync', '--products', '100', '--scenarios', 'initial', '--json', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['results'][0]['products'], 100)
+        self.assertIn('json_backend', report['environment'])
@@ -1,9 +1,18 @@
+import gzip
+import json
+import socket
+
 import responses
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 from django.test import TestCase
 
+from integrator.clients import transport
 from integrator.clients.eshop_client import EshopClient, ESHOP_BASE_URL
+from integrator.ratelimit import TokenBucket
+from integrator.sync import SyncOrchestrator
+from integrator.benchmarks.fake_eshop import FakeEshop
+from integrator.transforms import Payload, compute_digests
 
 
 class TestApiCommunication(TestCase):
@@ -26,6 +35,17 @@ class TestApiCommunication(TestCase):
         self.assertEqual(resp.status_code, 201)
         self.assertEqual(responses.calls[0].request.headers['X-Api-Key'], 'symma-secret-token')
 
+    @responses.activate
+    def test_sends_body_encoded_during_hashing(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=201)
+
+        payload = Payload(sku="SKU-001", title="Kávovar", price=121.0, stock=1, color="N/A")
+        compute_digests([payload])
+        self.client.send(self.session, payload)
+
+        self.assertEqual(responses.calls[0].request.body, payload.body)
+        self.assertEqual(json.loads(payload.body), payload)
+
     @responses.activate
     def test_patch_existing_product(self):
         responses.add(
@@ -64,6 +84,32 @@ class TestApiCommunication(TestCase):
         self.assertEqual(resp.status_code, 201)
         self.assertEqual(len(responses.calls), 2)
 
+    @responses.activate
+    def test_limiter_notified_of_throttle_and_success(self):
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/",
+            json={"error": "rate limited"},
+            status=429,
+            headers={"Retry-After": "0.01"},
+        )
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/",
+            json={"status": "created"},
+            status=201,
+        )
+        self.client.limiter = MagicMock()
+
+        payload = {"sku": "SKU-001", "title": "Test", "price": 100, "stock": 1, "color": "N/A"}
+        with patch('integrator.clients.eshop_client.RETRY_BASE_DELAY', 0.01):
+            self.client.send(self.session, payload, is_update=False)
+
+        self.client.limiter.on_throttle.assert_called_once_with(0.01)
+        self.client.limiter.on_success.assert_called_once()
+        # The retry takes its own token; the first one is the dispatcher's
+        self.client.limiter.acquire.assert_called_once()
+
     @responses.activate
     def test_429_exhausts_retries(self):
         for _ in range(5):
@@ -80,3 +126,133 @@ class TestApiCommunication(TestCase):
         with patch('integrator.clients.eshop_client.RETRY_BASE_DELAY', 0.01):
             with self.assertRaisesRegex(Exception, "Rate limit exceeded"):
                 self.client.send(self.session, payload, is_update=False)
+
+
+class TestBatchSend(TestCase):
+    def setUp(self):
+        self.client = EshopClient()
+        self.session = self.client.make_session()
+
+    def test_batch_disabled_by_default(self):
+        self.assertFalse(self.client.supports_batch)
+        self.assertTrue(EshopClient(batch=True).supports_batch)
+
+    @responses.activate
+    def test_reports_per_item_outcome(self):
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/batch/",
+            json={"results": [
+                {"sku": "SKU-001", "status": 201},
+                {"sku": "SKU-002", "status": 422, "error": "invalid price"},
+            ]},
+            status=200,
+        )
+
+        payloads = [
+            {"sku": "SKU-001", "title": "A", "price": 100, "stock": 1, "color": "N/A"},
+            {"sku": "SKU-002", "title": "B", "price": -1, "stock": 1, "color": "N/A"},
+            {"sku": "SKU-003", "title": "C", "price": 100, "stock": 1, "color": "N/A"},
+        ]
+        results = self.client.send_batch(self.session, payloads)
+
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual([p['sku'] for p, _ in results], ["SKU-001", "SKU-002", "SKU-003"])
+        self.assertIsNone(results[0][1])
+        self.assertIn("invalid price", str(results[1][1]))
+        self.assertIn("missing", str(results[2][1]))
+
+    @responses.activate
+    def test_batch_retries_on_429(self):
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/batch/",
+            json={"error": "rate limited"},
+            status=429,
+            headers={"Retry-After": "0.01"},
+        )
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/batch/",
+            json={"results": [{"sku": "SKU-001", "status": 200}]},
+            status=200,
+        )
+
+        payloads = [{"sku": "SKU-001", "title": "A", "price": 100, "stock": 1, "color": "N/A"}]
+        with patch('integrator.clients.eshop_client.RETRY_BASE_DELAY', 0.01):
+            results = self.client.send_batch(self.session, payloads)
+
+        self.assertIsNone(results[0][1])
+        self.assertEqual(len(responses.calls), 2)
+
+
+class TestTransport(TestCase):
+    def setUp(self):
+        transport.close_sessions()
+        self.addCleanup(transport.close_sessions)
+        self.client = EshopClient()
+
+    def test_session_reused_per_process(self):
+        self.client.pool_size = 8
+        session = self.client.make_session()
+        self.assertIs(self.client.make_session(), session)
+        self.client.pool_size = 2
+        self.assertIsNot(self.client.make_session(), session)
+
+        adapter = session.get_adapter(ESHOP_BASE_URL)
+        self.assertEqual(adapter._pool_maxsize, 8)
+        self.assertTrue(adapter._pool_block)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), adapter.socket_options)
+
+    def test_pool_size_setting_wins(self):
+        self.client.pool_size = 4
+        with patch('integrator.clients.eshop_client.POOL_SIZE', 12):
+            session = self.client.make_session()
+        self.assertEqual(session.get_adapter(ESHOP_BASE_URL)._pool_maxsize, 12)
+
+    def test_forked_process_gets_own_session(self):
+        session = self.client.make_session()
+        with patch('integrator.clients.transport.os.getpid', return_value=-1):
+            self.assertIsNot(self.client.make_session(), session)
+
+    def test_reuse_can_be_disabled(self):
+        with patch('integrator.clients.transport.SESSION_REUSE', False):
+            self.assertIsNot(self.client.make_session(), self.client.make_session())
+
+    @responses.activate
+    def test_gzip_request_body(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=201)
+        small = {"sku": "S", "title": "x", "price": 1, "stock": 1, "color": "N/A"}
+        large = dict(small, title="Kávovar " * 200)
+
+        with patch('integrator.clients.transport.GZIP_MIN_BYTES', 1024):
+            self.client.send(self.client.make_session(), small)
+            self.client.send(self.client.make_session(), large)
+
+        plain, compressed = (call.request for call in responses.calls)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(compressed.body)), large)
+
+    def test_connections_reused_across_runs(self):
+        catalog = [
+            {"id": f"SKU-{i:03d}", "title": f"Produkt {i}", "price_vat_excl": 100 + i,
+             "stocks": {"praha": i}, "attributes": {}}
+            for i in range(40)
+        ]
+        with FakeEshop() as eshop, patch('integrator.clients.transport.GZIP_MIN_BYTES', 1):
+            for run in range(2):
+                source = MagicMock()
+                source.iter_products.side_effect = lambda: iter(
+                    [dict(raw, price_vat_excl=raw['price_vat_excl'] + run) for raw in catalog]
+                )
+                result = SyncOrchestrator(
+                    source=source, client=EshopClient(base_url=eshop.base_url),
+                    limiter=TokenBucket(rate=10000, capacity=10000), concurrency=4,
+                ).run()
+                self.assertEqual(result['synced'], 40)
+
+        self.assertEqual(eshop.requests, 80)
+        self.assertEqual(len(eshop.products), 40)
+        # One pooled keep-alive connection per request in flight, kept between runs
+        self.assertLessEqual(eshop.connections, 4)
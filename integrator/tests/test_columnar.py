@@ -0,0 +1,64 @@
+import random
+from unittest import skipUnless
+
+from django.test import TestCase
+
+from integrator import columnar
+from integrator.transforms import prepare_products
+
+
+def _random_raw(rng, i):
+    price = rng.choice([
+        round(rng.uniform(0, 100_000), rng.randint(0, 4)),
+        rng.randint(0, 10 ** 7),
+        rng.randint(0, 10 ** 6) / 100 + 0.005,  # near a half cent
+        -rng.uniform(0, 100),
+        None,
+        "12.5",
+        True,
+    ])
+    stocks = rng.choice([
+        {f"w{j}": rng.choice([rng.randint(-5, 500), rng.uniform(0, 50), "N/A", None]) for j in range(rng.randint(1, 4))},
+        {},
+        None,
+        [1, 2],
+    ])
+    attributes = rng.choice([{"color": "černá"}, {"color": None}, {}, None, "x", {"size": "L"}])
+    return {"id": rng.choice([f"SKU-{i}", f"SKU-{i}", ""]), "title": f"Produkt {i}",
+            "price_vat_excl": price, "stocks": stocks, "attributes": attributes}
+
+
+@skipUnless(columnar.AVAILABLE, "numpy not installed")
+class TestColumnarTransform(TestCase):
+    def test_matches_per_record_transform(self):
+        rng = random.Random(15)
+        raws = [_random_raw(rng, i) for i in range(5000)]
+        self.assertEqual(columnar.prepare_columns(raws), prepare_products(raws))
+
+    def test_rounding_is_bit_exact(self):
+        rng = random.Random(2)
+        values = [rng.randint(0, 10 ** 8) / 100 for _ in range(20_000)]
+        values += [x + 0.005 for x in values[:5000]] + [0.0, -0.0, 1e300, 0.125, 2.675]
+        vat = [v * 1.21 for v in values]
+        rounded = columnar.round_half_even_cents(columnar.np.array(vat)).tolist()
+        self.assertEqual([float(x).hex() for x in rounded], [round(v, 2).hex() for v in vat])
+
+    def test_validation_mask_and_reasons(self):
+        raws = [
+            {"id": "A", "title": "A", "price_vat_excl": 10, "stocks": {"x": 1}},
+            {"id": "B", "title": "B", "price_vat_excl": -1.5, "stocks": {"x": 1}},
+            {"id": "", "title": "C", "price_vat_excl": 10, "stocks": {"x": 1}},
+            {"id": "D", "title": "D", "price_vat_excl": 2e15, "stocks": {"x": 1}},
+        ]
+        valid, reasons = columnar.validate_columns(columnar.ProductColumns(raws))
+        self.assertEqual(valid.tolist(), [True, False, False, False])
+        self.assertEqual(reasons, [None, "B: negative price (-1.5)", "missing SKU", "D: price out of range (2000000000000000.0)"])
+
+    def test_unusual_rows_take_the_scalar_path(self):
+        raws = [
+            {"id": "BIG", "title": "T", "price_vat_excl": 10 ** 20, "stocks": {"x": 2 ** 60}},
+            {"id": "NAN", "title": "T", "price_vat_excl": float('nan'), "stocks": {"x": 1}},
+            {"id": "INF", "title": "T", "price_vat_excl": float('-inf'), "stocks": {"x": 1}},
+            {"id": "SUM", "title": "T", "price_vat_excl": 1, "stocks": {"x": 1, "y": 2 ** 53 - 1, "z": 5}},
+        ]
+        self.assertEqual(columnar.prepare_columns(raws), prepare_products(raws))
@@ -0,0 +1,52 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from integrator.dedup import iter_last_wins, winning_positions
+
+
+class TestWinningPositions(TestCase):
+    KEYS = ["A", "B", "A", 1, "1", None, "B", None]
+
+    def test_last_occurrence_positions_in_order(self):
+        for spill in (False, True):
+            with self.subTest(spill=spill):
+                self.assertEqual(list(winning_positions(self.KEYS, spill=spill)), [2, 3, 4, 6, 7])
+
+    def test_spill_batches(self):
+        keys = [f"SKU-{i % 700}" for i in range(2500)]
+        with patch('integrator.dedup.SPILL_BATCH_SIZE', 300):
+            positions = list(winning_positions(keys, spill=True))
+        self.assertEqual(positions, list(range(1800, 2500)))
+
+    def test_empty(self):
+        self.assertEqual(list(winning_positions([], spill=True)), [])
+
+
+class TestIterLastWins(TestCase):
+    def test_emits_only_winning_records(self):
+        records = [
+            {"id": "A", "v": 1}, {"id": "B", "v": 1}, {"id": "A", "v": 2}, {"id": "C", "v": 1},
+        ]
+        for spill in (False, True):
+            with self.subTest(spill=spill):
+                result = list(iter_last_wins((r["id"] for r in records), iter(records), spill=spill))
+                self.assertEqual(result, [{"id": "B", "v": 1}, {"id": "A", "v": 2}, {"id": "C", "v": 1}])
+
+    def test_early_stop_removes_spill_file(self):
+        created = []
+        real_mkstemp = tempfile.mkstemp
+
+        def mkstemp(**kwargs):
+            fd, path = real_mkstemp(**kwargs)
+            created.append(path)
+            return fd, path
+
+        keys = ["A", "B", "C"]
+        with patch('integrator.dedup.tempfile.mkstemp', side_effect=mkstemp):
+            stream = iter_last_wins(iter(keys), iter(keys), spill=True)
+            self.assertEqual(next(stream), "A")
+            stream.close()
+        self.assertFalse(os.path.exists(created[0]))
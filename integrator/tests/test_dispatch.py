@@ -0,0 +1,110 @@
+import threading
+import time
+
+from django.test import TestCase
+
+from integrator.dispatch import Dispatcher, iter_batches
+from integrator.ratelimit import TokenBucket
+
+
+class SlowClient:
+    def __init__(self, latency=0.05, fail_skus=()):
+        self.latency = latency
+        self.fail_skus = set(fail_skus)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def send(self, session, payload, is_update=False):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if payload['sku'] in self.fail_skus:
+                raise RuntimeError("boom")
+            return payload['sku']
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _items(n):
+    return [({'sku': f'SKU-{i}'}, bool(i % 2), f'ctx-{i}') for i in range(n)]
+
+
+class TestDispatcher(TestCase):
+    def test_keeps_requests_in_flight(self):
+        client = SlowClient(latency=0.05)
+        dispatcher = Dispatcher(client, TokenBucket(rate=1000, capacity=1000), concurrency=4)
+
+        started = time.monotonic()
+        results = list(dispatcher.dispatch(None, _items(16)))
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(len(results), 16)
+        self.assertEqual(client.max_in_flight, 4)
+        # Serial dispatch would need 16 * 0.05 s = 0.8 s
+        self.assertLess(elapsed, 0.6)
+
+    def test_results_carry_item_and_error(self):
+        client = SlowClient(latency=0, fail_skus={'SKU-1'})
+        dispatcher = Dispatcher(client, TokenBucket(rate=1000, capacity=1000), concurrency=2)
+
+        results = {payload['sku']: (is_update, ctx, error)
+                   for payload, is_update, ctx, error in dispatcher.dispatch(None, _items(3))}
+
+        self.assertEqual(results['SKU-0'], (False, 'ctx-0', None))
+        self.assertTrue(results['SKU-1'][0])
+        self.assertIsInstance(results['SKU-1'][2], RuntimeError)
+        self.assertIsNone(results['SKU-2'][2])
+
+    def test_limiter_caps_throughput_across_workers(self):
+        client = SlowClient(latency=0)
+        dispatcher = Dispatcher(client, TokenBucket(rate=50), concurrency=8)
+
+        started = time.monotonic()
+        list(dispatcher.dispatch(None, _items(11)))
+        elapsed = time.monotonic() - started
+
+        # 1 immediate token + 10 more at 50/s
+        self.assertGreaterEqual(elapsed, 0.19)
+
+
+class BatchClient(SlowClient):
+    supports_batch = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def send_batch(self, session, payloads):
+        self.batches.append(len(payloads))
+        return [(p, RuntimeError("rejected") if p['sku'] in self.fail_skus else None) for p in payloads]
+
+
+class TestBatching(TestCase):
+    def test_splits_by_item_count(self):
+        batches = list(iter_batches(range(7), max_items=3, max_bytes=1000, size_of=lambda i: 1))
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_splits_by_bytes(self):
+        batches = list(iter_batches(range(5), max_items=100, max_bytes=25, size_of=lambda i: 10))
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+
+    def test_oversized_item_sent_alone(self):
+        sizes = {0: 5, 1: 50, 2: 5}
+        batches = list(iter_batches(range(3), max_items=100, max_bytes=20, size_of=sizes.get))
+        self.assertEqual(batches, [[0], [1], [2]])
+
+    def test_batch_client_gets_grouped_payloads(self):
+        client = BatchClient(fail_skus={'SKU-3'})
+        dispatcher = Dispatcher(client, TokenBucket(rate=1000, capacity=1000), concurrency=2, batch_size=4)
+
+        results = list(dispatcher.dispatch(None, _items(10)))
+
+        self.assertEqual(sorted(client.batches), [2, 4, 4])
+        errors = {payload['sku']: error for payload, _, _, error in results}
+        self.assertEqual(len(errors), 10)
+        self.assertIsInstance(errors['SKU-3'], RuntimeError)
+        self.assertEqual(sum(1 for e in errors.values() if e is None), 9)
@@ -0,0 +1,105 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch
+
+from integrator import history
+from integrator.models import SyncRun
+from integrator.tasks import cleanup_sync_runs
+
+
+def _metrics(requests, send, p99, rss, rss_scope='run'):
+    return {
+        'wall_seconds': 2.0,
+        'cpu_seconds': 1.0,
+        'stages': {
+            'load': {'wall_seconds': 0.5, 'cpu_seconds': 0.5, 'items': 100, 'items_per_second': 200},
+            'send': {'wall_seconds': send, 'cpu_seconds': 0.1, 'items': requests, 'items_per_second': None},
+        },
+        'http': {'requests': requests, 'retries': 1, 'throttled': 1, 'failed': 0,
+                 'latency_p50_ms': 10.0, 'latency_p90_ms': 20.0, 'latency_p99_ms': p99, 'latency_max_ms': 90.0},
+        'peak_rss_bytes': rss,
+        'peak_rss_scope': rss_scope,
+    }
+
+
+class TestRecordRuns(TestCase):
+    def test_finish_stores_stats_and_metrics(self):
+        run_id = history.start_run(force=True, task_id='abc')
+        history.finish_run(run_id, {
+            'synced': 40, 'skipped_unchanged': 55, 'skipped_invalid': 3, 'errors': 2, 'rate_limit': 4.5,
+            'error_types': {'HTTP 500': 2}, 'invalid_reasons': {'null price': 3},
+            'metrics': _metrics(requests=44, send=8.0, p99=80.0, rss=2**20),
+        })
+
+        run = SyncRun.objects.get(pk=run_id)
+        self.assertEqual(run.status, 'errors')
+        self.assertEqual((run.synced, run.skipped_unchanged, run.skipped_invalid, run.errors), (40, 55, 3, 2))
+        self.assertEqual((run.requests, run.throttled), (44, 1))
+        self.assertEqual(run.requests_per_second, 5.5)
+        self.assertEqual(run.latency_p99_ms, 80.0)
+        self.assertEqual(run.error_types, {'HTTP 500': 2})
+        self.assertEqual(run.invalid_reasons, {'null price': 3})
+        self.assertEqual(run.stages['load']['items'], 100)
+        self.assertEqual(run.task_id, 'abc')
+        self.assertGreaterEqual(run.duration_seconds, 0)
+
+    def test_shard_metrics_combined(self):
+        run_id = history.start_run(shards=2)
+        history.finish_run(run_id, {'synced': 10, 'errors': 0, 'shard_metrics': [
+            _metrics(requests=20, send=4.0, p99=50.0, rss=100),
+            _metrics(requests=10, send=5.0, p99=70.0, rss=300),
+        ]})
+
+        run = SyncRun.objects.get(pk=run_id)
+        self.assertEqual(run.status, 'ok')
+        self.assertEqual(run.requests, 30)
+        self.assertEqual(run.requests_per_second, 7.0)
+        self.assertEqual(run.latency_p99_ms, 70.0)
+        self.assertEqual(run.peak_rss_bytes, 300)
+        self.assertEqual(run.stages['send']['wall_seconds'], 9.0)
+
+    def test_process_lifetime_peak_not_stored(self):
+        run_id = history.start_run()
+        history.finish_run(run_id, {'synced': 1, 'metrics': _metrics(1, 1.0, 10.0, 2**30, rss_scope='process')})
+        self.assertIsNone(SyncRun.objects.get(pk=run_id).peak_rss_bytes)
+
+    def test_history_errors_do_not_fail_sync(self):
+        with patch('integrator.history.SyncRun.objects.create', side_effect=DatabaseError("down")), \
+                self.assertLogs('integrator.history', 'ERROR'):
+            run_id = history.start_run()
+        self.assertIsNone(run_id)
+        history.finish_run(run_id, {'synced': 1})
+
+
+class TestRetention(TestCase):
+    def _run(self, age, status='ok'):
+        return SyncRun.objects.create(started_at=timezone.now() - age, status=status)
+
+    def test_cleanup(self):
+        old = self._run(timedelta(days=100))
+        recent = self._run(timedelta(days=10))
+        stuck = self._run(timedelta(days=2), status='running')
+        active = self._run(timedelta(minutes=5), status='running')
+
+        self.assertEqual(cleanup_sync_runs(), {'deleted': 1, 'abandoned': 1})
+
+        self.assertFalse(SyncRun.objects.filter(pk=old.pk).exists())
+        self.assertEqual(SyncRun.objects.get(pk=recent.pk).status, 'ok')
+        self.assertEqual(SyncRun.objects.get(pk=stuck.pk).status, 'abandoned')
+        self.assertEqual(SyncRun.objects.get(pk=active.pk).status, 'running')
+
+
+class TestSyncRunAdmin(TestCase):
+    def test_changelist_and_filters(self):
+        SyncRun.objects.create(started_at=timezone.now(), status='ok', synced=5)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+        url = reverse('admin:integrator_syncrun_changelist')
+        self.assertContains(self.client.get(url), 'OK')
+        self.assertEqual(self.client.get(url, {'status__exact': 'failed'}).context['cl'].result_count, 0)
+        self.assertEqual(self.client.get(reverse('admin:integrator_syncrun_add')).status_code, 403)
@@ -0,0 +1,61 @@
+import time
+from datetime import timedelta
+
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from integrator.lease import Lease
+from integrator.models import SyncLease
+
+
+class TestLease(TestCase):
+    def test_only_one_holder(self):
+        first, second = Lease(), Lease()
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        # Re-acquiring our own lease just extends it
+        self.assertTrue(first.acquire())
+
+    def test_expired_lease_is_taken_over(self):
+        stale, fresh = Lease(), Lease()
+        stale.acquire()
+        SyncLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertTrue(fresh.acquire())
+        self.assertFalse(stale.renew())
+        self.assertTrue(fresh.renew())
+
+    def test_takeover_keeps_rerun_request(self):
+        stale, trigger, fresh = Lease(), Lease(), Lease()
+        stale.acquire()
+        trigger.request_rerun(force=True)
+        SyncLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertTrue(fresh.acquire())
+        self.assertEqual(fresh.release(), (True, True))
+
+    def test_rerun_request_is_returned_on_release(self):
+        holder, trigger = Lease(), Lease()
+        holder.acquire()
+        self.assertTrue(trigger.request_rerun())
+        self.assertTrue(trigger.request_rerun(force=True))
+        self.assertEqual(holder.release(), (True, True))
+        self.assertFalse(SyncLease.objects.exists())
+
+    def test_rerun_request_without_holder(self):
+        self.assertFalse(Lease().request_rerun())
+        self.assertEqual(Lease().release(), (False, False))
+
+
+class TestLeaseHeartbeat(TransactionTestCase):
+    # The heartbeat thread has its own connection and must see committed rows
+    def test_heartbeat_extends_expiry(self):
+        lease = Lease(ttl=60)
+        lease.acquire()
+        SyncLease.objects.update(expires_at=timezone.now() + timedelta(seconds=1))
+
+        with lease.heartbeat(interval=0.01):
+            deadline = time.monotonic() + 2
+            while SyncLease.objects.get().expires_at < timezone.now() + timedelta(seconds=30):
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
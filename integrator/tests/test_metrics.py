@@ -0,0 +1,182 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import responses
+from django.test import TestCase
+
+from integrator.clients.eshop_client import ESHOP_BASE_URL, EshopClient
+from integrator.metrics import (
+    NullExporter,
+    PrometheusTextfileExporter,
+    StatsdExporter,
+    SyncMetrics,
+    export,
+    merge_summaries,
+    peak_rss_bytes,
+)
+from integrator.sync import SyncOrchestrator, export_merged, merge_stats
+
+
+def _summary():
+    metrics = SyncMetrics()
+    with metrics.stage('load', items=10):
+        pass
+    metrics.observe_request(0.01, 201)
+    return metrics.summary()
+
+
+class TestSyncMetrics(TestCase):
+    def test_nested_stages_are_exclusive(self):
+        metrics = SyncMetrics()
+        with metrics.stage('send'):
+            time.sleep(0.02)
+            with metrics.stage('persist', items=5):
+                time.sleep(0.05)
+        stages = metrics.summary()['stages']
+
+        self.assertGreaterEqual(stages['persist']['wall_seconds'], 0.05)
+        self.assertLess(stages['send']['wall_seconds'], 0.045)
+        self.assertEqual(stages['persist']['items'], 5)
+        self.assertGreater(stages['persist']['items_per_second'], 0)
+
+    def test_http_percentiles(self):
+        metrics = SyncMetrics()
+        for ms in range(100, 0, -1):
+            metrics.observe_request(ms / 1000, 201)
+        metrics.observe_request(0.5, 429)
+        metrics.observe_retry()
+        http = metrics.summary()['http']
+
+        self.assertEqual(http['requests'], 101)
+        self.assertEqual((http['throttled'], http['retries'], http['failed']), (1, 1, 0))
+        self.assertEqual(http['latency_p50_ms'], 51.0)
+        self.assertEqual(http['latency_p99_ms'], 100.0)
+        self.assertEqual(http['latency_max_ms'], 500.0)
+
+    def test_peak_rss_is_per_run(self):
+        ballast = b'x' * (256 * 2**20)
+        earlier_peak = peak_rss_bytes()
+        del ballast
+        summary = SyncMetrics().summary()
+        if summary['peak_rss_scope'] != 'run':
+            self.skipTest("The peak RSS cannot be reset on this platform")
+        # The ballast freed before the run does not count
+        self.assertLess(summary['peak_rss_bytes'], earlier_peak - 128 * 2**20)
+
+    def test_no_requests(self):
+        http = SyncMetrics().summary()['http']
+        self.assertEqual(http['requests'], 0)
+        self.assertIsNone(http['latency_p90_ms'])
+
+
+class TestRunMetrics(TestCase):
+    @responses.activate
+    def test_run_reports_stages_and_http(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=429,
+                      headers={'Retry-After': '0'})
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=201)
+        source = MagicMock()
+        source.iter_products.side_effect = lambda: iter([
+            {"id": f"SKU-{i}", "title": "T", "price_vat_excl": 100, "stocks": {"a": 1}, "attributes": {}}
+            for i in range(3)
+        ])
+        exporter = MagicMock()
+        orchestrator = SyncOrchestrator(source=source, client=EshopClient(), concurrency=1, exporter=exporter)
+
+        with patch('integrator.ratelimit.time.sleep'), patch('integrator.clients.eshop_client.time.sleep'):
+            stats = orchestrator.run()
+
+        metrics = stats['metrics']
+        self.assertLessEqual({'fingerprint', 'load', 'transform', 'dedup', 'lookup', 'send', 'persist'},
+                             set(metrics['stages']))
+        self.assertEqual(metrics['stages']['load']['items'], 3)
+        self.assertEqual(metrics['stages']['persist']['items'], 3)
+        self.assertEqual(metrics['http']['requests'], 4)
+        self.assertEqual(metrics['http']['retries'], 1)
+        self.assertGreater(metrics['peak_rss_bytes'], 0)
+        exporter.export.assert_called_once_with(metrics, stats)
+
+    def test_shard_metrics_kept_side_by_side(self):
+        merged = merge_stats([{'synced': 1, 'metrics': {'a': 1}}, {'synced': 2, 'metrics': {'a': 2}}])
+        self.assertEqual(merged, {'synced': 3, 'shard_metrics': [{'a': 1}, {'a': 2}]})
+
+    def test_shards_leave_export_to_merge(self):
+        source = MagicMock()
+        source.iter_products.side_effect = lambda: iter([])
+        exporter = MagicMock()
+        results = [
+            SyncOrchestrator(source=source, client=EshopClient(), exporter=exporter, shard=(i, 2)).run()
+            for i in range(2)
+        ]
+        exporter.export.assert_not_called()
+
+        stats = merge_stats(results)
+        export_merged(stats, exporter)
+        exporter.export.assert_called_once_with(merge_summaries(stats['shard_metrics']), stats)
+
+    def test_merge_summaries(self):
+        first, second = _summary(), _summary()
+        second['wall_seconds'] = first['wall_seconds'] + 1
+        second['http']['latency_p50_ms'] = 30.0
+        merged = merge_summaries([first, second])
+
+        self.assertEqual(merged['wall_seconds'], second['wall_seconds'])
+        self.assertEqual(merged['stages']['load']['items'], 20)
+        self.assertEqual(merged['http']['requests'], 2)
+        # The slowest shard's percentile is an upper bound
+        self.assertEqual(merged['http']['latency_p50_ms'], 30.0)
+        self.assertIs(merge_summaries([first]), first)
+
+
+class TestExporters(TestCase):
+    def test_statsd(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+            server.bind(('127.0.0.1', 0))
+            server.settimeout(2)
+            StatsdExporter(host='127.0.0.1', port=server.getsockname()[1], prefix='t').export(
+                _summary(), {'synced': 4},
+            )
+            lines = server.recv(65535).decode().splitlines()
+
+        self.assertIn('t.stage.load.items:10|c', lines)
+        self.assertIn('t.http.requests:1|c', lines)
+        self.assertIn('t.http.latency_p50_ms:10.0|g', lines)
+        self.assertIn('t.synced:4|c', lines)
+
+    def test_prometheus_textfile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'integrator.prom')
+            PrometheusTextfileExporter(path).export(_summary(), {'synced': 4})
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+
+        self.assertIn('integrator_sync_stage_items{stage="load"} 10', text)
+        self.assertIn('integrator_sync_products{result="synced"} 4', text)
+        self.assertIn('# TYPE integrator_sync_http gauge', text)
+
+    def test_prometheus_textfile_concurrent_writers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'integrator.prom')
+            threads = [
+                threading.Thread(target=PrometheusTextfileExporter(path).export, args=(_summary(), {'synced': i}))
+                for i in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(os.listdir(tmp), ['integrator.prom'])
+            with open(path, encoding='utf-8') as f:
+                self.assertEqual(f.read().count('# TYPE integrator_sync_wall_seconds'), 1)
+
+    def test_failing_exporter_does_not_fail_sync(self):
+        exporter = MagicMock()
+        exporter.export.side_effect = OSError("unreachable")
+        with self.assertLogs('integrator.metrics', 'ERROR'):
+            export(exporter, _summary(), {})
+        export(NullExporter(), _summary(), {})
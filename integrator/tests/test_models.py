@@ -1,9 +1,41 @@
-from django.test import TestCase
+import hashlib
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
 
 from integrator.models import ProductSyncState
 
 
 class TestProductSyncStateModel(TestCase):
     def test_str(self):
-        state = ProductSyncState.objects.create(sku="SKU-TEST", data_hash="abc123")
+        state = ProductSyncState.objects.create(sku="SKU-TEST", data_hash=b"\x00" * 16)
         self.assertIn("SKU-TEST", str(state))
+
+
+class TestBinaryHashMigration(TransactionTestCase):
+    migrate_from = [('integrator', '0001_initial')]
+    migrate_to = [('integrator', '0002_binary_data_hash')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_hex_hashes_converted_to_digest_prefix(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        OldState = old_apps.get_model('integrator', 'ProductSyncState')
+
+        sha256 = hashlib.sha256(b'{"color": "N/A", "sku": "SKU-001"}')
+        OldState.objects.create(sku="SKU-001", data_hash=sha256.hexdigest())
+        OldState.objects.create(sku="SKU-BAD", data_hash="not-hex")
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        NewState = executor.loader.project_state(self.migrate_to).apps.get_model('integrator', 'ProductSyncState')
+
+        self.assertEqual(bytes(NewState.objects.get(sku="SKU-001").data_hash), sha256.digest()[:16])
+        self.assertEqual(bytes(NewState.objects.get(sku="SKU-BAD").data_hash), b'')
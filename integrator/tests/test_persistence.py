@@ -0,0 +1,198 @@
+import json
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from integrator.models import ProductSyncState
+from integrator.persistence import (
+    SyncStateWriter,
+    UpsertSyncStateWriter,
+    choose_lookup,
+    get_state_writer,
+    load_state_hashes,
+)
+
+
+class TestSyncStateWriter(TestCase):
+    def test_flushes_every_chunk(self):
+        writer = SyncStateWriter(chunk_size=2)
+        for i in range(5):
+            writer.add(f"SKU-{i}", b"hash", is_update=False)
+
+        self.assertEqual(ProductSyncState.objects.count(), 4)
+        self.assertEqual(writer.pending, 1)
+        self.assertEqual(writer.flushes, 2)
+
+        writer.flush()
+        self.assertEqual(ProductSyncState.objects.count(), 5)
+
+    def test_updates_existing_rows(self):
+        ProductSyncState.objects.create(sku="SKU-1", data_hash=b"old")
+
+        with SyncStateWriter(chunk_size=10) as writer:
+            writer.add("SKU-1", b"new", is_update=True)
+            writer.add("SKU-2", b"fresh", is_update=False)
+
+        self.assertEqual(ProductSyncState.objects.get(sku="SKU-1").data_hash, b"new")
+        self.assertEqual(ProductSyncState.objects.get(sku="SKU-2").data_hash, b"fresh")
+
+    def test_crash_keeps_completed_chunks(self):
+        with self.assertRaises(RuntimeError):
+            with SyncStateWriter(chunk_size=3) as writer:
+                for i in range(7):
+                    writer.add(f"SKU-{i}", b"hash", is_update=False)
+                raise RuntimeError("worker died")
+
+        self.assertEqual(ProductSyncState.objects.count(), 7)
+
+    def test_failed_flush_does_not_mask_original_error(self):
+        with patch.object(SyncStateWriter, '_write', side_effect=DatabaseError("flush failed")), \
+                self.assertLogs('integrator.persistence', 'ERROR'):
+            with self.assertRaisesRegex(DatabaseError, 'connection lost'):
+                with SyncStateWriter(chunk_size=10) as writer:
+                    writer.add("SKU-1", b"hash", is_update=False)
+                    raise DatabaseError("connection lost")
+
+
+class TestLoadStateHashes(TestCase):
+    def test_returns_plain_bytes_for_requested_skus(self):
+        ProductSyncState.objects.create(sku="SKU-1", data_hash=b"\x01" * 16)
+        ProductSyncState.objects.create(sku="SKU-2", data_hash=b"\x02" * 16)
+
+        hashes = load_state_hashes(["SKU-1", "SKU-3"])
+
+        self.assertEqual(hashes, {"SKU-1": b"\x01" * 16})
+        self.assertIs(type(hashes["SKU-1"]), bytes)
+
+    def test_strategies_agree(self):
+        ProductSyncState.objects.bulk_create(
+            ProductSyncState(sku=f"SKU-{i}", data_hash=bytes([i % 256]), raw_hash=b"r") for i in range(300)
+        )
+        skus = [f"SKU-{i}" for i in range(0, 600, 3)]
+        expected = {f"SKU-{i}": bytes([i % 256]) for i in range(0, 300, 3)}
+
+        for strategy in ('in', 'scan', 'auto'):
+            with self.subTest(strategy=strategy), patch('integrator.persistence.STATE_LOOKUP_CHUNK_SIZE', 50):
+                self.assertEqual(load_state_hashes(skus, strategy=strategy), expected)
+                with_raw = load_state_hashes(skus, with_raw=True, strategy=strategy)
+                self.assertEqual(with_raw["SKU-3"], (b"\x03", b"r"))
+
+    def test_in_lists_are_chunked(self):
+        ProductSyncState.objects.create(sku="SKU-00007", data_hash=b"d")
+        # Above SQLite's default limit of 32766 variables per statement
+        skus = [f"SKU-{i:05d}" for i in range(40_000)]
+
+        with patch('integrator.persistence.STATE_LOOKUP_CHUNK_SIZE', 10_000), \
+                CaptureQueriesContext(connection) as queries:
+            hashes = load_state_hashes(skus, strategy='in')
+
+        self.assertEqual(hashes, {"SKU-00007": b"d"})
+        self.assertEqual(len(queries), 4)
+
+    def test_scan_is_one_query(self):
+        ProductSyncState.objects.create(sku="SKU-1", data_hash=b"d")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(load_state_hashes(["SKU-1", "SKU-2"], strategy='scan'), {"SKU-1": b"d"})
+        self.assertEqual(len(queries), 1)
+
+    def test_empty_list_skips_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(load_state_hashes([]), {})
+        self.assertEqual(len(queries), 0)
+
+
+class TestChooseLookup(TestCase):
+    def setUp(self):
+        patcher = patch('integrator.persistence.STATE_LOOKUP_CHUNK_SIZE', 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_auto_by_ratio(self):
+        with patch('integrator.persistence.estimate_state_rows', return_value=10_000):
+            self.assertEqual(choose_lookup(50), 'in')
+            self.assertEqual(choose_lookup(1_000), 'in')
+            self.assertEqual(choose_lookup(2_500), 'scan')
+            self.assertEqual(choose_lookup(50_000), 'scan')
+
+    def test_small_lists_never_count_rows(self):
+        with patch('integrator.persistence.estimate_state_rows') as estimate:
+            self.assertEqual(choose_lookup(100), 'in')
+        estimate.assert_not_called()
+
+    def test_explicit_and_unknown(self):
+        self.assertEqual(choose_lookup(10, 'scan'), 'scan')
+        self.assertEqual(choose_lookup(10**6, 'in'), 'in')
+        with self.assertRaises(ValueError):
+            choose_lookup(10, 'temp-table')
+
+
+class TestRawHashes(TestCase):
+    def test_add_stores_raw_hash(self):
+        with SyncStateWriter(chunk_size=10) as writer:
+            writer.add("SKU-1", b"digest", is_update=False, raw_hash=b"raw")
+
+        self.assertEqual(bytes(ProductSyncState.objects.get(sku="SKU-1").raw_hash), b"raw")
+
+    def test_touch_raw_updates_only_raw_hash(self):
+        ProductSyncState.objects.create(sku="SKU-1", data_hash=b"digest", raw_hash=b"old")
+
+        with SyncStateWriter(chunk_size=10) as writer:
+            writer.touch_raw("SKU-1", b"new")
+
+        state = ProductSyncState.objects.get(sku="SKU-1")
+        self.assertEqual(bytes(state.data_hash), b"digest")
+        self.assertEqual(bytes(state.raw_hash), b"new")
+
+    def test_load_with_raw(self):
+        ProductSyncState.objects.create(sku="SKU-1", data_hash=b"d1", raw_hash=b"r1")
+        ProductSyncState.objects.create(sku="SKU-2", data_hash=b"d2")
+
+        self.assertEqual(
+            load_state_hashes(with_raw=True),
+            {"SKU-1": (b"d1", b"r1"), "SKU-2": (b"d2", None)},
+        )
+
+
+class TestWriterSelection(TestCase):
+    def test_auto_uses_split_writer_on_sqlite(self):
+        self.assertIs(type(get_state_writer(kind='auto')), SyncStateWriter)
+
+    def test_auto_uses_upsert_on_postgres(self):
+        with patch('integrator.persistence.connection') as conn:
+            conn.vendor = 'postgresql'
+            self.assertIsInstance(get_state_writer(kind='auto'), UpsertSyncStateWriter)
+
+    def test_explicit_kind(self):
+        writer = get_state_writer(chunk_size=7, kind='upsert')
+        self.assertIsInstance(writer, UpsertSyncStateWriter)
+        self.assertEqual(writer.chunk_size, 7)
+
+
+class TestUpsertSyncStateWriter(TestCase):
+    def test_creates_and_updates_in_one_statement(self):
+        ProductSyncState.objects.create(sku="SKU-1", data_hash=b"old")
+
+        with CaptureQueriesContext(connection) as queries:
+            with UpsertSyncStateWriter(chunk_size=10) as writer:
+                writer.add("SKU-1", b"new", is_update=True)
+                writer.add("SKU-2", b"fresh", is_update=False)
+
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertIn("ON CONFLICT", statements[0])
+        self.assertEqual(ProductSyncState.objects.get(sku="SKU-1").data_hash, b"new")
+        self.assertEqual(ProductSyncState.objects.get(sku="SKU-2").data_hash, b"fresh")
+
+
+class TestBenchStateWriterCommand(TestCase):
+    def test_reports_both_writers(self):
+        out = StringIO()
+        call_command('bench_state_writer', '--sizes', '20', '--chunk-size', '7', '--json', stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual({r['writer'] for r in report['results']}, {'split', 'upsert'})
+        self.assertFalse(ProductSyncState.objects.filter(sku__startswith='BENCH-').exists())
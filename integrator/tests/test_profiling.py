@@ -0,0 +1,159 @@
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import responses
+from django.test import TestCase
+from django.utils import timezone
+
+from integrator import history
+from integrator.clients.eshop_client import ESHOP_BASE_URL, EshopClient
+from integrator.models import SyncRun
+from integrator.profiling import RunProfile, SamplingProfiler
+from integrator.sync import SyncOrchestrator, merge_stats
+from integrator.tasks import sync_products
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(100))
+
+
+def _orchestrator(profile, **kwargs):
+    source = MagicMock()
+    source.fingerprint.return_value = None
+    source.iter_products.side_effect = lambda: iter([
+        {"id": f"SKU-{i}", "title": "Hrnek", "price_vat_excl": 100 + i, "stocks": {"praha": 1}, "attributes": {}}
+        for i in range(20)
+    ])
+    return SyncOrchestrator(source=source, client=EshopClient(), profile=profile, **kwargs)
+
+
+class TestSamplingProfiler(TestCase):
+    def test_folds_sampled_stacks(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        _busy(0.1)
+        profiler.stop()
+
+        self.assertGreater(profiler.ticks, 10)
+        busy = sum(count for stack, count in profiler.stacks.items() if ';_busy (test_profiling.py:' in stack)
+        self.assertGreater(busy, 10)
+        self.assertFalse(any('sync-profiler' in stack for stack in profiler.stacks))
+
+
+class TestRunProfile(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_cprofile_artifacts(self):
+        with RunProfile('cprofile', 'run', directory=self.tmp.name, tracemalloc_top=25) as profile:
+            _busy(0.02)
+
+        names = sorted(os.path.basename(path) for path in profile.artifacts)
+        self.assertEqual(names, ['run.pstats', 'run.tracemalloc.txt', 'run.txt'])
+        stats = pstats.Stats(os.path.join(self.tmp.name, 'run.pstats'))
+        self.assertTrue(any(func[2] == '_busy' for func in stats.stats))
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_sample_snapshot_at_high_point(self):
+        with RunProfile('sample', 'run', directory=self.tmp.name, interval=0.001, tracemalloc_top=25) as profile:
+            _busy(0.05)
+            kept = [bytes(1024) for _ in range(2000)]
+            profile.snapshot()
+            del kept
+
+        folded = Path(self.tmp.name, 'run.folded').read_text()
+        self.assertIn('_busy', folded)
+        report = Path(self.tmp.name, 'run.tracemalloc.txt').read_text()
+        # The list comprehension's 2 MiB were alive at snapshot() and are reported
+        self.assertIn('test_profiling.py', report.splitlines()[2])
+
+    def test_tracemalloc_off_by_default(self):
+        with RunProfile('sample', 'run', directory=self.tmp.name) as profile:
+            self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(sorted(os.path.basename(p) for p in profile.artifacts), ['run.folded', 'run.txt'])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            RunProfile('perf', 'run')
+
+    def test_write_error_does_not_fail(self):
+        blocker = Path(self.tmp.name, 'file')
+        blocker.write_text('')
+        with self.assertLogs('integrator.profiling', 'ERROR'):
+            with RunProfile('sample', 'run', directory=blocker / 'profiles') as profile:
+                pass
+        self.assertEqual(profile.artifacts, [])
+
+
+class TestProfiledSync(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        for patcher in (patch('integrator.profiling.PROFILE_DIR', self.directory),
+                        patch('integrator.profiling.TRACEMALLOC_TOP', 25),
+                        patch('integrator.ratelimit.time.sleep')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _mock_eshop(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={"status": "created"}, status=201)
+
+    @responses.activate
+    def test_orchestrator_reports_artifacts(self):
+        self._mock_eshop()
+        stats = _orchestrator('sample', profile_name='manual').run()
+
+        self.assertEqual(stats['synced'], 20)
+        self.assertEqual(
+            sorted(os.path.basename(path) for path in stats['profile_artifacts']),
+            ['manual.folded', 'manual.tracemalloc.txt', 'manual.txt'],
+        )
+
+    @responses.activate
+    def test_shard_name(self):
+        self._mock_eshop()
+        stats = _orchestrator('cprofile', shard=(0, 2)).run()
+        self.assertTrue(all('-shard-0.' in path for path in stats['profile_artifacts']))
+
+    @responses.activate
+    def test_off_by_default(self):
+        self._mock_eshop()
+        with patch('integrator.sync.RunProfile') as run_profile:
+            stats = _orchestrator(None).run()
+        run_profile.assert_not_called()
+        self.assertNotIn('profile_artifacts', stats)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            _orchestrator('perf')
+
+    def test_merge_concatenates_artifacts(self):
+        merged = merge_stats([{'synced': 1, 'profile_artifacts': ['a']}, {'synced': 1, 'profile_artifacts': ['b']}])
+        self.assertEqual(merged['profile_artifacts'], ['a', 'b'])
+
+    @responses.activate
+    def test_task_argument_profiles_one_run(self):
+        self._mock_eshop()
+        with patch('integrator.tasks._get_source', return_value=_orchestrator(None).source):
+            sync_products(profile='sample')
+            sync_products()
+
+        profiled, plain = SyncRun.objects.order_by('pk')
+        self.assertEqual(len(profiled.profile_artifacts), 3)
+        self.assertTrue(all(f"sync-run-{profiled.pk}." in path for path in profiled.profile_artifacts))
+        self.assertEqual(plain.profile_artifacts, [])
+
+        # Retention removes the artifacts together with the run
+        SyncRun.objects.filter(pk=profiled.pk).update(started_at=timezone.now() - timedelta(days=365))
+        self.assertEqual(history.cleanup_runs(), (1, 0))
+        self.assertFalse(any(os.path.exists(path) for path in profiled.profile_artifacts))
@@ -0,0 +1,279 @@
+import threading
+from unittest import skipUnless
+from unittest.mock import PropertyMock, patch
+
+import redis
+from django.test import TestCase
+
+from integrator.ratelimit import (
+    REDIS_KEY,
+    REDIS_URL,
+    AdaptiveRateLimiter,
+    RedisBucket,
+    TokenBucket,
+    build_limiter,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(TestCase):
+    def test_first_token_is_immediate(self):
+        bucket = TokenBucket(rate=5, clock=FakeClock())
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_reservations_queue_at_configured_rate(self):
+        bucket = TokenBucket(rate=5, clock=FakeClock())
+        waits = [bucket.reserve() for _ in range(4)]
+        self.assertEqual(waits[0], 0.0)
+        for expected, actual in zip([0.2, 0.4, 0.6], waits[1:]):
+            self.assertAlmostEqual(actual, expected)
+
+    def test_tokens_refill_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=5, clock=clock)
+        bucket.reserve()
+        clock.now += 0.2
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_refill_capped_by_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=5, capacity=2, clock=clock)
+        clock.now += 100
+        waits = [bucket.reserve() for _ in range(3)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.2)
+
+    def test_shared_across_threads(self):
+        bucket = TokenBucket(rate=10, clock=FakeClock())
+        waits = []
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(5):
+                wait = bucket.reserve()
+                with lock:
+                    waits.append(wait)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # 20 tokens at 10/s: every reservation gets its own 0.1 s slot
+        self.assertEqual(sorted(round(w, 6) for w in waits), [round(i * 0.1, 6) for i in range(20)])
+
+    def test_acquire_sleeps_for_reservation(self):
+        bucket = TokenBucket(rate=4, clock=FakeClock())
+        with patch('integrator.ratelimit.time.sleep') as mock_sleep:
+            bucket.acquire()
+            bucket.acquire()
+        mock_sleep.assert_called_once_with(0.25)
+
+    def test_pause_holds_back_next_caller(self):
+        bucket = TokenBucket(rate=5, clock=FakeClock())
+        bucket.pause(2.0)
+        self.assertAlmostEqual(bucket.reserve(), 2.2)
+
+    def test_rejects_non_positive_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestAdaptiveRateLimiter(TestCase):
+    def _limiter(self, rate=10, **kwargs):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=rate, clock=clock)
+        kwargs.setdefault('min_rate', 1)
+        kwargs.setdefault('max_rate', 20)
+        return AdaptiveRateLimiter(bucket, clock=clock, **kwargs), clock
+
+    def test_healthy_responses_increase_rate_additively(self):
+        limiter, _ = self._limiter(rate=10)
+        for _ in range(10):
+            limiter.on_success(0.05)
+        # ~ +1 req/s after 10 responses at 10 req/s
+        self.assertAlmostEqual(limiter.rate, 11.0, delta=0.1)
+
+    def test_rate_capped_at_max(self):
+        limiter, _ = self._limiter(rate=19.9, max_rate=20)
+        for _ in range(100):
+            limiter.on_success(0.05)
+        self.assertEqual(limiter.rate, 20)
+
+    def test_unchanged_rate_not_written(self):
+        limiter, _ = self._limiter(rate=20, max_rate=20)
+        with patch.object(TokenBucket, 'rate', new_callable=PropertyMock, return_value=20.0) as rate:
+            for _ in range(5):
+                limiter.on_success(0.05)
+        # Only reads: at max_rate nothing is written back
+        self.assertTrue(all(call.args == () for call in rate.call_args_list))
+
+    def test_throttle_halves_rate_and_pauses(self):
+        limiter, _ = self._limiter(rate=10)
+        limiter.on_throttle(retry_after=1.0)
+        self.assertEqual(limiter.rate, 5)
+        self.assertEqual(limiter.throttled, 1)
+        self.assertGreaterEqual(limiter.bucket.reserve(), 1.0)
+
+    def test_throttle_burst_counts_once_within_cooldown(self):
+        limiter, clock = self._limiter(rate=16)
+        for _ in range(4):
+            limiter.on_throttle()
+        self.assertEqual(limiter.rate, 8)
+        clock.now += 1.0
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 4)
+
+    def test_rate_floored_at_min(self):
+        limiter, clock = self._limiter(rate=2, min_rate=1.5)
+        for _ in range(3):
+            limiter.on_throttle()
+            clock.now += 2
+        self.assertEqual(limiter.rate, 1.5)
+
+    def test_rising_latency_decreases_rate(self):
+        limiter, _ = self._limiter(rate=10)
+        for _ in range(5):
+            limiter.on_success(0.05)
+        before = limiter.rate
+        for _ in range(10):
+            limiter.on_success(0.5)
+        self.assertLess(limiter.rate, before)
+
+
+def _redis_available():
+    try:
+        return redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.2).ping()
+    except redis.RedisError:
+        return False
+
+
+class FakeScript:
+    """Stands in for the registered GCRA script; fails the next ``fail`` calls."""
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.calls = []
+        self.rate = None
+
+    def __call__(self, keys, args):
+        self.calls.append(args)
+        if self.fail:
+            self.fail -= 1
+            raise redis.ConnectionError("down")
+        if args[5] != '':
+            self.rate = args[5]
+        return '0', str(self.rate or args[1])
+
+
+class FakeRedis:
+    def __init__(self, script):
+        self.script = script
+
+    def register_script(self, source):
+        return self.script
+
+
+class TestRedisBucket(TestCase):
+    def test_falls_back_to_local_bucket_when_redis_is_down(self):
+        client = redis.Redis(host='127.0.0.1', port=1, socket_connect_timeout=0.2)
+        fallback = TokenBucket(rate=5, clock=FakeClock())
+        bucket = RedisBucket(client, rate=5, fallback=fallback)
+
+        with self.assertLogs('integrator.ratelimit', level='WARNING'):
+            waits = [bucket.reserve() for _ in range(3)]
+        self.assertEqual(waits[0], 0.0)
+        self.assertAlmostEqual(waits[2], 0.4)
+
+        bucket.rate = 2
+        self.assertEqual(bucket.rate, 2)
+        self.assertEqual(fallback.rate, 2)
+
+    def test_fallback_gets_shard_share(self):
+        limiter = build_limiter(rate=6, share=3, backend='redis')
+        self.assertEqual(limiter.bucket.fallback.rate, 2)
+        limiter.bucket.rate = 3
+        self.assertEqual(limiter.bucket.fallback.rate, 1)
+
+    def test_retries_redis_after_backoff(self):
+        clock = FakeClock()
+        script = FakeScript(fail=1)
+        bucket = RedisBucket(FakeRedis(script), rate=5, clock=clock, fallback=TokenBucket(rate=5, clock=clock))
+
+        with self.assertLogs('integrator.ratelimit', level='WARNING'):
+            bucket.reserve()
+        bucket.reserve()
+        self.assertEqual(len(script.calls), 1)
+
+        clock.now = 1.0
+        with self.assertLogs('integrator.ratelimit', level='INFO') as logs:
+            bucket.reserve()
+        self.assertIn('available again', logs.output[0])
+        self.assertEqual(len(script.calls), 2)
+
+        # Repeated failures back off exponentially
+        script.fail = 2
+        bucket.reserve()
+        clock.now = 2.0
+        bucket.reserve()
+        clock.now = 3.5
+        bucket.reserve()
+        self.assertEqual(len(script.calls), 4)
+        clock.now = 4.0
+        bucket.reserve()
+        self.assertEqual(len(script.calls), 5)
+
+    def test_increases_ride_along_with_reservations(self):
+        script = FakeScript()
+        bucket = RedisBucket(FakeRedis(script), rate=5)
+
+        bucket.rate = 5
+        bucket.rate = 5.5
+        self.assertEqual(script.calls, [])
+        bucket.reserve()
+        self.assertEqual(script.calls[-1][0], 'reserve')
+        self.assertEqual(script.calls[-1][5], 5.5)
+        bucket.reserve()
+        self.assertEqual(script.calls[-1][5], '')
+
+        # Decreases are written at once
+        bucket.rate = 2
+        self.assertEqual(script.calls[-1][0], 'rate')
+        self.assertEqual(script.calls[-1][5], 2.0)
+
+    def test_build_limiter_backends(self):
+        limiter = build_limiter(rate=6, share=3, backend='local')
+        self.assertIsInstance(limiter.bucket, TokenBucket)
+        self.assertEqual(limiter.rate, 2)
+
+        # The shared bucket carries the whole budget regardless of sharding
+        limiter = build_limiter(rate=6, share=3, backend='redis')
+        self.assertIsInstance(limiter.bucket, RedisBucket)
+        self.assertEqual(limiter.rate, 6)
+        self.assertEqual(limiter.max_rate, 6)
+
+    @skipUnless(_redis_available(), "needs a Redis server at ESHOP_API_RATE_LIMIT_REDIS_URL")
+    def test_workers_share_one_budget(self):
+        client = redis.Redis.from_url(REDIS_URL)
+        key = f"{REDIS_KEY}:test"
+        client.delete(key)
+        self.addCleanup(client.delete, key)
+        workers = [RedisBucket(client, rate=5, key=key) for _ in range(2)]
+
+        waits = [workers[i % 2].reserve() for i in range(4)]
+        self.assertEqual(waits[0], 0.0)
+        for expected, actual in zip([0.2, 0.4, 0.6], waits[1:]):
+            self.assertAlmostEqual(actual, expected, delta=0.05)
+
+        # A rate change by one worker applies to the other
+        workers[0].rate = 1
+        workers[1].reserve()
+        self.assertEqual(workers[1].rate, 1)
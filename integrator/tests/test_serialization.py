@@ -0,0 +1,118 @@
+import json
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from integrator import serialization
+from integrator.serialization import load_backend, payload_bytes
+from integrator.transforms import Payload, compute_digests, prepare_products, validate_product
+
+
+def _installed(name):
+    try:
+        load_backend(name)
+    except ImportError:
+        return False
+    return True
+
+
+SAMPLES = [
+    {"sku": "SKU-001", "title": "Kávovar \"Espresso\"\n", "price": 15004.61, "stock": 8, "color": "stříbrná"},
+    {"sku": "SKU-003", "title": "Mlýnek", "price": 1815.0, "stock": 50, "color": None},
+    {"sku": "X", "title": "", "price": 0.1, "stock": -3, "color": {"nested": [1, 2.5, True]}},
+]
+
+
+class TestBackends(TestCase):
+    def test_stdlib_output_is_compact_utf8(self):
+        _, dumps, loads = load_backend('json')
+        self.assertEqual(dumps({"a": "č", "b": [1, 2]}), '{"a":"č","b":[1,2]}'.encode('utf-8'))
+        self.assertEqual(loads(b'{"a":1}'), {"a": 1})
+
+    def test_unknown_backend_rejected(self):
+        with self.assertRaises(ValueError):
+            load_backend('yaml')
+
+    def test_fast_backends_match_stdlib_bytes(self):
+        _, reference, _ = load_backend('json')
+        for name in ('orjson', 'msgspec'):
+            if not _installed(name):
+                continue
+            _, dumps, loads = load_backend(name)
+            for sample in SAMPLES:
+                with self.subTest(backend=name, sku=sample['sku']):
+                    self.assertEqual(dumps(sample), reference(sample))
+                    self.assertEqual(loads(dumps(sample)), sample)
+
+    @skipUnless(_installed('orjson'), "orjson not installed")
+    def test_unencodable_values_fall_back_to_stdlib(self):
+        _, dumps, _ = load_backend('orjson')
+        self.assertEqual(dumps({"stock": 2 ** 70}), b'{"stock":1180591620717411303424}')
+
+    def test_fast_backends_accept_what_stdlib_accepts(self):
+        document = b'{"price": NaN, "big": Infinity, "huge": 1e400, "stock": 123456789012345678901234567890}'
+        expected = json.dumps(json.loads(document))
+        for name in tuple(n for n in ('orjson', 'msgspec') if _installed(n)):
+            _, _, loads = load_backend(name)
+            with self.subTest(backend=name):
+                self.assertEqual(json.dumps(loads(document)), expected)
+                self.assertEqual(json.dumps(loads(memoryview(document))), expected)
+                self.assertEqual(json.dumps(loads(document.decode())), expected)
+
+    def test_decode_errors_are_value_errors(self):
+        for name in ('json',) + tuple(n for n in ('orjson', 'msgspec') if _installed(n)):
+            _, _, loads = load_backend(name)
+            with self.subTest(backend=name), self.assertRaises(ValueError):
+                loads(b'{"broken":')
+
+
+class TestDigestsAcrossBackends(TestCase):
+    RAWS = [
+        {"id": "P1", "title": "Hrnek", "price_vat_excl": 0.01, "stocks": {"a": 1}, "attributes": {"color": "bílá"}},
+        {"id": "P2", "title": "Velký", "price_vat_excl": 9.9e14, "stocks": {"a": 1}, "attributes": {}},
+        {"id": "P3", "title": 1e-07, "price_vat_excl": 12.5, "stocks": {"a": 1}, "attributes": {"color": 1e16}},
+        {"id": 7, "title": "Int SKU", "price_vat_excl": 3, "stocks": {"a": 1}, "attributes": {"color": [0.5, 1e-5]}},
+    ]
+
+    def test_digests_and_bodies_do_not_depend_on_backend(self):
+        results = {}
+        for name in ('json',) + tuple(n for n in ('orjson', 'msgspec') if _installed(n)):
+            _, dumps, _ = load_backend(name)
+            with patch('integrator.serialization.dumps', dumps):
+                prepared = prepare_products(self.RAWS)
+                results[name] = [(sku, payload.body, digest) for sku, payload, digest in prepared]
+        reference = results.pop('json')
+        self.assertIn(b'"title":1e-07', reference[2][1])
+        for name, result in results.items():
+            with self.subTest(backend=name):
+                self.assertEqual(result, reference)
+
+    def test_plain_dict_payloads_follow_the_same_rule(self):
+        payload = {"sku": "X", "title": 1e-07, "price": 1.0, "stock": 1, "color": None}
+        digests = set()
+        for name in ('json',) + tuple(n for n in ('orjson', 'msgspec') if _installed(n)):
+            _, dumps, _ = load_backend(name)
+            with patch('integrator.serialization.dumps', dumps):
+                digests.add(compute_digests([payload])[0])
+        self.assertEqual(len(digests), 1)
+
+    def test_non_finite_and_huge_prices_rejected(self):
+        for price, reason in ((float('nan'), "non-finite price"), (float('inf'), "non-finite price"),
+                              (float('-inf'), "non-finite price"), (1e16, "price out of range (1e+16)")):
+            with self.subTest(price=price):
+                self.assertEqual(
+                    validate_product({"id": "X", "price_vat_excl": price, "stocks": {"a": 1}}),
+                    (False, f"X: {reason}"),
+                )
+
+
+class TestPayloadBytes(TestCase):
+    def test_reuses_encoded_body(self):
+        payload = Payload(**SAMPLES[0])
+        payload.body = b'{"cached":true}'
+        self.assertEqual(payload_bytes(payload), b'{"cached":true}')
+
+    def test_encodes_plain_dicts(self):
+        self.assertEqual(json.loads(payload_bytes(SAMPLES[1])), SAMPLES[1])
+        self.assertIn(serialization.NAME, serialization.BACKENDS)
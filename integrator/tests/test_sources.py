@@ -1,10 +1,13 @@
 import json
 import os
+import shutil
 import tempfile
+from unittest.mock import patch
 
 from django.test import TestCase
 
 from integrator.sources.json_source import JsonFileSource
+from integrator.transforms import fingerprint_raw
 
 
 class TestLoadErpData(TestCase):
@@ -23,3 +26,197 @@ class TestLoadErpData(TestCase):
         result = JsonFileSource().load()
         self.assertIsInstance(result, list)
         self.assertTrue(len(result) > 0)
+
+
+class TestIterProducts(TestCase):
+    def _write(self, content, suffix='.json'):
+        with tempfile.NamedTemporaryFile(mode='w', suffix=suffix, delete=False, encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def test_streams_json_array(self):
+        data = [{"id": f"SKU-{i}", "title": "Kávovar", "price_vat_excl": i * 1.5} for i in range(50)]
+        path = self._write(json.dumps(data, ensure_ascii=False, indent=2))
+        # Tiny chunks force elements to straddle chunk boundaries
+        result = list(JsonFileSource(path=path, chunk_size=7).iter_products())
+        self.assertEqual(result, data)
+
+    def test_streams_scalars_across_chunks(self):
+        path = self._write('[12345678, 1.25, "abc", null]')
+        result = list(JsonFileSource(path=path, chunk_size=3).iter_products())
+        self.assertEqual(result, [12345678, 1.25, "abc", None])
+
+    def test_empty_array(self):
+        path = self._write('  [ ]  ')
+        self.assertEqual(list(JsonFileSource(path=path).iter_products()), [])
+
+    def test_streams_ndjson(self):
+        data = [{"id": "A"}, {"id": "B"}]
+        path = self._write('\n'.join(json.dumps(d) for d in data) + '\n\n', suffix='.ndjson')
+        source = JsonFileSource(path=path)
+        self.assertEqual(list(source.iter_products()), data)
+        self.assertEqual(source.load(), data)
+
+    def test_detects_ndjson_without_suffix(self):
+        path = self._write('{"id": "A"}\n{"id": "B"}\n')
+        self.assertTrue(JsonFileSource(path=path).is_ndjson())
+
+    def test_default_file_streams_same_as_load(self):
+        source = JsonFileSource()
+        self.assertEqual(list(source.iter_products()), source.load())
+
+    def test_malformed_array_raises(self):
+        path = self._write('[{"id": "A"} {"id": "B"}]')
+        with self.assertRaises(ValueError):
+            list(JsonFileSource(path=path).iter_products())
+
+    def test_data_after_array_raises(self):
+        for content in ('[{"id": "A"}]garbage', '[{"id": "A"}]\n[{"id": "B"}]', '[] x'):
+            path = self._write(content)
+            for use_mmap in (False, True):
+                with self.subTest(content=content, use_mmap=use_mmap), self.assertRaises(ValueError):
+                    list(JsonFileSource(path=path, chunk_size=4, use_mmap=use_mmap).iter_products())
+            with self.subTest(content=content, load=True), self.assertRaises(ValueError):
+                JsonFileSource(path=path).load()
+        # Trailing whitespace is fine
+        path = self._write('[{"id": "A"}] \n\n')
+        self.assertEqual(list(JsonFileSource(path=path, chunk_size=4).iter_products()), [{"id": "A"}])
+        self.assertEqual(list(JsonFileSource(path=path, use_mmap=True).iter_products()), [{"id": "A"}])
+
+
+class TestFingerprints(TestCase):
+    def _write(self, content, suffix='.json'):
+        with tempfile.NamedTemporaryFile(mode='w', suffix=suffix, delete=False, encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def test_array_fingerprints_source_text(self):
+        path = self._write('[\n  {"id": "A", "x": 1},\n  {"id": "B"}\n]')
+        result = list(JsonFileSource(path=path, chunk_size=4).iter_fingerprinted())
+        self.assertEqual(result, [
+            ({"id": "A", "x": 1}, fingerprint_raw('{"id": "A", "x": 1}')),
+            ({"id": "B"}, fingerprint_raw('{"id": "B"}')),
+        ])
+
+    def test_ndjson_fingerprints_line(self):
+        path = self._write('{"id": "A"}\n', suffix='.ndjson')
+        self.assertEqual(
+            list(JsonFileSource(path=path).iter_fingerprinted()),
+            [({"id": "A"}, fingerprint_raw('{"id": "A"}'))],
+        )
+
+    def test_changed_record_changes_fingerprint(self):
+        [(_, first)] = JsonFileSource(path=self._write('[{"id": "A", "p": 1}]')).iter_fingerprinted()
+        [(_, second)] = JsonFileSource(path=self._write('[{"id": "A", "p": 2}]')).iter_fingerprinted()
+        self.assertNotEqual(first, second)
+
+
+class TestFileChangeDetection(TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.state_dir)
+        self.path = os.path.join(self.state_dir, 'erp.json')
+        self._write('[{"id": "A"}]')
+
+    def _write(self, content):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def _source(self):
+        return JsonFileSource(path=self.path, state_dir=self.state_dir)
+
+    def test_nothing_processed_initially(self):
+        source = self._source()
+        self.assertIsNotNone(source.fingerprint())
+        self.assertIsNone(source.last_processed())
+
+    def test_processed_fingerprint_persists(self):
+        source = self._source()
+        source.mark_processed(source.fingerprint())
+        self.assertEqual(self._source().fingerprint(), self._source().last_processed())
+
+    def test_content_change_changes_fingerprint(self):
+        before = self._source().fingerprint()
+        self._write('[{"id": "B"}]')
+        os.utime(self.path, ns=(1, 1))
+        self.assertNotEqual(self._source().fingerprint(), before)
+
+    def test_touch_without_content_change_keeps_fingerprint(self):
+        before = self._source().fingerprint()
+        os.utime(self.path, ns=(10**18, 10**18))
+        self.assertEqual(self._source().fingerprint(), before)
+
+    def test_unchanged_stat_skips_reading_file(self):
+        source = self._source()
+        source.fingerprint()
+        with patch('integrator.sources.json_source.hashlib.blake2b') as blake2b:
+            source.fingerprint()
+        blake2b.assert_not_called()
+
+    def test_unwritable_state_dir_still_fingerprints(self):
+        # A file in place of the directory: every write fails
+        source = JsonFileSource(path=self.path, state_dir=os.path.join(self.path, 'state'))
+        with self.assertLogs('integrator.sources.json_source', 'WARNING'):
+            digest = source.fingerprint()
+        self.assertEqual(digest, self._source().fingerprint())
+
+
+class TestMappedSource(TestCase):
+    def _write(self, content, suffix='.json'):
+        with tempfile.NamedTemporaryFile(mode='w', suffix=suffix, delete=False, encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def _array(self):
+        data = [
+            {"id": f"SKU-{i}", "title": 'Kávovar "x", [y] {z}\\', "stocks": {"a": [i, {"b": i}]}}
+            for i in range(40)
+        ]
+        return data, self._write(json.dumps(data, ensure_ascii=False, indent=2))
+
+    def test_array_matches_streaming_parser(self):
+        data, path = self._array()
+        mapped = list(JsonFileSource(path=path, use_mmap=True).iter_fingerprinted())
+        streamed = list(JsonFileSource(path=path, use_mmap=False).iter_fingerprinted())
+        self.assertEqual([raw for raw, _ in mapped], data)
+        self.assertEqual(mapped, streamed)
+
+    def test_ndjson_matches_line_parser(self):
+        path = self._write('{"id": "A"}\r\n\n  {"id": "B", "t": "č"}\n', suffix='.ndjson')
+        mapped = list(JsonFileSource(path=path, use_mmap=True).iter_fingerprinted())
+        self.assertEqual(mapped, list(JsonFileSource(path=path, use_mmap=False).iter_fingerprinted()))
+        self.assertEqual([raw for raw, _ in mapped], [{"id": "A"}, {"id": "B", "t": "č"}])
+
+    def test_empty_inputs(self):
+        self.assertEqual(list(JsonFileSource(path=self._write(' [ ] '), use_mmap=True).iter_products()), [])
+        self.assertEqual(list(JsonFileSource(path=self._write('', '.ndjson'), use_mmap=True).iter_products()), [])
+
+    def test_malformed_array_raises(self):
+        for content in ('[{"id": "A"} {"id": "B"}]', '[{"id": "A"},, {"id": "B"}]', '[{"id": "A"},', '{"id": "A"}]'):
+            with self.subTest(content=content), self.assertRaises(ValueError):
+                list(JsonFileSource(path=self._write(content), use_mmap=True).iter_products())
+
+    def test_non_finite_price_on_every_path(self):
+        records = ['{"id": "A", "price_vat_excl": NaN}', '{"id": "B", "price_vat_excl": 1e400, "n": 18446744073709551616}']
+        expected = json.dumps([json.loads(record) for record in records])
+        for suffix, content in (('.json', '[' + ','.join(records) + ']'), ('.ndjson', '\n'.join(records))):
+            path = self._write(content, suffix)
+            for use_mmap in (False, True):
+                with self.subTest(suffix=suffix, use_mmap=use_mmap):
+                    source = JsonFileSource(path=path, use_mmap=use_mmap)
+                    self.assertEqual(json.dumps(list(source.iter_products())), expected)
+                    self.assertEqual(json.dumps(source.load()), expected)
+
+    def test_byte_ranges_cover_every_record_once(self):
+        data, path = self._array()
+        ndjson_path = self._write(''.join(json.dumps(d) + '\n' for d in data), suffix='.ndjson')
+        for source_path in (path, ndjson_path):
+            source = JsonFileSource(path=source_path)
+            for parts in (1, 3, 7, 100):
+                with self.subTest(path=source_path, parts=parts):
+                    ranges = source.byte_ranges(parts)
+                    self.assertLessEqual(len(ranges), parts)
+                    self.assertEqual([raw for start, end in ranges for raw in source.iter_range(start, end)], data)
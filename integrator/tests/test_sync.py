@@ -1,11 +1,23 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import requests
 import responses
 from unittest.mock import patch, MagicMock
 
 from django.test import TestCase
 
+from integrator.clients.base import BaseClient
 from integrator.clients.eshop_client import EshopClient, ESHOP_BASE_URL
 from integrator.models import ProductSyncState
-from integrator.sync import SyncOrchestrator
+from integrator.ratelimit import TokenBucket
+from integrator.sync import UNCHANGED, SyncOrchestrator, merge_stats, processed_marker
+from integrator.benchmarks.fake_eshop import FakeEshop
+from integrator.transforms import fingerprint_raw, prepare_products, shard_of
 
 
 def _erp_data():
@@ -29,7 +41,7 @@ def _erp_data():
 
 def _make_orchestrator(erp_data):
     source = MagicMock()
-    source.load.return_value = erp_data
+    source.iter_products.side_effect = lambda: iter(erp_data)
     client = EshopClient()
     return SyncOrchestrator(source=source, client=client)
 
@@ -45,13 +57,15 @@ class TestDeltaSync(TestCase):
         )
 
         orchestrator = _make_orchestrator(_erp_data())
-        with patch('integrator.sync.time.sleep'):
+        with patch('integrator.ratelimit.time.sleep'):
             result = orchestrator.run()
 
         # SKU-002 neg price, SKU-004 null price -> invalid
         self.assertEqual(result['synced'], 4)
         self.assertEqual(result['skipped_invalid'], 2)
         self.assertEqual(ProductSyncState.objects.count(), 4)
+        self.assertIn('rate_limit', result)
+        self.assertEqual(result['invalid_reasons'], {'negative price': 1, 'null price': 1})
 
     @responses.activate
     def test_second_sync_skips_unchanged(self):
@@ -63,7 +77,7 @@ class TestDeltaSync(TestCase):
         )
 
         orchestrator = _make_orchestrator(_erp_data())
-        with patch('integrator.sync.time.sleep'):
+        with patch('integrator.ratelimit.time.sleep'):
             orchestrator.run()
             result = orchestrator.run()
 
@@ -87,7 +101,7 @@ class TestDeltaSync(TestCase):
 
         erp_data = _erp_data()
         orchestrator = _make_orchestrator(erp_data)
-        with patch('integrator.sync.time.sleep'):
+        with patch('integrator.ratelimit.time.sleep'):
             orchestrator.run()
 
         modified_data = [p.copy() for p in erp_data]
@@ -101,13 +115,49 @@ class TestDeltaSync(TestCase):
         )
 
         orchestrator = _make_orchestrator(modified_data)
-        with patch('integrator.sync.time.sleep'):
+        with patch('integrator.ratelimit.time.sleep'):
             result = orchestrator.run()
 
         self.assertEqual(result['synced'], 1)
         self.assertEqual(result['skipped_unchanged'], 3)
 
 
+class DocumentedClient(BaseClient):
+    """The custom client example from ARCHITECTURE.md."""
+
+    def make_session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update({'Authorization': 'Bearer customer-b-token'})
+        return session
+
+    def send(self, session, payload, is_update=False):
+        assert isinstance(payload, dict)
+        url = f"https://api.customer-b.com/products/{payload.get('sku')}"
+        resp = session.put(url, json=payload)
+        resp.raise_for_status()
+        return resp
+
+
+class TestCustomClient(TestCase):
+    @responses.activate
+    def test_client_gets_plain_dicts(self):
+        responses.add(responses.PUT, "https://api.customer-b.com/products/SKU-001", status=200)
+        source = MagicMock()
+        source.fingerprint.return_value = None
+        source.iter_products.side_effect = lambda: iter(_erp_data()[:1])
+        client = DocumentedClient()
+        orchestrator = SyncOrchestrator(source=source, client=client, limiter=TokenBucket(rate=1000, capacity=1000),
+                                        concurrency=3)
+        self.assertEqual(client.pool_size, 3)
+
+        result = orchestrator.run()
+
+        self.assertEqual((result['synced'], result['errors']), (1, 0))
+        self.assertEqual(json.loads(responses.calls[0].request.body), {
+            'sku': 'SKU-001', 'title': 'Kávovar Espresso', 'price': 15004.6, 'stock': 8, 'color': 'stříbrná',
+        })
+
+
 class TestSyncErrors(TestCase):
     @responses.activate
     def test_api_error_counted(self):
@@ -124,8 +174,372 @@ class TestSyncErrors(TestCase):
         ]
 
         orchestrator = _make_orchestrator(erp_data)
-        with patch('integrator.sync.time.sleep'):
+        with patch('integrator.ratelimit.time.sleep'):
             result = orchestrator.run()
 
         self.assertEqual(result['errors'], 1)
         self.assertEqual(result['synced'], 0)
+        self.assertEqual(result['error_types'], {'HTTP 500': 1})
+
+
+class TestStreamingDeduplication(TestCase):
+    @responses.activate
+    def test_last_occurrence_wins(self):
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/",
+            json={"status": "created"},
+            status=201,
+        )
+
+        erp_data = [
+            {"id": "SKU-001", "title": "Old", "price_vat_excl": 100,
+             "stocks": {"a": 1}, "attributes": {}},
+            {"id": "SKU-001", "title": "New", "price_vat_excl": 200,
+             "stocks": {"a": 1}, "attributes": {}},
+            {"id": "SKU-002", "title": "Valid", "price_vat_excl": 100,
+             "stocks": {"a": 1}, "attributes": {}},
+            {"id": "SKU-002", "title": "Invalid", "price_vat_excl": None,
+             "stocks": {"a": 1}, "attributes": {}},
+        ]
+
+        orchestrator = _make_orchestrator(erp_data)
+        with patch('integrator.ratelimit.time.sleep'):
+            result = orchestrator.run()
+
+        self.assertEqual(result['synced'], 1)
+        self.assertEqual(result['skipped_invalid'], 1)
+        self.assertEqual(len(responses.calls), 1)
+        self.assertIn(b'"New"', responses.calls[0].request.body)
+
+
+class TestAdaptiveRateLimit(TestCase):
+    @responses.activate
+    def test_throttling_lowers_reported_rate(self):
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/",
+            json={"error": "rate limited"},
+            status=429,
+            headers={"Retry-After": "0"},
+        )
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/",
+            json={"status": "created"},
+            status=201,
+        )
+
+        erp_data = [
+            {"id": "SKU-001", "title": "Test", "price_vat_excl": 100,
+             "stocks": {"a": 1}, "attributes": {}},
+        ]
+
+        orchestrator = _make_orchestrator(erp_data)
+        self.assertIs(orchestrator.client.limiter, orchestrator.limiter)
+        with patch('integrator.ratelimit.time.sleep'), \
+                patch('integrator.clients.eshop_client.time.sleep'):
+            result = orchestrator.run()
+
+        self.assertEqual(result['synced'], 1)
+        self.assertLess(result['rate_limit'], 5)
+
+
+class TestBatchSync(TestCase):
+    def _catalog(self, n):
+        return [
+            {"id": f"SKU-{i:04d}", "title": f"Produkt {i}", "price_vat_excl": 100 + i,
+             "stocks": {"praha": i}, "attributes": {}}
+            for i in range(n)
+        ]
+
+    def _run(self, eshop, batch_enabled):
+        source = MagicMock()
+        source.iter_products.side_effect = lambda: iter(self._catalog(60))
+        orchestrator = SyncOrchestrator(
+            source=source,
+            client=EshopClient(base_url=eshop.base_url, batch=batch_enabled),
+            limiter=TokenBucket(rate=10000, capacity=10000),
+            concurrency=1,
+        )
+        orchestrator.dispatcher.batch_size = 25
+        started = time.monotonic()
+        result = orchestrator.run()
+        return result, time.monotonic() - started
+
+    def test_batching_cuts_requests_and_wall_time(self):
+        with FakeEshop(latency=0.01) as eshop:
+            single, single_time = self._run(eshop, batch_enabled=False)
+            single_requests = eshop.requests
+        ProductSyncState.objects.all().delete()
+
+        with FakeEshop(latency=0.01) as eshop:
+            batched, batched_time = self._run(eshop, batch_enabled=True)
+            batched_requests = eshop.requests
+            self.assertEqual(len(eshop.products), 60)
+
+        self.assertEqual(single['synced'], 60)
+        self.assertEqual(batched['synced'], 60)
+        self.assertEqual(single_requests, 60)
+        self.assertEqual(batched_requests, 3)
+        self.assertLess(batched_time, single_time)
+        self.assertEqual(ProductSyncState.objects.count(), 60)
+
+
+class TestSkipUnchangedRaw(TestCase):
+    def _orchestrator(self, erp_data):
+        source = MagicMock()
+        source.iter_fingerprinted.side_effect = lambda: ((raw, fingerprint_raw(raw)) for raw in erp_data)
+        return SyncOrchestrator(source=source, client=EshopClient(), skip_unchanged_raw=True)
+
+    def _mock_api(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=201)
+        responses.add(responses.PATCH, f"{ESHOP_BASE_URL}/products/SKU-001/", json={}, status=200)
+
+    @responses.activate
+    def test_unchanged_raw_records_skip_transform(self):
+        self._mock_api()
+        with patch('integrator.ratelimit.time.sleep'):
+            self._orchestrator(_erp_data()).run()
+            with patch('integrator.sync.prepare_products', wraps=prepare_products) as prepare:
+                result = self._orchestrator(_erp_data()).run()
+
+        # Invalid records never get a state row, so only they are re-validated
+        [(processed,), _] = prepare.call_args
+        self.assertEqual([raw['id'] for raw in processed], ["SKU-002", "SKU-004"])
+        self.assertEqual(result['skipped_unchanged'], 4)
+        self.assertEqual(result['skipped_invalid'], 2)
+        self.assertEqual(result['synced'], 0)
+
+    @responses.activate
+    def test_changed_raw_record_is_processed_and_sent(self):
+        self._mock_api()
+        erp_data = _erp_data()
+        with patch('integrator.ratelimit.time.sleep'):
+            self._orchestrator(erp_data).run()
+            erp_data[0] = {**erp_data[0], "price_vat_excl": 13000.0}
+            result = self._orchestrator(erp_data).run()
+
+        self.assertEqual(result['synced'], 1)
+        self.assertEqual(result['skipped_unchanged'], 3)
+        state = ProductSyncState.objects.get(sku="SKU-001")
+        self.assertEqual(bytes(state.raw_hash), fingerprint_raw(erp_data[0]))
+
+    @responses.activate
+    def test_payload_neutral_change_refreshes_raw_hash(self):
+        self._mock_api()
+        erp_data = _erp_data()
+        with patch('integrator.ratelimit.time.sleep'):
+            self._orchestrator(erp_data).run()
+            # Extra field that transform_product ignores
+            erp_data[0] = {**erp_data[0], "weight_kg": 4}
+            result = self._orchestrator(erp_data).run()
+
+        self.assertEqual(result['synced'], 0)
+        self.assertEqual(result['skipped_unchanged'], 4)
+        state = ProductSyncState.objects.get(sku="SKU-001")
+        self.assertEqual(bytes(state.raw_hash), fingerprint_raw(erp_data[0]))
+
+
+class TestSourceUnchanged(TestCase):
+    def test_unchanged_source_skips_everything(self):
+        source = MagicMock()
+        source.fingerprint.return_value = "abc"
+        source.last_processed.return_value = processed_marker("abc")
+        orchestrator = SyncOrchestrator(source=source, client=EshopClient())
+
+        with self.assertNumQueries(0):
+            result = orchestrator.run()
+
+        self.assertTrue(result['source_unchanged'])
+        source.iter_products.assert_not_called()
+
+    @responses.activate
+    def test_failed_run_not_marked_processed(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=500)
+        orchestrator = _make_orchestrator(_erp_data())
+        orchestrator.source.fingerprint.return_value = "new"
+        orchestrator.source.last_processed.return_value = "old"
+
+        with patch('integrator.ratelimit.time.sleep'):
+            result = orchestrator.run()
+
+        self.assertGreater(result['errors'], 0)
+        orchestrator.source.mark_processed.assert_not_called()
+
+    @responses.activate
+    def test_clean_run_marked_processed(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=201)
+        orchestrator = _make_orchestrator(_erp_data())
+        orchestrator.source.fingerprint.return_value = "new"
+        orchestrator.source.last_processed.return_value = "old"
+
+        with patch('integrator.ratelimit.time.sleep'):
+            orchestrator.run()
+
+        orchestrator.source.mark_processed.assert_called_once_with(processed_marker("new"))
+
+    @responses.activate
+    def test_hash_version_bump_resyncs_unchanged_export(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=201)
+        orchestrator = _make_orchestrator(_erp_data())
+        orchestrator.source.fingerprint.return_value = "abc"
+        orchestrator.source.last_processed.return_value = processed_marker("abc")
+
+        with patch('integrator.sync.HASH_VERSION', 99), patch('integrator.ratelimit.time.sleep'):
+            result = orchestrator.run()
+
+        self.assertFalse(result['source_unchanged'])
+        self.assertEqual(result['synced'], 4)
+        orchestrator.source.mark_processed.assert_called_once_with("abc:v99")
+
+
+class TestShardedSync(TestCase):
+    @responses.activate
+    def test_shards_partition_the_catalog(self):
+        responses.add(responses.POST, f"{ESHOP_BASE_URL}/products/", json={}, status=201)
+
+        results = []
+        with patch('integrator.ratelimit.time.sleep'):
+            for index in range(3):
+                source = MagicMock()
+                source.iter_products.side_effect = lambda: iter(_erp_data())
+                orchestrator = SyncOrchestrator(source=source, client=EshopClient(), shard=(index, 3))
+                results.append(orchestrator.run())
+
+        # Every SKU is handled by exactly one shard
+        merged = merge_stats(results)
+        self.assertEqual(merged['synced'], 4)
+        self.assertEqual(merged['skipped_invalid'], 2)
+        self.assertEqual(ProductSyncState.objects.count(), 4)
+        for index, stats in enumerate(results):
+            skus = {p['id'] for p in _erp_data() if shard_of(p['id'], 3) == index}
+            self.assertLessEqual(stats['synced'] + stats['skipped_invalid'], len(skus))
+            # Each shard gets its share of the global rate limit
+            self.assertLessEqual(stats['rate_limit'], 5 / 3 + 0.01)
+
+    def test_shard_skips_source_fingerprint(self):
+        source = MagicMock()
+        source.iter_products.side_effect = lambda: iter([])
+        SyncOrchestrator(source=source, client=EshopClient(), shard=(0, 2)).run()
+        source.fingerprint.assert_not_called()
+        source.mark_processed.assert_not_called()
+
+    def test_merge_stats(self):
+        merged = merge_stats([
+            {'synced': 2, 'errors': 0, 'source_unchanged': False, 'rate_limit': 2.5},
+            {'synced': 3, 'errors': 1, 'source_unchanged': False, 'rate_limit': 2.5},
+        ])
+        self.assertEqual(merged, {'synced': 5, 'errors': 1, 'source_unchanged': False, 'rate_limit': 5.0})
+
+
+_worker_dir = None
+
+
+def _slow_prepare(records):
+    # Leaves a mark per worker process and is slow enough to tell parallel from serial
+    Path(_worker_dir, str(os.getpid())).touch()
+    time.sleep(0.3)
+    return prepare_products(records)
+
+
+def _prepare_in_daemon(records, worker_dir, queue):
+    # Like a task in a Celery prefork child: a daemonic process
+    global _worker_dir
+    _worker_dir = worker_dir
+    orchestrator = SyncOrchestrator(source=MagicMock(), client=EshopClient(), prepare_workers=4)
+    orchestrator.prepare_chunk = _slow_prepare
+    started = time.monotonic()
+    with patch('integrator.sync.PREPARE_CHUNK_SIZE', 100):
+        products = orchestrator._prepare(records)
+    queue.put((multiprocessing.current_process().daemon, len(products), time.monotonic() - started))
+
+
+class TestPrepareWorkers(TestCase):
+    def _records(self):
+        records = []
+        for i in range(2500):
+            raw = {"id": f"SKU-{i % 2000:05d}", "title": f"Produkt {i}", "price_vat_excl": i,
+                   "stocks": {"praha": i % 7}, "attributes": {}}
+            records.append((raw, fingerprint_raw(raw)))
+        records.append(({"id": "SKU-BAD", "price_vat_excl": None, "stocks": {}}, b''))
+        return records
+
+    def test_pool_matches_in_process(self):
+        records = self._records()
+        # Last occurrence of SKU-00010 is byte-identical to the stored one
+        states = {"SKU-00010": (b'', records[2010][1])}
+
+        with patch('integrator.sync.PREPARE_CHUNK_SIZE', 300):
+            serial = _make_orchestrator([])._prepare(records, states)
+            pooled = SyncOrchestrator(
+                source=MagicMock(), client=EshopClient(), prepare_workers=2,
+            )._prepare(records, states)
+
+        self.assertEqual(pooled, serial)
+        self.assertEqual(len(pooled), 2001)
+        self.assertIs(pooled["SKU-00010"], UNCHANGED)
+        # Later duplicates win
+        self.assertEqual(pooled["SKU-00011"][0]['title'], "Produkt 2011")
+        self.assertIsInstance(pooled["SKU-BAD"], str)
+
+    def test_pool_runs_in_parallel_under_daemonic_parent(self):
+        records = [(raw, None) for raw, _ in self._records()[:1200]]
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        with tempfile.TemporaryDirectory() as worker_dir:
+            process = context.Process(target=_prepare_in_daemon, args=(records, worker_dir, queue), daemon=True)
+            process.start()
+            daemon, count, seconds = queue.get(timeout=30)
+            process.join()
+            workers = set(os.listdir(worker_dir))
+
+        self.assertTrue(daemon)
+        self.assertEqual(count, 1200)
+        self.assertGreaterEqual(len(workers), 2)
+        self.assertNotIn(str(process.pid), workers)
+        # Twelve chunks of 0.3 s take 3.6 s in-process; four workers need a
+        # quarter of that plus about a second of pool shutdown
+        self.assertLess(seconds, 3.0)
+
+
+class TestTwoPassDedup(TestCase):
+    def _records(self):
+        records = []
+        for i in range(2500):
+            raw = {"id": f"SKU-{i % 2000:05d}", "title": f"Produkt {i}", "price_vat_excl": i,
+                   "stocks": {"praha": i % 7}, "attributes": {}}
+            records.append(raw)
+        records.append({"id": "SKU-00001", "price_vat_excl": None, "stocks": {}})
+        return records
+
+    def test_matches_inline_dedup(self):
+        records = self._records()
+        inline = _make_orchestrator(records)
+        expected = inline._prepare(inline._records((raw, None) for raw in records))
+        for mode in ('two-pass', 'spill'):
+            with self.subTest(mode=mode), patch('integrator.sync.prepare_products', wraps=prepare_products) as prep:
+                orchestrator = _make_orchestrator(records)
+                orchestrator.dedup = mode
+                orchestrator.prepare_chunk = prep
+                result = orchestrator._prepare(orchestrator._records((raw, None) for raw in records))
+                self.assertEqual(result, expected)
+                # Duplicates never reach validate/transform/hash
+                self.assertEqual(sum(len(call.args[0]) for call in prep.call_args_list), 2000)
+        self.assertIsInstance(expected["SKU-00001"], str)
+        self.assertEqual(expected["SKU-00011"][0].title, "Produkt 2011")
+
+    @responses.activate
+    def test_source_changed_between_passes(self):
+        orchestrator = _make_orchestrator(self._records())
+        orchestrator.dedup = 'two-pass'
+        orchestrator.source.fingerprint.side_effect = ['before', 'before', 'after']
+
+        with self.assertRaisesRegex(ValueError, 'changed between the two dedup passes'):
+            orchestrator.run(force=True)
+        self.assertEqual(len(responses.calls), 0)
+        self.assertFalse(ProductSyncState.objects.exists())
+
+    def test_unknown_mode_rejected(self):
+        with self.assertRaises(ValueError):
+            SyncOrchestrator(source=MagicMock(), client=EshopClient(), dedup='sorted')
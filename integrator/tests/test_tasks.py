@@ -5,8 +5,12 @@ import tempfile
 import responses
 from unittest.mock import patch, MagicMock
 
+from celery.backends.cache import CacheBackend
 from django.test import TestCase
 
+from core.celery import app
+from integrator.lease import Lease
+from integrator.models import SyncLease, SyncRun
 from integrator.tasks import (
     load_erp_data,
     validate_product,
@@ -14,7 +18,9 @@ from integrator.tasks import (
     deduplicate,
     compute_hash,
     send_to_eshop,
+    sync_product_shard,
     sync_products,
+    _release,
     ESHOP_BASE_URL,
 )
 
@@ -91,8 +97,128 @@ class TestSyncProductsTask(TestCase):
              "stocks": {"a": 1}, "attributes": {}},
         ]
 
-        with patch('integrator.sources.json_source.JsonFileSource.load', return_value=erp_data):
-            with patch('integrator.sync.time.sleep'):
-                result = sync_products()
+        with tempfile.TemporaryDirectory() as state_dir, \
+                patch('integrator.sources.json_source.STATE_DIR', state_dir), \
+                patch('integrator.sources.json_source.JsonFileSource.iter_products',
+                      side_effect=lambda: iter(erp_data)), \
+                patch('integrator.ratelimit.time.sleep'):
+            result = sync_products()
+            self.assertEqual(result['synced'], 1)
+
+            # Same export again: skipped without parsing
+            result = sync_products()
+            self.assertTrue(result['source_unchanged'])
+            self.assertEqual(result['synced'], 0)
+
+            result = sync_products(force=True)
+            self.assertFalse(result['source_unchanged'])
+            self.assertEqual(result['skipped_unchanged'], 1)
+
+        runs = list(SyncRun.objects.order_by('pk'))
+        self.assertEqual([r.status for r in runs], ['ok', 'unchanged', 'ok'])
+        self.assertEqual((runs[0].synced, runs[0].requests), (1, 1))
+        self.assertIn('send', runs[0].stages)
+        self.assertTrue(runs[2].force)
 
-        self.assertEqual(result['synced'], 1)
+    @responses.activate
+    def test_sharded_sync_fans_out_and_merges(self):
+        responses.add(
+            responses.POST,
+            f"{ESHOP_BASE_URL}/products/",
+            json={"status": "created"},
+            status=201,
+        )
+
+        erp_data = [
+            {"id": f"SKU-{i:03d}", "title": "Test", "price_vat_excl": 100,
+             "stocks": {"a": 1}, "attributes": {}}
+            for i in range(10)
+        ]
+
+        with tempfile.TemporaryDirectory() as state_dir, \
+                patch('integrator.sources.json_source.STATE_DIR', state_dir), \
+                patch('integrator.sources.json_source.JsonFileSource.iter_products',
+                      side_effect=lambda: iter(erp_data)), \
+                patch('integrator.ratelimit.time.sleep'), \
+                patch.object(app, '_backend_cache', CacheBackend(app=app, backend='memory')):
+            result = sync_products.apply(kwargs={'shards': 3}).get()
+            self.assertEqual(result['synced'], 10)
+            self.assertEqual(len(responses.calls), 10)
+
+            # The fan-out task checks the export fingerprint once, before any shard runs
+            result = sync_products.apply(kwargs={'shards': 3}).get()
+            self.assertTrue(result['source_unchanged'])
+
+        sharded, unchanged = SyncRun.objects.order_by('pk')
+        self.assertEqual((sharded.status, sharded.shards, sharded.synced), ('ok', 3, 10))
+        self.assertEqual(sharded.requests, 10)
+        self.assertTrue(sharded.task_id)
+        self.assertEqual(unchanged.status, 'unchanged')
+
+    def test_failed_shard_fails_run_and_releases_lease(self):
+        with tempfile.TemporaryDirectory() as state_dir, \
+                patch('integrator.sources.json_source.STATE_DIR', state_dir), \
+                patch.object(sync_products, 'replace') as replace:
+            sync_products.apply(kwargs={'shards': 2})
+        self.assertTrue(SyncLease.objects.exists())
+
+        # What Celery does when a chord header task fails: call the body's errbacks
+        workflow = replace.call_args.args[0]
+        for errback in workflow.body.options['link_error']:
+            app.signature(errback)(None, RuntimeError("shard died"), None)
+
+        run = SyncRun.objects.get()
+        self.assertEqual(run.status, 'failed')
+        self.assertEqual(run.error_message, "RuntimeError: shard died")
+        self.assertFalse(SyncLease.objects.exists())
+
+    def test_shard_refuses_expired_lease(self):
+        # The fan-out's lease expired while the shard was queued and is gone
+        with patch('integrator.tasks.SyncOrchestrator') as orchestrator:
+            with self.assertRaisesRegex(RuntimeError, 'expired before shard 1 started'):
+                sync_product_shard(1, 2, lease='expired-owner')
+        orchestrator.return_value.run.assert_not_called()
+
+    def test_failed_run_recorded(self):
+        with patch('integrator.tasks.SyncOrchestrator') as orchestrator:
+            orchestrator.return_value.run.side_effect = RuntimeError("ERP unreachable")
+            with self.assertRaises(RuntimeError):
+                sync_products()
+        run = SyncRun.objects.get()
+        self.assertEqual(run.status, 'failed')
+        self.assertEqual(run.error_message, "RuntimeError: ERP unreachable")
+        self.assertIsNotNone(run.finished_at)
+
+
+class TestSyncProductsOverlap(TestCase):
+    def setUp(self):
+        Lease(owner='running-sync').acquire()
+
+    def test_overlapping_trigger_coalesces_into_follow_up(self):
+        with patch('integrator.tasks.SyncOrchestrator') as orchestrator:
+            result = sync_products(force=True)
+        orchestrator.assert_not_called()
+        self.assertTrue(result['skipped_overlap'])
+        self.assertTrue(result['coalesced'])
+
+        # The running sync starts exactly one follow-up when it finishes
+        with patch.object(sync_products, 'apply_async') as apply_async:
+            _release(Lease(owner='running-sync'))
+        apply_async.assert_called_once_with(kwargs={'force': True})
+
+    def test_overlapping_trigger_skipped(self):
+        with patch('integrator.tasks.OVERLAP', 'skip'), \
+                patch('integrator.tasks.SyncOrchestrator') as orchestrator:
+            result = sync_products()
+        orchestrator.assert_not_called()
+        self.assertTrue(result['skipped_overlap'])
+        self.assertFalse(result['coalesced'])
+        self.assertFalse(SyncLease.objects.get().rerun)
+        self.assertEqual(SyncRun.objects.get().status, 'skipped')
+
+    def test_lease_released_after_run(self):
+        SyncLease.objects.all().delete()
+        with patch('integrator.tasks.SyncOrchestrator') as orchestrator:
+            orchestrator.return_value.run.return_value = {'synced': 0}
+            sync_products()
+        self.assertFalse(SyncLease.objects.exists())
@@ -1,6 +1,22 @@
+import json
+import pickle
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
-from integrator.transforms import validate_product, transform_product, deduplicate, compute_hash
+from integrator.transforms import (
+    DIGEST_SIZE,
+    HASH_VERSION,
+    Payload,
+    compute_digest,
+    compute_digests,
+    compute_hash,
+    deduplicate,
+    prepare_products,
+    transform_product,
+    validate_product,
+)
 
 
 def _valid_raw_product():
@@ -139,3 +155,88 @@ class TestHash(TestCase):
         p1 = {"a": 1, "b": 2}
         p2 = {"b": 2, "a": 1}
         self.assertEqual(compute_hash(p1), compute_hash(p2))
+
+    def test_legacy_sha256(self):
+        # compute_hash keeps its original 64-character SHA-256 output
+        self.assertEqual(
+            compute_hash({"b": 2, "a": 1}),
+            "d8497d9d82770a70729261095aa98f7ef5154d7af499f8037b6ca250296785a6",
+        )
+
+
+class TestDigest(TestCase):
+    def _payload(self, **overrides):
+        payload = {"sku": "SKU-001", "title": "Kávovar", "price": 15004.61, "stock": 8, "color": "N/A"}
+        payload.update(overrides)
+        return payload
+
+    def test_digest_is_versioned_16_bytes(self):
+        digest = compute_digest(self._payload())
+        self.assertEqual(len(digest), DIGEST_SIZE)
+        self.assertEqual(digest[0], HASH_VERSION)
+
+    def test_digest_is_stable_across_runs(self):
+        # Pinned value: changing the scheme must come with a HASH_VERSION bump
+        self.assertEqual(compute_digest(self._payload()).hex(), "02b0020ff6ab76e42d1e4e919c2b4b14")
+
+    def test_known_schema_ignores_key_order(self):
+        payload = self._payload()
+        reordered = dict(reversed(list(payload.items())))
+        self.assertEqual(compute_digest(payload), compute_digest(reordered))
+
+    def test_value_types_are_distinguished(self):
+        self.assertNotEqual(compute_digest(self._payload(price=100)), compute_digest(self._payload(price=100.0)))
+
+    def test_unknown_schema_falls_back_to_canonical_json(self):
+        self.assertEqual(compute_digest({"a": 1, "b": 2}), compute_digest({"b": 2, "a": 1}))
+
+    def test_batched_matches_single(self):
+        payloads = [self._payload(sku=f"SKU-{i}", stock=i) for i in range(5)] + [{"x": 1}]
+        self.assertEqual(compute_digests(payloads), [compute_digest(p) for p in payloads])
+
+
+class TestPrepareProducts(TestCase):
+    def test_returns_payload_and_digest_or_reason(self):
+        results = prepare_products(_erp_data()[:4])
+
+        self.assertEqual([sku for sku, _, _ in results], ["SKU-001", "SKU-002", "SKU-003", "SKU-004"])
+        sku, payload, digest = results[0]
+        self.assertEqual(payload, transform_product(_erp_data()[0]))
+        self.assertEqual(digest, compute_digest(payload))
+        self.assertIsNone(results[1][1])
+        self.assertIn("negative price", results[1][2])
+
+
+class TestPayloadRecord(TestCase):
+    def _payload(self):
+        return Payload(sku="SKU-001", title="Kávovar", price=15004.61, stock=8, color="stříbrná")
+
+    def test_is_slotted(self):
+        payload = self._payload()
+        self.assertFalse(hasattr(payload, '__dict__'))
+        with self.assertRaises(AttributeError):
+            payload.extra = 1
+
+    def test_reads_like_the_dict_payload(self):
+        payload = self._payload()
+        as_dict = {"sku": "SKU-001", "title": "Kávovar", "price": 15004.61, "stock": 8, "color": "stříbrná"}
+        self.assertEqual(payload['sku'], "SKU-001")
+        self.assertEqual(payload, as_dict)
+        self.assertEqual(as_dict, payload)
+        self.assertEqual(compute_digest(payload), compute_digest(as_dict))
+        with self.assertRaises(KeyError):
+            payload['body']
+
+    def test_survives_pickling_with_body(self):
+        payload = self._payload()
+        compute_digest(payload)
+        restored = pickle.loads(pickle.dumps(payload))
+        self.assertEqual(restored, payload)
+        self.assertEqual(restored.body, payload.body)
+
+    def test_bench_command_reports_both_kinds(self):
+        out = StringIO()
+        call_command('bench_records', '--products', '200', '--json', stdout=out)
+        results = {r['kind']: r for r in json.loads(out.getvalue())['results']}
+        self.assertEqual(set(results), {'dict', 'slotted'})
+        self.assertEqual(results['slotted']['products'], 200)